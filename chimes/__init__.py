@@ -28,8 +28,9 @@ from ._chm_get import get_available_operators
 from ._chm_get import get_model_documentation
 from ._chm_get import get_available_saves
 from ._chm_get import create_models_readme
-from ._toolbox import generate_dic_distribution, load_saved
-from ._core import Hub
+from ._toolbox import generate_dic_distribution, load_saved, load_saved_fields
+from ._parallel import run_many
+from ._core import Hub, HubTemplate
 # from . import _plots as _plots
 from ._plot_class import Plots
 
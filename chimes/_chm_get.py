@@ -3,9 +3,6 @@ Regroup all get functions in one file.
 Those are the functions that are used to get information about the library in general. They do not modify it
 '''
 
-from IPython.display import Markdown  # display, HTML,
-from IPython.display import display
-import ipywidgets as widgets
 import inspect
 import pandas as pd
 import cloudpickle
@@ -14,8 +11,8 @@ import glob
 
 from ._core import Hub
 from ._plot_class import Plots
-from .libraries import _get_DMODEL, Funcs, Operators
-from ._core_functions import _utils
+from .libraries import _get_DMODEL, _get_model_index, Funcs, Operators
+from ._core_functions import _utils, _save_method
 from ._toolbox import _printsubgroupe
 
 from .libraries import _DFIELDS
@@ -50,7 +47,7 @@ def get_available_config() -> pd.DataFrame:
 def get_available_saves(path='local',
                         returnas=True):
     """
-    Retrieves all chimes saved runs (.chm) files in a specified folder. display them as a list, dictionary or dataframe.
+    Retrieves all chimes saved runs (.chm and .npz) files in a specified folder. display them as a list, dictionary or dataframe.
     the function uses the default folder of CHIMES. you can change it with path.
 
     Parameters
@@ -85,7 +82,7 @@ def get_available_saves(path='local',
 
     content = os.listdir(path)
 
-    files = [f for f in content if f.endswith('.chm')]
+    files = [f for f in content if f.endswith('.chm') or f.endswith('.npz')]
 
     if returnas is list:
         return files
@@ -93,6 +90,11 @@ def get_available_saves(path='local',
         dic = {}
         for f in files:
             try:
+                if f.endswith('.npz'):
+                    manifest = _save_method._read_npz_manifest(os.path.join(path, f))
+                    dic[f] = {'model': manifest['model'],
+                              'description': manifest['description']}
+                    continue
                 with open(os.path.join(path, f), 'rb') as r:
                     file = cloudpickle.load(r)
                     dic[f] = {'model': file['hub'].dmodel['name'],
@@ -221,7 +223,8 @@ def get_available_models(
         returns a dictionary of models and their properties. If any other value, the function returns a DataFrame 
         representation of the dictionary. Default is True.
     FULL : bool, optional
-        Whether to return all properties of the models. If True, the function returns all properties. Default is False.
+        Whether to return all properties of the models (including their logics). If True, all model files are executed,
+        otherwise only the model index is used, see Notes. Default is False.
     hide_underscore : bool, optional
         Whether to exclude models with names like _model__NAME.py. If True, the function excludes these models. 
         Default is True.
@@ -231,6 +234,12 @@ def get_available_models(
     models : list or dict or pandas.DataFrame
         The models and their properties, in the specified format.
 
+    Notes
+    -----
+    Without FULL, the descriptions, presets and keywords come from an index that is built without executing the model files,
+    and cached with the modification time of each file (in memory, and in the file of the `_MODEL_INDEX` config key if one is set).
+    Model files are only executed when a Hub is created.
+
     Author
     ------
     Paul Valcke
@@ -243,7 +252,7 @@ def get_available_models(
     model_name_convention = config.get_current('_MODEL_NAME_CONVENTION')
     _LOCAL_MODEL = config.get_current('_LOCAL_MODEL')
     # Load the "models dictionnary"
-    _DMODEL = _get_DMODEL()
+    _DMODEL = _get_DMODEL() if FULL else _get_model_index()
 
     # Tranform input into machine-friendly
     model = sorted(_DMODEL.keys())
@@ -340,7 +349,17 @@ def get_available_operators() -> pd.DataFrame:
     ----
     2023
     """
-    dict = {F[0]: {'documentation': F[1].__doc__, 'function': inspect.getsource(F[1]).split('return')[1][:-1]} for F in inspect.getmembers(Operators) if '__' not in F[0]}
+    lmembers = []
+    for name, F in inspect.getmembers(Operators):
+        if '__' in name:
+            continue
+        if inspect.isclass(F):
+            # Family of operators, such as Grid
+            lmembers += [(f'{name}.{k}', f) for k, f in vars(F).items() if inspect.isfunction(f) and k[0] != '_'
+                         and k not in ['todict']]
+        else:
+            lmembers.append((name, F))
+    dict = {k: {'documentation': F.__doc__, 'function': inspect.getsource(F).split('return')[-1][:-1]} for k, F in lmembers}
     return pd.DataFrame(dict).transpose()
 
 
@@ -428,7 +447,7 @@ def create_models_readme(model: str = 'all',
             except Exception as e:
                 print(f'Error removing file {file_path}: {e}')  
 
-    df = get_available_models(FULL=True)
+    df = pd.DataFrame(_get_model_index()).transpose()
     modellist = list(get_available_models(Return=list))
     if model == 'all':
         models = modellist
@@ -444,7 +463,7 @@ def get_model_documentation(model: str) -> None:
     Gives the Markdown description located in the model file
     '''
 
-    df = get_available_models(FULL=True)
+    df = pd.DataFrame(_get_model_index()).transpose()
     try:
         mess = '## Model: ' + df.loc[model].loc['name']
     except BaseException as E:
@@ -454,6 +473,9 @@ Available models are {modellist}."""
         print(msg)
         raise Exception(msg)
 
+    from IPython.display import Markdown, display
+    import ipywidgets as widgets
+
     hub0 = Hub(model, verb=False)
     f = widgets.Output()
     with f:
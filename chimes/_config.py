@@ -71,13 +71,17 @@ _DEFAULT_CONFIG = dict(
         default=['differential', 'statevar', 'parameter', 'size'],
     ),
     _SOLVER=dict(  # PASSED
-        definition='Solver used for time resolution',
+        definition="Solver used for time resolution ('rk1', 'rk4', 'rk4-flat', 'dopri5' or 'rk4-jit')",
         default='rk4',
     ),
     _LEXTRAKEYS=dict(  # PASSED
         definition='Added properties that can be found in dfields',
         default=['func', 'kargs', 'args', 'initial', 'source_exp', 'isneeded', 'analysis', 'size'],
     ),
+    _MODEL_INDEX=dict(
+        definition='File in which the model index (descriptions, presets, keywords) is kept between sessions. None to keep it in memory only',
+        default=None,
+    ),
     _LOCAL_MODEL=dict(  # PASSED
         definition='Path toward your local models not from the library',
         default=None,
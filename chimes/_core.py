@@ -1,5 +1,7 @@
 import types
 
+import numpy as np
+
 # Library-specific
 # from ._plots._plots import _DPLOT
 from ._core_functions import _hub_set
@@ -106,7 +108,9 @@ class Hub(setM, getM, calculateM, saveM):
         # Contains miscellaneous, static practical informations
         self._dmisc = {'dmulti': {},   # Which variables has been imposed as multiple, and what size
                        'dfunc_order': {},   # Order in which fields are solved. Often used to get the field list
-                       'model': model}      # Name of the model file
+                       'model': model,      # Name of the model file
+                       'storage': None,     # Folder of the memory-mapped time series (None: in RAM)
+                       'record': None}      # Recorded fields and steps of the last run (None: everything)
 
         # ## LOADING MODEL FILE ###############################################
         OUT = _hub_set.load_model(
@@ -176,6 +180,10 @@ class Hub(setM, getM, calculateM, saveM):
     def dfields(self):
         return self.get_dfields(returnas=dict, verb=False)
 
+    @property
+    def dfields_view(self):
+        return self.get_dfields(returnas='view', verb=False)
+
     @property
     def dmisc(self):
         return self._dmisc
@@ -192,6 +200,20 @@ class Hub(setM, getM, calculateM, saveM):
         self._short()
         return ''
 
+    def __getstate__(self):
+        '''
+        State for pickle and copy.deepcopy: a hub stored on disk (see `set_storage`) gives its time series in RAM
+        and no storage folder, so that the new hub never writes in the files of this one
+        '''
+        if self._dmisc.get('storage') is None:
+            return self.__dict__
+        state = dict(self.__dict__)
+        state['_dmisc'] = dict(self._dmisc, storage=None)
+        state['_dfields'] = {k: dict(v, value=np.array(v['value'])) if isinstance(v.get('value'), np.memmap) else v
+                             for k, v in self._dfields.items()}
+        state['_dargs'] = _hub_set.get_dargs_by_reference(state['_dfields'], self._dmisc['dfunc_order'])
+        return state
+
     # ##############################
     #       plotting methods
     # ##############################
@@ -269,3 +291,60 @@ class Hub(setM, getM, calculateM, saveM):
             returnFig=returnFig)
         if returnFig:
             return F
+
+
+class HubTemplate():
+    """
+    A model loaded once, from which new hubs are made without loading the model file again.
+
+    The template keeps a hub that is never run, with the default values of the model. Each new hub is a copy
+    of it (see `Hub.copy`), on which a preset and fields are then set.
+
+    Parameters
+    ----------
+    model : str
+        The name of the model file.
+    dpresets : dict of dict of dict, optional
+        A dictionary of presets that replaces the ones of the model file (see `Hub.set_dpreset`).
+    verb : bool, optional
+        Verbosity when the model is loaded. Default is False.
+
+    Examples
+    --------
+        template = chm.HubTemplate('GK')
+        hubs = [template.new(alpha=alpha) for alpha in [0.02, 0.025, 0.03]]
+        hub = template.new(preset='default')
+    """
+
+    def __init__(self, model: str, dpresets: dict = None, verb: bool = False):
+        self.hub = Hub(model, dpresets=dpresets, verb=verb)
+
+    def __repr__(self):
+        return f"HubTemplate('{self.hub.dmisc['model']}')"
+
+    def new(self, preset: str = None, verb: bool = False, **fields) -> Hub:
+        """
+        A new hub of the model, with a preset and fields (given to `set_fields`) applied.
+
+        Parameters
+        ----------
+        preset : str, optional
+            The name of the preset to apply. Default is None.
+        verb : bool, optional
+            Verbosity of `set_preset` and `set_fields`. Default is False.
+        **fields : dict
+            Values given to `set_fields`.
+
+        Returns
+        -------
+        Hub
+            A new hub, independent from the template and from the other hubs.
+        """
+        hub = self.hub.copy()
+        if preset is not None:
+            hub.set_preset(preset, verb=verb)
+        if len(fields):
+            hub.set_fields(**fields, verb=verb)
+        return hub
+
+    __call__ = new
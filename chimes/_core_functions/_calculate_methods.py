@@ -1,12 +1,16 @@
+import time
+
 import numpy as np
 from .._core_functions._distribution_generator import generate_dic_distribution as _generate_dic_distribution
 from .._config import config  # _SOLVER
 from .._core_functions import _solvers
 from .._core_functions import _hub_check
-from ..plots.compare_hubs import compare_hubs
+from .._core_functions import _hub_set
+from .._core_functions._ensemble import EnsembleStats
 from typing import Union
 
-import copy
+# Approximate number of recorded steps of a `stats` run without record_every
+_NSTATS = 500
 
 """
 This file contains the methods to do calculations on the Hub object.
@@ -21,11 +25,224 @@ Updated January 2024
 """
 
 
-def _cn(y, n):
+def _cycles(value, vref, time, n=10):
+    '''
+    Cycles of each column of `value` (nt, nx, nr, a, b), a cycle going from a local maximum of `vref` (same shape)
+    to the next one. All the columns are processed at once: the extrema are detected on the whole array, the values of
+    all the cycles are gathered in one flat array on which the statistics are segment reductions (`np.ufunc.reduceat`),
+    and the harmonics are the `np.fft.rfft` of each cycle resampled on `max(64, 2n)` points.
+
+    Returns a dict of arrays with the cycles on the first axis, (ncycles max, nx, nr, a, b), padded with NaN
+    (-1 for the indexes) after the last cycle of each column, whose number of cycles is in 'ncycles' (nx, nr, a, b).
+    '''
+    nt = np.shape(value)[0]
+    shape = np.shape(value)[1:]
+    V = np.reshape(value, (nt, -1))
+    Vr = np.reshape(vref, (nt, -1))
+    M = V.shape[1]
+
+    # Local maxima of each column, between the second and the third to last time step
+    mask = (Vr[1:nt - 2] > Vr[:nt - 3]) & (Vr[1:nt - 2] > Vr[2:nt - 1])
+    col, row = np.nonzero(mask.T)
+    row = row + 1
+    # A cycle goes from a maximum to the next one in the same column, both included
+    keep = col[:-1] == col[1:]
+    start, end, col = row[:-1][keep], row[1:][keep] + 1, col[:-1][keep]
+    nc = len(col)
+    ncycles = np.bincount(col, minlength=M)
+    rank = np.arange(nc) - (np.cumsum(ncycles) - ncycles)[col]
+    ncmax = int(ncycles.max()) if M else 0
+
+    # Values of all the cycles one after the other
+    L = end - start
+    offsets = np.cumsum(L) - L
+    seg = np.repeat(np.arange(nc), L)
+    G = V[np.arange(np.sum(L)) - offsets[seg] + start[seg], col[seg]]
+
+    dout = {}
+    if nc:
+        meanval = np.add.reduceat(G, offsets) / L
+        nnan = np.add.reduceat(np.isnan(G), offsets)
+        Gs = G[np.lexsort((G, seg))]
+        medval = 0.5 * (Gs[offsets + (L - 1) // 2] + Gs[offsets + L // 2])
+        medval[nnan > 0] = np.nan
+
+        # Harmonics on each cycle, resampled with a linear interpolation
+        nres = max(64, 2 * n)
+        u = np.arange(nres)[np.newaxis, :] / nres * (L[:, np.newaxis] - 1)
+        base = np.floor(u).astype(int)
+        frac = u - base
+        idx = offsets[:, np.newaxis] + base
+        Y = G[idx] * (1 - frac) + G[np.minimum(idx + 1, len(G) - 1)] * frac
+        C = np.abs(np.fft.rfft(Y, axis=1)[:, :n]) / nres
+
+        dout = {'meanval': meanval,
+                'medval': medval,
+                'stdval': np.sqrt(np.add.reduceat((G - meanval[seg])**2, offsets) / L),
+                'minval': np.minimum.reduceat(G, offsets),
+                'maxval': np.maximum.reduceat(G, offsets),
+                'Coeffs': C[:, 1:] / C[:, 1:2],
+                'Harmonicity': np.sum(C[:, 1:]**2, axis=1) / np.sum(C**2, axis=1)}
+        t0, t1 = time[start], time[end - 1]
+        dout.update({'period_T_intervals': np.stack([t0, t1], axis=-1),
+                     't_mean_cycle': (t0 + t1) / 2,
+                     'period_T': t1 - t0,
+                     'frequency': 1 / (t1 - t0)})
+
+    # Cycles of each column on the first axis
+    cycles = {'ncycles': ncycles.reshape(shape)}
+    period_indexes = np.full((ncmax, M, 2), -1)
+    period_indexes[rank, col] = np.stack([start, end], axis=-1)
+    cycles['period_indexes'] = period_indexes.reshape((ncmax,) + shape + (2,))
+    for k in ['period_T_intervals', 't_mean_cycle', 'period_T', 'frequency',
+              'meanval', 'medval', 'stdval', 'minval', 'maxval', 'Harmonicity', 'Coeffs']:
+        extra = {'period_T_intervals': (2,), 'Coeffs': (max(n - 1, 0),)}.get(k, ())
+        out = np.full((ncmax, M) + extra, np.nan)
+        if nc:
+            out[rank, col] = dout[k]
+        cycles[k] = out.reshape((ncmax,) + shape + extra)
+    return cycles
+
+
+class _Cycles(dict):
+    '''
+    Cycles of a field, as given by `_cycles` with its 'reference'.
+    An integer index gives the cycles of one trajectory (flattened (nx, nr, a, b) axes) as a dict of lists,
+    and `bykey` all of them, as 'cycles' and 'cycles_bykey' were before the cycles were arrays.
+    '''
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._trajectory(key)
+        return super().__getitem__(key)
+
+    def _trajectory(self, ii):
+        ndim = np.ndim(super().__getitem__('ncycles'))
+        ncycles = np.ravel(super().__getitem__('ncycles'))
+        out = {'reference': super().__getitem__('reference')}
+        for k, v in self.items():
+            if k not in ['reference', 'ncycles']:
+                v = np.reshape(v, (v.shape[0], len(ncycles)) + v.shape[1 + ndim:])[:ncycles[ii], ii]
+                out[k] = v.tolist() if k in ['period_indexes', 'period_T_intervals'] else list(v)
+        return out
+
+    def bykey(self):
+        ''' {property: [cycles of each trajectory]} '''
+        ltraj = [self._trajectory(ii) for ii in range(np.size(super().__getitem__('ncycles')))]
+        return {k: [d[k] for d in ltraj] for k in ltraj[0].keys()} if ltraj else {}
+
+
+def _stat_sensitivity(R0, ke, value):
+    '''
+    statistical measures of `value` (nt, nx, nr, a, b) across the parallel axis, for each region and sector of the field `ke`
+    '''
+    return [
+        {
+            kx: {
+                'mean': np.mean(val, axis=1),
+                'stdv': np.std(val, axis=1),
+                'min': np.amin(val, axis=1),
+                'max': np.amax(val, axis=1),
+                'median': np.median(val, axis=1)
+            }
+            for ii, kx in enumerate(R0[R0[ke]['size'][0]].get('list', [0]))
+            for val in [value[:, :, kr, ii, 0]]
+        }
+        for kr in range(R0['nr']['value'])
+    ]
+
+
+def _slice_nx(R, sl, lts, lpar):
+    '''
+    restrict the read-only views `R` to the parallel systems `sl`, for time series `lts` and parameters `lpar`
+    '''
+    out = {}
+    for k, v in R.items():
+        v = dict(v)
+        if k in lts:
+            v['value'] = v['value'][:, sl, ...]
+            if np.ndim(v.get('initial')) == 4:
+                v['initial'] = v['initial'][sl, ...]
+        elif k in lpar and isinstance(v['value'], np.ndarray) and np.ndim(v['value']) == 4:
+            v['value'] = v['value'][sl, ...]
+        out[k] = v
+    return out
+
+
+def _get_record(hub, record=None, record_every=None, stats=False):
+    '''
+    Turn the `record` and `record_every` arguments of `run` into {'fields': recorded fields, 'steps': recorded steps},
+    or None if everything is recorded. 'time' is always recorded, and so are the first and last steps.
+    With `stats`, the selected fields are not recorded: their statistics over nx are updated instead, in 'stats'.
+    Without record_every, the statistics are then recorded on about `_NSTATS` steps.
+    '''
+    if record is None and record_every in [None, 1] and stats is False:
+        return None
+    lts = hub.dmisc['dfunc_order']['differential'] + hub.dmisc['dfunc_order']['statevar']
+    if record is None:
+        fields = list(lts)
+    elif isinstance(record, dict):
+        fields = hub.get_dfields(returnas=list, **record)
+    else:
+        fields = [record] if isinstance(record, str) else list(record)
+        wrong = [k for k in fields if k not in lts]
+        if len(wrong):
+            raise Exception(f'Only differential and state variables can be recorded, you gave {wrong}')
+    fields = ['time'] + [k for k in lts if k in fields and k != 'time']
+
+    nt = int(hub.dfields_view['nt']['value'])
+    if record_every is None and stats is not False:
+        record_every = max(1, int((nt - 1) / (_NSTATS - 1)))
+    every = 1 if record_every is None else int(record_every)
+    if every < 1:
+        raise Exception(f'record_every must be a positive number of steps, you gave {record_every}')
+    drecord = {'fields': fields,
+               'steps': np.unique(np.r_[np.arange(0, nt, every), nt - 1])}
+    if stats is not False:
+        kwargs = {} if stats is True else {'quantiles': stats}
+        drecord['stats'] = EnsembleStats(fields, len(drecord['steps']), **kwargs)
+        drecord['fields'] = ['time']
+    return drecord
+
+
+def _get_stopped(hub, key, stepini):
+    '''
+    Time at which each member was stopped (dmisc[key], nan for the running ones) when a run continues, else nan for all
+    '''
+    previous = hub._dmisc.get(key)
+    if stepini > 0 and previous is not None:
+        return np.array(previous, dtype=float)
+    return np.full(int(hub._dfields['nx']['value']), np.nan)
+
+
+def _stat_ensemble(R0, ke, dstat):
     '''
-    calculate cn fourier coefficients for one cycle, not normalized
+    Same structure as `_stat_sensitivity`, from the statistics `dstat` of `_ensemble.EnsembleStats.get`
     '''
-    return np.array([np.abs(np.mean(y * np.exp(-1j * 2 * i * np.pi * np.linspace(0, 1, len(y))))) for i in range(n)])
+    return [
+        {
+            kx: {
+                'mean': dstat['mean'][:, kr, ii, 0],
+                'stdv': dstat['stdv'][:, kr, ii, 0],
+                'min': dstat['min'][:, kr, ii, 0],
+                'max': dstat['max'][:, kr, ii, 0],
+                'median': dstat['median'][:, kr, ii, 0],
+                'quantiles': {q: v[:, kr, ii, 0] for q, v in dstat['quantiles'].items()},
+            }
+            for ii, kx in enumerate(R0[R0[ke]['size'][0]].get('list', [0]))
+        }
+        for kr in range(R0['nr']['value'])
+    ]
+
+
+def _set_ensemble(hub, ensemble):
+    ''' Keep the ensemble statistics in dmisc['ensemble'], and give them as 'sensitivity' to their fields '''
+    ensemble.flush()
+    hub._dmisc['ensemble'] = ensemble
+    R0 = hub.get_dfields(returnas='view')
+    for ke in ensemble.fields:
+        hub._dfields[ke]['sensitivity'] = _stat_ensemble(R0, ke, ensemble.get(ke))
+    hub._dflags['sensitivity'] = True
 
 
 class calculateM:
@@ -40,7 +257,8 @@ class calculateM:
                         N: int = 10,
                         combined_run=True,
                         Noutput=500,
-                        verb: bool = False
+                        verb: bool = False,
+                        batched: bool = False,
                         ) -> dict:
         """
         Computes runs in parallel, with parameter/initial values taken from a distribution. 
@@ -73,6 +291,10 @@ class calculateM:
             Reinterpolate the output to Noutput points for smaller output size files. Default is 500.
         verb : bool, optional
             Verbose of the function. Default is False.
+        batched : bool, optional
+            If True, the independant runs are done in one single hub through `run_sweep`. 
+            Each key is then associated to a dictionnary of read-only views (see `run_sweep`) instead of a Hub, 
+            and the hub containing all runs is stored in '_SWEEP_'. Default is False.
 
         Returns
         -------
@@ -84,7 +306,7 @@ class calculateM:
         - The distribution is centered around the hub values, with their width controlled by `std`.
         - The output is a dictionary of Hub, the key being the field that is taken in its distribution.
         - The calculations are sequential for each key, so it can take time if there is a lot of key.
-        - An improvement would be to create one giant hub then cut it in splices
+          Use `batched=True` to do them all at once in one giant hub, cut in slices afterwards.
 
 
         Raises
@@ -153,8 +375,15 @@ class calculateM:
             dHub['_COMBINED_'].run(NtimeOutput=Noutput, verb=verb)
             dHub['_COMBINED_'].calculate_StatSensitivity()
 
+        # All parameters in one hub
+        if combined_run in [True, 'independant'] and batched:
+            dsweep = {k: v for k, v in Globalset.items() if k != 'nx'}
+            dout = self.run_sweep(dsweep, dbase=Base, Noutput=Noutput, verb=verb)
+            dHub['_SWEEP_'] = dout.pop('_HUB_')
+            dHub.update(dout)
+
         # Sequential parameter
-        if combined_run in [True, 'independant']:
+        elif combined_run in [True, 'independant']:
             for k, v in Globalset.items():
                 if k != 'nx':
                     if verb:
@@ -166,15 +395,95 @@ class calculateM:
                     dHub[k].set_fields(k, v, verb=False)
                     dHub[k].run(NtimeOutput=Noutput, verb=verb)
                     dHub[k].calculate_StatSensitivity()
+        return dHub
+
+    def run_sweep(self,
+                  dsweep: dict,
+                  dbase: dict = None,
+                  Noutput=500,
+                  verb: bool = False,
+                  solver=config.get_current('_SOLVER'),
+                  ) -> dict:
         """
-        else: 
-            FullHub = self.copy()
-            FullHub.set_fields(**{'nx': N*(len(Globalset.keys())+1),
-                                  })
-            for i,k in enumerate(Globalset.keys()):
-                FullHub.set_fields(**{k:})
+        Run a parameter sweep for multiple fields in one single vectorized run.
+
+        All the samples of all the fields are stacked along the parallel axis `nx` of one copy of the hub:
+        the samples of each field are given a block of parallel systems, in which the other fields keep their base value.
+        The copy is run once, and the results are returned as read-only views on each block.
+
+        Parameters
+        ----------
+        dsweep : dict
+            The values to explore, {field: values}. `values` is either a 1D array (one value per sample), 
+            or an array of shape (Nsamples, nr, a, b) as generated by `generate_dic_distribution`.
+        dbase : dict, optional
+            Values of the fields outside of their block, as in set_fields. 
+            If None, the values of the hub are used (initial values for differential variables). Default is None.
+        Noutput : int, optional
+            Reinterpolate the output to Noutput points. Default is 500.
+        verb : bool, optional
+            Verbose of the function. Default is False.
+        solver : str, optional
+            Solver used for the run. Default is the `_SOLVER` of the config.
+
+        Returns
+        -------
+        dict
+            {field: views}, with views the output of get_dfields(returnas='view') restricted to the block of the field. 
+            Each differential and state variable also has a 'sensitivity' entry, as given by calculate_StatSensitivity on the block.
+            The hub containing all runs is in '_HUB_', and the position of each block in its dmisc['sweep'].
+
+        Raises
+        ------
+        Exception
+            If the hub already has multiple parallel systems.
+
+        Notes
+        -----
+        The views share their memory with the '_HUB_' hub: nothing is copied after the run.
         """
-        return dHub
+        if self._dfields['nx']['value'] != 1:
+            raise Exception("Error: run_sweep needs a hub with nx=1, the sweep is done on the parallel axis")
+
+        # BLOCK OF EACH FIELD
+        dslices = {}
+        nx = 0
+        for k, v in dsweep.items():
+            n = np.shape(v)[0]
+            dslices[k] = slice(nx, nx + n)
+            nx += n
+
+        # STACKED VALUES
+        hub = self.copy()
+        if dbase:
+            hub.set_fields(**dbase, verb=False)
+        dstack = {}
+        for k in dsweep.keys():
+            direct = 'initial' if hub._dfields[k].get('eqtype') == 'differential' else 'value'
+            base = np.asarray(hub._dfields[k][direct], dtype=float)
+            stack = np.repeat(base, nx, axis=0)
+            v = np.asarray(dsweep[k], dtype=float)
+            if np.ndim(v) == 1:
+                v = v.reshape((-1,) + (1,) * (stack.ndim - 1))
+            stack[dslices[k]] = v
+            dstack[k] = stack
+
+        hub.set_fields('nx', nx, verb=False)
+        hub.set_fields(**dstack, verb=False)
+        hub.run(NtimeOutput=Noutput, verb=verb, solver=solver)
+        hub._dmisc['sweep'] = dslices
+
+        # SLICES OF THE OUTPUT
+        lts = hub.dmisc['dfunc_order']['differential'] + hub.dmisc['dfunc_order']['statevar']
+        lpar = hub.dmisc['dfunc_order']['parameters']
+        R0 = hub.get_dfields(returnas='view')
+        dout = {}
+        for k, sl in dslices.items():
+            dout[k] = _slice_nx(R0, sl, lts, lpar)
+            for ke in lts:
+                dout[k][ke]['sensitivity'] = _stat_sensitivity(R0, ke, dout[k][ke]['value'])
+        dout['_HUB_'] = hub
+        return dout
 
     def calculate_StatSensitivity(self):
         """
@@ -202,25 +511,12 @@ class calculateM:
         leq = ['differential', 'statevar']
 
         # Get the parameters
-        R0 = self.get_dfields()
-        R = self.get_dfields(returnas=dict, eqtype=leq)
+        R0 = self.get_dfields(returnas='view')
+        R = self.get_dfields(returnas='view', eqtype=leq)
 
         # Loop over the keys in the parameters
         for ke in R.keys():
-            self._dfields[ke]['sensitivity'] = [
-                {
-                    kx: {
-                        'mean': np.mean(val, axis=1),
-                        'stdv': np.std(val, axis=1),
-                        'min': np.amin(val, axis=1),
-                        'max': np.amax(val, axis=1),
-                        'median': np.median(val, axis=1)
-                    }
-                    for ii, kx in enumerate(R0[R0[ke]['size'][0]].get('list', [0]))
-                    for val in [R[ke]['value'][:, :, kr, ii, 0]]
-                }
-                for kr in range(R0['nr']['value'])
-            ]
+            self._dfields[ke]['sensitivity'] = _stat_sensitivity(R0, ke, R[ke]['value'])
 
         # Set the 'sensitivity' flag to True
         self._dflags['sensitivity'] = True
@@ -269,7 +565,7 @@ class calculateM:
         """
         # Final step studies ##################
         R = self.get_dfields(
-            key=[k for k in finalpoint] + ['time'], returnas=dict)
+            key=[k for k in finalpoint] + ['time'], returnas='view')
 
         # Take into account multisectoriality
         sector = {k: 0 for k in finalpoint.keys()}
@@ -302,9 +598,10 @@ class calculateM:
 
         For each variable, it calculates the cycles properties. The reference variable
         on which the time of cycles is determined by default the variable detects cycles in itself.
+        A cycle goes from a local maximum of the reference to the next one.
         The fields which are calculated are : 
-            ['reference', 'period_indexes', 'period_T_intervals', 't_mean_cycle',
-                'period_T', 'meanval', 'medval', 'stdval', 'minval', 'maxval']
+            ['reference', 'ncycles', 'period_indexes', 'period_T_intervals', 't_mean_cycle',
+                'period_T', 'frequency', 'meanval', 'medval', 'stdval', 'minval', 'maxval', 'Coeffs', 'Harmonicity']
 
 
         Parameters
@@ -319,6 +616,19 @@ class calculateM:
         -----
         The function updates the 'cycles' field of the `_dfields` attribute with the calculated cycles properties,
         and then sets the 'cycles' flag of the `_dflags` attribute to True.
+        Each property is an array with the cycles on the first axis, (ncycles, nx, nr, a, b)
+        ('period_indexes' and 'period_T_intervals' have a last axis [start, end], 'Coeffs' a last axis of n-1 harmonics),
+        padded with NaN (-1 for indexes) after the 'ncycles' (nx, nr, a, b) cycles of each trajectory.
+        'period_indexes' are the [first, last + 1] time indexes of each cycle.
+        'Coeffs' are the amplitudes of the harmonics 1 to n-1 relative to the first one,
+        'Harmonicity' the share of the harmonics in the total spectral energy.
+        All the trajectories of a field are processed at once, see `_cycles`.
+
+        Before the cycles were arrays, 'cycles' was a list of dicts (one per trajectory) of lists (one value per cycle),
+        and 'cycles_bykey' the same lists by property. `R[var]['cycles'][i]` still gives the dict of the trajectory i,
+        and `R[var]['cycles'].bykey()` replaces 'cycles_bykey'. 'period_T' now ends at the closing maximum
+        (it was one time step longer), and 'Harmonicity' comes from the Fourier transform of each cycle resampled
+        on max(64, 2n) points, so it differs slightly from the previous values.
 
         Author
         ------
@@ -328,136 +638,21 @@ class calculateM:
         ----
         OLD
         """
-
-        # Define the equation types and fields
         leq = ['differential', 'statevar']
-        fields = ['reference', 'period_indexes', 'period_T_intervals', 't_mean_cycle',
-                  'period_T', 'meanval', 'medval', 'stdval', 'minval', 'maxval']
-
-        # Get the parameters and calculate the cycles properties for each variable
-        for var, dic1 in self.get_dfields(returnas=dict, eqtype=leq).items():
-            tempval = np.reshape(dic1['value'], (np.shape(dic1['value'])[0], -1))
-            self._dfields[var]['cycles'] = [{k: [] for k in fields} for _ in range(np.shape(tempval)[1])]
-
-        # Update the 'cycles' field of the variable in the parameters
-        for var, dic1 in self.get_dfields(returnas=dict, eqtype=leq).items():
-            tempval = np.reshape(dic1['value'], (np.shape(dic1['value'])[0], -1))
-            for idx in range(np.shape(tempval)[1]):
-                self._dfields[var]['cycles'][idx]['reference'] = ref if ref else var
-                self._FillCycles(var, tempval[:, idx], ref if ref else var, idx, n=n)
-
-        # Reverse the cycles dictionary and set the 'cycles' flag to True
-        self._reverse_cycles_dic()
+        R = self.get_dfields(returnas='view')
+        time = R['time']['value'][:, 0, 0, 0, 0]
+        if ref is not None and ref not in R:
+            raise Exception(f'{ref} is not a field of the model')
+
+        for var, dic1 in self.get_dfields(returnas='view', eqtype=leq).items():
+            value = dic1['value']
+            vref = R[ref if ref else var]['value']
+            if np.shape(vref) != np.shape(value):
+                # first sector of the reference for all the sectors of the variable
+                vref = np.broadcast_to(vref[..., :1, :1], np.shape(value))
+            self._dfields[var]['cycles'] = _Cycles(reference=ref if ref else var, **_cycles(value, vref, time, n=n))
         self._dflags['cycles'] = True
 
-    def _FillCycles(self, var, tempval, ref='employment', id=0, n=10):
-        '''
-        it calculates the cycles properties
-        ref is the reference variable on which the time of cycles is determined
-        by default the variable detect cycles in itself
-
-        var : name of the variable we are working on
-        ref : reference for the oscillations detections
-        '''
-
-        # Get the new dictionnary to edit
-        dic = self._dfields[var]
-        dic1 = self._dfields[var]['cycles'][id]
-
-        # check if reference has already calculated its period
-        # the reference has cycle and this cycle has been calculated on itself
-        ready = False
-        if 'cycles' in self._dfields[ref].keys():
-            dic2 = self._dfields[ref]['cycles'][id]
-            if (dic2['reference'] == ref and len(dic2.get('period_indexes', [])) >= 1):
-                # We can take the reference as the base
-                ready = True
-        # If there is no good reference
-        # We calculate it and put
-        if not ready:
-            self._findCycles(ref, tempval, id)
-            dic2 = self._dfields[ref]['cycles'][id]
-
-        for key in ['period_indexes', 'period_T_intervals',
-                    't_mean_cycle', 'period_T']:
-            dic1[key] = copy.copy(dic2[key])
-
-        tim = self._dfields['time']['value'][:, 0, 0, 0]
-        dic1['period_T_intervals'] = [[tim[idx[0], 0], tim[idx[1], 0]]
-                                      for idx in dic1['period_indexes']]
-        dic1['t_mean_cycle'] = [
-            (t[0] + t[1]) / 2 for t in dic1['period_T_intervals']]
-        dic1['period_T'] = [
-            (t[1] - t[0]) for t in dic1['period_T_intervals']]
-        dic1['frequency'] = [
-            1 / (t[1] - t[0]) for t in dic1['period_T_intervals']]
-
-        # Fill for each the characteristics
-        values = tempval
-        # print(var, dic1)
-        dic1['meanval'] = [np.mean(values[idx[0]:idx[1]])
-                           for idx in dic1['period_indexes']]
-        dic1['medval'] = [np.median(values[idx[0]:idx[1]])
-                          for idx in dic1['period_indexes']]
-        dic1['stdval'] = [np.std(values[idx[0]:idx[1]])
-                          for idx in dic1['period_indexes']]
-        dic1['minval'] = [np.amin(values[idx[0]:idx[1]])
-                          for idx in dic1['period_indexes']]
-        dic1['maxval'] = [np.amax(values[idx[0]:idx[1]])
-                          for idx in dic1['period_indexes']]
-
-        # print([values[idx[0]:idx[1]] for idx in dic1['period_indexes']])
-
-        Coeffs = [_cn(values[idx[0]:idx[1]], n)
-                  for idx in dic1['period_indexes']]
-        dic1['Coeffs'] = [Coeffs[i][1:] / Coeffs[i][1]
-                          for i in range(len(Coeffs))]
-        dic1['Harmonicity'] = [np.sum(Coeffs[i][1:]**2) / np.sum(Coeffs[i]**2)
-                               for i in range(len(Coeffs))]
-
-    def _findCycles(self, refval, tempval, idx=0):
-        '''
-        Detect all positions of local maximums and the time that is linked
-        '''
-        # initialisation
-        periods = []
-        id1 = 1
-
-        dic1 = self._dfields[refval]['cycles'][idx]
-        val = tempval
-
-        # identification loop
-        while id1 < len(val) - 2:
-            if (val[id1] > val[id1 - 1] and val[id1] > val[id1 + 1]):
-                if np.abs(val[id1] - val[id1 - 1]):
-                    periods.append(1 * id1)
-            id1 += 1
-
-        # Fill the formalism
-        self._dfields[refval]['cycles'][idx]['period_indexes'] = [
-            [periods[i], periods[i + 1] + 1] for i in range(len(periods) - 1)
-        ]
-        tim = self._dfields['time']['value']
-        dic1 = self._dfields[refval]['cycles'][idx]
-        dic1['period_T_intervals'] = [[tim[idx[0]], tim[idx[1]]]
-                                      for idx in dic1['period_indexes']]
-        dic1['t_mean_cycle'] = [
-            (t[0] + t[1]) / 2 for t in dic1['period_T_intervals']]
-        dic1['period_T'] = [
-            (t[1] - t[0]) for t in dic1['period_T_intervals']]
-        dic1['reference'] = refval
-
-    def _reverse_cycles_dic(self):
-        leq = ['differential', 'statevar']
-        for var, dic1 in self.get_dfields(returnas=dict, eqtype=leq).items():
-            c = dic1['cycles']
-            newcycles = {k: [] for k in c[0].keys()}
-            for i in range(len(c)):
-                for k in c[i].keys():
-                    newcycles[k].append(c[i][k])
-
-            self._dfields[var]['cycles_bykey'] = copy.deepcopy(newcycles)
-
     def reset(self):
         """
         Reinitialize all calculated values, keeping only the loaded model file and parameters/initial conditions.
@@ -471,6 +666,8 @@ class calculateM:
         Notes
         -----
         The function updates the 'value' field of the `_dfields` attribute for each differential equation, state variable, and function-parameter.
+        Only the first time step is set to NaN if nothing was written in the time series since the previous reset 
+        (dmisc['reset'] is True): their other steps are still NaN.
         It also updates the 'run', 'sensitivity', 'convergence', 'multiregional', 'Parrallel', and 'cycles' flags of the `_dflags` attribute.
         If an error occurs during the re-computation of the initial value for a state variable, an exception is raised with a detailed error message.
 
@@ -483,9 +680,16 @@ class calculateM:
         OLD
         """
 
-        # reset ode variables
-        for k0 in self.get_dfields(eqtype=['differential', 'statevar'], returnas=list):
-            self._dfields[k0]['value'][...] = np.nan
+        # reset ode variables, copying the ones shared with a copy of the hub
+        lts = self._dmisc['dfunc_order']['differential'] + self._dmisc['dfunc_order']['statevar']
+        if _hub_set.own_timeseries(self._dfields, lts, self._dmisc.get('shared')):
+            self._dargs = _hub_set.get_dargs_by_reference(self._dfields, self._dmisc['dfunc_order'])
+        clean = self._dmisc.get('reset', False)
+        for k0 in lts:
+            if clean:
+                self._dfields[k0]['value'][0, ...] = np.nan
+            else:
+                self._dfields[k0]['value'][...] = np.nan
 
         # Reset initial for ode
         for k0 in self.get_dfields(eqtype=['differential'], returnas=list):
@@ -534,6 +738,7 @@ class calculateM:
         self._dflags['cycles'] = False
         self._dflags['run'] = [0, 0]
         self._dflags['reinterpolated'] = False
+        self._dmisc['reset'] = True
 
     def run_uncertainty(
         self,
@@ -542,6 +747,8 @@ class calculateM:
         N: int = 10,
         NtimeOutput: int = False,
         verb=0.1,
+        stats=False,
+        batch: int = None,
     ):
         """
         Run a simulation with uncertainty to assess system robustness. 
@@ -562,12 +769,21 @@ class calculateM:
             Number of time points for output. Default is False.
         verb : float, optional
             Verbosity level for run logging. Default is 0.1.
+        stats : bool or list, optional
+            If True (or a list of quantile probabilities), only the statistics over the members are computed during the run, 
+            and the trajectories are not kept (see `stats` in `run`). NtimeOutput is then the approximate number of recorded steps.
+            Default is False.
+        batch : int, optional
+            With `stats`, number of members run at once: the N members are run by batches whose statistics are merged, 
+            so that the memory does not depend on N. Default is None, all the members in one run.
 
         Notes
         -----
         The function first checks the value of `nx` and raises an exception if it's not 1. It then saves the state of the system 
         and generates the distributions for the variations. It sets the fields with the generated distributions and runs the simulation. 
         Finally, it calculates the statistical sensitivity.
+        With `stats`, the statistics are in dmisc['ensemble'] and in the 'sensitivity' of each field; the median and quantiles 
+        are exact for one batch, and approximate when batches are merged.
 
         Author
         ------
@@ -577,7 +793,7 @@ class calculateM:
         ----
         OLD
         """
-        R = self.get_dfields()
+        R = self.get_dfields(returnas='view')
         if R['nx']['value'] not in [1, N]:
             raise Exception("Error: you can't do parrallel run with uncertainty !")
 
@@ -591,9 +807,23 @@ class calculateM:
                        'sigma': uncertainty * 0.01 * v,
                        'type': distribution,
                        } for k, v in Base.items()}
-        self.set_fields(**_generate_dic_distribution(Newdict, dictpreset={}, N=N), verb=False)
-        self.run(NtimeOutput=NtimeOutput, verb=verb)
-        self.calculate_StatSensitivity()
+        if stats is False:
+            self.set_fields(**_generate_dic_distribution(Newdict, dictpreset={}, N=N), verb=False)
+            self.run(NtimeOutput=NtimeOutput, verb=verb)
+            self.calculate_StatSensitivity()
+            return
+
+        # Streaming statistics, by batches of members
+        batch = N if batch is None else int(batch)
+        record_every = None
+        if NtimeOutput:
+            record_every = max(1, int((self._dfields['nt']['value'] - 1) / max(NtimeOutput - 1, 1)))
+        ensemble = None
+        for i0 in range(0, N, batch):
+            self.set_fields(**_generate_dic_distribution(Newdict, dictpreset={}, N=min(batch, N - i0)), verb=False)
+            self.run(verb=verb, stats=stats, record_every=record_every)
+            ensemble = self._dmisc['ensemble'] if ensemble is None else ensemble.merge(self._dmisc['ensemble'])
+        _set_ensemble(self, ensemble)
 
     def run(
         self,
@@ -603,6 +833,14 @@ class calculateM:
         ComputeStatevarEnd=False,
         solver=config.get_current('_SOLVER'),
         steps=False,
+        rtol=1e-6,
+        atol=1e-9,
+        record=None,
+        record_every=None,
+        stats=False,
+        terminate=None,
+        converge=None,
+        profile=False,
     ):
         """
         Run the simulation using an explicit RK4 (by default, can be changed). 
@@ -621,16 +859,69 @@ class calculateM:
         ComputeStatevarEnd : bool, optional
             If True, recompute all state variables at the end. Default is False.
         solver : str, optional
-            Solver method, either 'rk1' or 'rk4'. Default is 'rk4'.
+            Solver method, in 'rk1', 'rk4', 'rk4-flat', 'dopri5' or 'rk4-jit'. Default is 'rk4'.
+            'rk4-flat' gives the same results as 'rk4' with a contiguous state vector and preallocated buffers.
+            'rk4-jit' compiles the whole 'rk4' loop with numba, for models in which every field is a scalar: 
+            it falls back on 'rk4-flat' if numba is not installed or if the model is not compatible.
+            'dopri5' is an adaptive Dormand-Prince 5(4) scheme: its internal time step is adapted to `rtol` and `atol`, 
+            and the solution is interpolated on the time grid of step `dt`. 
         steps : bool, optional
             Number of steps to run the simulation. Default is False.
+        rtol, atol : float, optional
+            Relative and absolute tolerances of the 'dopri5' solver. Default are 1e-6 and 1e-9.
+        record : list, str or dict, optional
+            Differential and state variables to store, either as a list of names or as criteria of `get_dfields` 
+            (for example {'eqtype': 'differential'}). 'time' is always stored. Default is None, everything is stored.
+        record_every : int, optional
+            Store one step every `record_every` steps (the first and last steps are always stored). 
+            For a yearly output, use int(1 / dt). Default is None, every step is stored.
+        stats : bool or list, optional
+            If True, the statistics over the parallel systems nx (mean, stdv, min, max, median, quantiles) of the `record` fields 
+            are updated at each recorded step, and their trajectories are not stored: only 'time' is. 
+            A list of probabilities gives the quantiles (default 0.05, 0.25, 0.5, 0.75, 0.95). 
+            The statistics are in dmisc['ensemble'] (see `_ensemble.EnsembleStats`) and in the 'sensitivity' of each field, 
+            as given by `calculate_StatSensitivity`. They take 25 values per recorded step and cell (the memory of 25 
+            members) with the default quantiles: without record_every, they are recorded on about 500 steps. Default is False.
+        terminate : bool or dict, optional
+            Stop each parallel system (member of nx) independently, once it diverges. True stops the members having a non-finite 
+            differential variable. A dict can contain:
+                * 'finite': bool, stop on non-finite differential variables (default True)
+                * 'bounds': {field: [min, max]} (None for no bound) on differential and state variables, 
+                  or a list of fields to use their 'minmax'
+                * 'predicate': function of the dict of the values of the running members, returning a boolean per member 
+                  (first axis) that is True for the members to stop
+            The values of a stopped member are frozen, and the next steps only compute the running members. 
+            The time at which each member stopped is in dmisc['terminated'] (nx,), nan for the members that did not stop. 
+            Only with the 'rk1', 'rk4' and 'rk4-flat' solvers ('rk4-flat' and 'rk4-jit' use the 'rk4' loop). Default is None.
+        converge : float or dict, optional
+            Stop each member once it reached a steady state, and end the run when no member is running. 
+            A float is the relative tolerance 'rtol'. A dict can contain:
+                * 'rtol': a member is converged when the change of its fields over the window is lower than 
+                  rtol * |value| + atol (default 1e-6)
+                * 'atol': absolute tolerance (default 0)
+                * 'window': duration over which the change is measured, in the unit of time (default 1)
+                * 'fields': differential and state variables to check (default all the differential variables except time)
+            As with `terminate`, the converged members are frozen and no longer computed. The time at which each member 
+            converged is in dmisc['converged'] (nx,), nan for the members that did not. When the run ends early, the time series 
+            are truncated after the last step, as is dflags['run'] ('nt' keeps its value). Same solvers as `terminate`. 
+            Default is None.
+        profile : bool, optional
+            If True, the function of each differential and state variable is timed, with its number of calls and the size 
+            of its results, to find the equations that dominate the run (see `get_profile`). The equations are then not fused 
+            in one step function (see `_compiler.compile_step`), and 'rk4-jit' runs as 'rk4-flat', so the run is slower. 
+            The raw statistics of the last run are in dmisc['profile']. Default is False.
 
         Notes
         -----
-        The function first checks the solver name and raises an exception if it's not 'rk1' or 'rk4'. 
+        The function first checks the solver name and raises an exception if it's not in `_solvers._LSOLVERS`. 
         If NstepsInput is True, it sets the 'dt' field to the value of 'Tsim' divided by NstepsInput. 
         It then checks the inputs and resets the variables if necessary. 
         It starts the time loop and runs the solver. 
+        If the hub stores its time series on disk (see `set_storage`), they are flushed at the end of the run.
+        With `record` or `record_every`, only the recorded fields at the recorded steps are allocated and written: 
+        the time axis of all time series is then the recorded steps (see dmisc['record']), the other fields have the memory 
+        of one step and are nan after the run. Such a run always starts from the initial conditions, 
+        and cannot be used with `steps` or `ComputeStatevarEnd`.
         If an error occurs during the solver run, it sets the 'run' flag to [0, 0.] and raises the error.
 
         Author
@@ -643,36 +934,72 @@ class calculateM:
         OLD
         """
         # Special run for reluncertainty
-        if solver not in ['rk1', 'rk4']:
-            raise Exception(f'solver name {solver} unknown ! Try rk1 or rk4')
+        if solver not in _solvers._LSOLVERS:
+            raise Exception(f'solver name {solver} unknown ! Try one of {_solvers._LSOLVERS}')
 
         if NstepsInput:
-            self.set_fields('dt', self.dfields['Tsim']['value'] / NstepsInput, verb=verb)
+            self.set_fields('dt', self._dfields['Tsim']['value'] / NstepsInput, verb=verb)
 
         # check inputs
         dverb = _hub_check._run_verb_check(verb=verb)
 
-        if self.dflags['run'][0] >= self.dfields['nt']['value']-1:
+        # Selective recording, the time series are reallocated for it
+        drecord = _get_record(self, record=record, record_every=record_every, stats=stats)
+        if drecord is not None and (steps or ComputeStatevarEnd):
+            raise Exception('record, record_every and stats are only available on a complete run, without steps or ComputeStatevarEnd')
+        if stats is not False and NtimeOutput:
+            raise Exception('stats cannot be reinterpolated with NtimeOutput, use record_every')
+        if drecord is not None or self._dmisc.get('record') is not None:
+            # the statistics are only given to the solver, they are kept in dmisc['ensemble'] after the run
+            self._dmisc['record'] = None if drecord is None else {k: v for k, v in drecord.items() if k != 'stats'}
+            self._dmisc['reset'] = False
+            self._dflags['run'] = [0, 0.]
+            if steps:
+                self.set_fields(**{}, verb=False)
+
+        # no room left after the last step (a run that ended early, or reinterpolated time series)
+        if self.dflags['run'][0] >= min(self._dfields['nt']['value'], len(self._dfields['time']['value'])) - 1:
             print('Already run: reset and run')
             self._dflags['run'] = [0, 0.]
             self.set_fields(**{}, verb=False)
             self.reset()
 
-        # reset variables
+        # reset variables, unless nothing changed since the last reset
         if (not steps and self.dflags['run'][0] == 0):
-            self.set_fields(**{}, verb=False)
-            self.reset()
-            steps = self.dfields['nt']['value']
+            if not self._dmisc.get('reset', False):
+                self.set_fields(**{}, verb=False)
+                self.reset()
+            steps = self._dfields['nt']['value']
             stepini = 0
         elif not steps:
-            steps = self.dfields['nt']['value']
+            steps = self._dfields['nt']['value']
             stepini = self._dflags['run'][0]
         else:
             steps = self._dflags['run'][0] + steps + 1
             stepini = self._dflags['run'][0]
-        steps = np.min((steps, self.dfields['nt']['value']))
+        steps = np.min((steps, self._dfields['nt']['value']))
+
+        # The initial step of the members is the first one of the statistics
+        if drecord is not None and 'stats' in drecord:
+            for k in drecord['stats'].fields:
+                drecord['stats'].update(k, 0, self._dfields[k]['value'][0, ...])
+
+        # Members already stopped at the previous steps stay stopped
+        order = self._dmisc['dfunc_order']
+        dterminate, dconverge = None, None
+        if terminate:
+            dterminate = _solvers._get_terminate(self._dfields, order['differential'], order['statevar'], terminate)
+            dterminate['terminated'] = _get_stopped(self, 'terminated', stepini)
+        if converge:
+            dconverge = _solvers._get_converge(self._dfields, order['differential'], order['statevar'], converge)
+            dconverge['converged'] = _get_stopped(self, 'converged', stepini)
 
         # start time loop
+        self._dmisc['reset'] = False
+        if _hub_set.own_timeseries(self._dfields, order['differential'] + order['statevar'], self._dmisc.get('shared')):
+            self._dargs = _hub_set.get_dargs_by_reference(self._dfields, order)
+        dprofile = {} if profile else None
+        tprofile = time.perf_counter_ns()
         try:
             nt, tmax = _solvers.solve(
                 dfields=self._dfields,
@@ -682,12 +1009,41 @@ class calculateM:
                 dverb=dverb,
                 ComputeStatevarEnd=ComputeStatevarEnd,
                 solver=solver,
+                rtol=rtol,
+                atol=atol,
+                record=drecord,
+                terminate=dterminate,
+                converge=dconverge,
+                profile=dprofile,
             )
-
-            self._dflags['run'] = [nt - 1, tmax]
-            self._dmisc['solver'] = solver
-
-            if (steps == nt and NtimeOutput):
+            if dprofile is not None:
+                dprofile.update(total=time.perf_counter_ns() - tprofile, steps=nt - stepini - 1, solver=self._dmisc['solver'])
+            # Last row written
+            last = nt - 1 if drecord is None else int(np.searchsorted(drecord['steps'], nt)) - 1
+
+            # A run that ended early is truncated after its last row
+            if nt < steps:
+                for k in order['statevar'] + order['differential']:
+                    self._dfields[k]['value'] = self._dfields[k]['value'][:last + 1]
+                if drecord is not None:
+                    drecord['steps'] = drecord['steps'][:last + 1]
+                    if 'stats' in drecord:
+                        drecord['stats'].truncate(last + 1)
+                    self._dmisc['record']['steps'] = drecord['steps']
+
+            self._dflags['run'] = [last, tmax]
+            self._dmisc['terminated'] = None if dterminate is None else dterminate['terminated']
+            self._dmisc['converged'] = None if dconverge is None else dconverge['converged']
+            self._dmisc['profile'] = dprofile
+            if drecord is not None and 'stats' in drecord:
+                _set_ensemble(self, drecord['stats'])
+
+            # Memory-mapped time series (see `set_storage`) are written on disk
+            for k in self._dmisc['dfunc_order']['statevar'] + self._dmisc['dfunc_order']['differential']:
+                if isinstance(self._dfields[k]['value'], np.memmap):
+                    self._dfields[k]['value'].flush()
+
+            if ((steps == nt or dconverge is not None) and NtimeOutput):
                 self.reinterpolate_dfields(NtimeOutput)
 
         except Exception as err:
@@ -714,8 +1070,8 @@ class calculateM:
         -----
         The function first gets the current time and state variables from `dfields`. It then loops over each state variable and 
         differential equation, reinterpolating the values to the new number of points. The reinterpolated values are reshaped 
-        to match the original shape and stored back in `dfields`. Finally, the 'run' flag and 'nt' and 'dt' fields in `dfields` 
-        are updated to reflect the new number of points.
+        to match the original shape and stored back in `dfields`. Finally, the 'run' flag is updated to reflect the new number of points.
+        The 'nt' and 'dt' fields keep the values of the simulation, so that a new run uses the same time step.
 
         Author
         ------
@@ -732,7 +1088,7 @@ class calculateM:
                 + self._dmisc['dfunc_order']['differential']:
             v = P[k]['value']
             prevshape = np.shape(v)
-            v2 = v.reshape(P['nt']['value'], -1)
+            v2 = v.reshape(len(t), -1)
             newval = np.zeros([N, np.shape(v2)[1]])
             newt = np.linspace(t[0, 0, 0, 0], t[-1, 0, 0, 0], N)
             for i in range(np.shape(newval)[1]):
@@ -742,8 +1098,6 @@ class calculateM:
 
         self.dflags['run'][0] = N - 1
         self.dflags['reinterpolated'] = True
-        self.dfields['nt']['value'] = N
-        self.dfields['dt']['value'] = self.dfields['Tsim']['value'] / N
 
     def compare_presets(self,
                         variables: Union[list, tuple],
@@ -753,6 +1107,8 @@ class calculateM:
         the kwargs are directly transfered to compare_hubs`
         '''
 
+        from ..plots.compare_hubs import compare_hubs
+
         dhub = {}
         lpreset = self.get_presets(returnas=dict)
 
@@ -0,0 +1,317 @@
+"""
+Compilation of the equations of a model into one generated function.
+
+The body of each lambda is read in its source file, its arguments are renamed into local variables,
+and all the state variables and derivatives are computed in order in a single function, without the call
+and keyword dispatch of each field. A field whose function cannot be inlined (a `def`, a closure, a comprehension...)
+is called as it is from the generated function.
+"""
+import ast
+import builtins
+import copy
+import os
+
+# Compiled code for each set of equations, {fingerprint: (code, namespace description, source)}
+_DCOMPILED = {}
+# Parsed source files, {filename: (mtime, tree)}
+_DAST = {}
+
+# Nodes that bind their own names: a lambda containing them is not inlined
+_FORBIDDEN = (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.NamedExpr,
+              ast.Yield, ast.YieldFrom, ast.Await)
+
+
+def _fingerprint(func):
+    ''' Identify a function by its code, not by the object (model files are executed again for each hub) '''
+    co = func.__code__
+    return (co.co_filename, co.co_firstlineno, co.co_code, co.co_consts, co.co_names)
+
+
+def _get_tree(filename):
+    ''' Parsed source file, cached with its modification time '''
+    try:
+        mtime = os.path.getmtime(filename)
+    except OSError:
+        return None
+    if filename not in _DAST or _DAST[filename][0] != mtime:
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                _DAST[filename] = (mtime, ast.parse(f.read()))
+        except (OSError, SyntaxError, ValueError):
+            _DAST[filename] = (mtime, None)
+    return _DAST[filename][1]
+
+
+def _get_lambda_body(func):
+    '''
+    Expression of a lambda in its source file, or None if it cannot be found without ambiguity
+    '''
+    if func.__name__ != '<lambda>' or func.__code__.co_freevars:
+        return None
+    co = func.__code__
+    tree = _get_tree(co.co_filename)
+    if tree is None:
+        return None
+
+    args = list(co.co_varnames[:co.co_argcount])
+    candidates = [node for node in ast.walk(tree)
+                  if isinstance(node, ast.Lambda) and node.lineno == co.co_firstlineno
+                  and [a.arg for a in node.args.args] == args
+                  and not (node.args.vararg or node.args.kwarg or node.args.kwonlyargs)]
+    if len({ast.dump(node.body) for node in candidates}) != 1:
+        return None
+    body = candidates[0].body
+    if any(isinstance(node, _FORBIDDEN) for node in ast.walk(body)):
+        return None
+    return body
+
+
+class _Renamer(ast.NodeTransformer):
+    ''' Rename the arguments into local variables, and the other names into namespace entries '''
+
+    def __init__(self, args, getglobal):
+        self.args = args
+        self.getglobal = getglobal
+        self.ok = True
+
+    def visit_Name(self, node):
+        if node.id in self.args:
+            name = f'f_{node.id}'
+        else:
+            name = self.getglobal(node.id)
+            if name is None:
+                self.ok = False
+                return node
+        return ast.copy_location(ast.Name(id=name, ctx=node.ctx), node)
+
+
+def _get_namer(dnamespace, dglobalnames, func, k0):
+    '''
+    Return the function giving the name in the generated namespace of a global name used by `func`,
+    or None if the name does not exist
+    '''
+    def getglobal(name):
+        if name in func.__globals__:
+            obj = func.__globals__[name]
+        elif hasattr(builtins, name):
+            return name
+        else:
+            return None
+        key = (id(obj), name)
+        if key not in dglobalnames:
+            dglobalnames[key] = f'g{len(dglobalnames)}_{name}'
+            dnamespace[dglobalnames[key]] = (k0, name)
+        return dglobalnames[key]
+    return getglobal
+
+
+def _inline(dfields, k0, getglobal):
+    '''
+    Source of the expression of the field `k0` with its arguments as local variables `f_<name>`, or None if it cannot be inlined
+    '''
+    body = _get_lambda_body(dfields[k0]['func'])
+    if body is None:
+        return None
+    renamer = _Renamer(set(dfields[k0]['kargs']), getglobal)
+    newbody = renamer.visit(copy.deepcopy(body))
+    return ast.unparse(newbody) if renamer.ok else None
+
+
+def _get_read(dfields, lode, lstate):
+    ''' Arguments of the equations that are not computed by them: differential variables and parameters '''
+    lread = []
+    for k0 in lstate + lode:
+        for k in dfields[k0]['kargs']:
+            if k not in lstate and k not in lread:
+                lread.append(k)
+    return lread
+
+
+def _generate(dfields, lode, lstate, inplace):
+    '''
+    Source of the function `_step(dbuffer, dv)`, and the description of its namespace
+    [(name in the namespace, field, global name or None for the function itself)]
+    '''
+    dnamespace = {}   # name in the namespace -> (field, global name)
+    dglobalnames = {}  # (id of the object, global name) -> name in the namespace
+
+    lines = [f'    f_{k} = dbuffer[{k!r}]' for k in _get_read(dfields, lode, lstate)]
+    for k0 in lstate + lode:
+        expr = _inline(dfields, k0, _get_namer(dnamespace, dglobalnames, dfields[k0]['func'], k0))
+        if expr is None:
+            # Fallback: the function is called
+            dnamespace[f'c_{k0}'] = (k0, None)
+            expr = f"c_{k0}({', '.join('f_' + k for k in dfields[k0]['kargs'])})"
+
+        if k0 in lstate:
+            lines.append(f'    f_{k0} = {expr}')
+            lines.append(f'    dbuffer[{k0!r}] = f_{k0}')
+        elif inplace:
+            lines.append(f'    dv[{k0!r}][...] = {expr}')
+        else:
+            lines.append(f'    dv[{k0!r}] = {expr}')
+    lines.append('    return dbuffer')
+
+    source = 'def _step(dbuffer, dv):\n' + '\n'.join(lines) + '\n'
+    return source, [(name, k0, gname) for name, (k0, gname) in dnamespace.items()]
+
+
+def compile_step(dfields, lode, lstate, inplace=True):
+    '''
+    Generate the function `step(dbuffer, dv)` computing all the state variables `lstate` inside `dbuffer`, then the derivatives
+    of the differential variables `lode` inside `dv`, in this order.
+
+    Parameters
+    ----------
+    dfields : dict
+        The big dictionnary with values and dependencies.
+    lode : list
+        Ordered list of the differential variables.
+    lstate : list
+        Ordered list of the state variables to compute.
+    inplace : bool, optional
+        If True, the derivatives are written inside the arrays of `dv` (`dv[k][...] = `), else `dv[k]` is replaced.
+        Default is True.
+
+    Returns
+    -------
+    function or None
+        The generated function, or None if the generated source does not compile or a global name used by an equation
+        is missing (a warning is printed, and the interpreted path is then used). Any other error is raised.
+
+    Notes
+    -----
+    The generated code only depends on the equations: it is cached with the code of each function,
+    and only its namespace (modules and functions used by the equations) is rebuilt for each hub.
+    The source can be read in `step.source`.
+    '''
+    lcomputed = lstate + lode
+    key = (tuple(lode), tuple(lstate), inplace) + tuple(_fingerprint(dfields[k]['func']) for k in lcomputed)
+    try:
+        if key not in _DCOMPILED:
+            source, lnamespace = _generate(dfields, lode, lstate, inplace)
+            _DCOMPILED[key] = (compile(source, '<chimes compiled step>', 'exec'), lnamespace, source)
+        code, lnamespace, source = _DCOMPILED[key]
+
+        namespace = {}
+        for name, k0, gname in lnamespace:
+            func = dfields[k0]['func']
+            namespace[name] = func if gname is None else func.__globals__[gname]
+        exec(code, namespace)
+    except (SyntaxError, KeyError) as err:
+        # A generated source that does not compile, or a global of an equation missing in its module
+        print(f'WARNING: the equations could not be fused ({err!r}), they are computed one by one')
+        return None
+    step = namespace['_step']
+    step.source = source
+    return step
+
+
+# Jitted loops for each set of equations, {fingerprint: (loop, read fields)}
+_DJIT = {}
+
+
+def _generate_scalar(dfields, lode, lstate):
+    '''
+    Source of the functions `_deriv(y, p, dy, s)` and `_loop(y, p, dt, nsteps, ys, ss)` in which every field is a scalar,
+    and the list of the read fields (in the order of `p`, after the differential variables).
+    Only numpy and math are allowed as globals. Returns None if an equation cannot be inlined.
+    '''
+    lread = [k for k in _get_read(dfields, lode, lstate) if k not in lode]
+    lines = [f'    f_{k} = y[{ii}]' for ii, k in enumerate(lode)]
+    lines += [f'    f_{k} = p[{ii}]' for ii, k in enumerate(lread)]
+    for k0 in lstate + lode:
+        dnamespace = {}
+        expr = _inline(dfields, k0, _get_namer(dnamespace, {}, dfields[k0]['func'], k0))
+        if expr is None:
+            return None
+        for name, (_, gname) in dnamespace.items():
+            if getattr(dfields[k0]['func'].__globals__[gname], '__name__', None) not in ['numpy', 'math']:
+                return None
+            expr = expr.replace(f'{name}.', f"{dfields[k0]['func'].__globals__[gname].__name__}.")
+        if k0 in lstate:
+            lines.append(f'    f_{k0} = {expr}')
+            lines.append(f'    s[{lstate.index(k0)}] = f_{k0}')
+        else:
+            lines.append(f'    dy[{lode.index(k0)}] = {expr}')
+
+    source = 'def _deriv(y, p, dy, s):\n' + '\n'.join(lines) + '\n'
+    # Same operations as `_solvers._rk4_flat`, the state variables are the ones of the last stage
+    source += '''
+
+def _loop(y, p, dt, nsteps, ys, ss):
+    n = y.shape[0]
+    k1 = np.empty(n)
+    k2 = np.empty(n)
+    k3 = np.empty(n)
+    k4 = np.empty(n)
+    ytmp = np.empty(n)
+    s = np.empty(ss.shape[1])
+    for ii in range(1, nsteps):
+        _deriv(y, p, k1, s)
+        for j in range(n):
+            ytmp[j] = k1[j] * dt / 2. + y[j]
+        _deriv(ytmp, p, k2, s)
+        for j in range(n):
+            ytmp[j] = k2[j] * dt / 2. + y[j]
+        _deriv(ytmp, p, k3, s)
+        for j in range(n):
+            ytmp[j] = k3[j] * dt + y[j]
+        _deriv(ytmp, p, k4, s)
+        for j in range(n):
+            y[j] += (k1[j] + k2[j] * 2 + k3[j] * 2 + k4[j]) * dt / 6
+        ys[ii, :] = y
+        ss[ii, :] = s
+'''
+    return source, lread
+
+
+def compile_loop_jit(dfields, lode, lstate):
+    '''
+    Generate the whole RK4 time loop of a model in which every field is a scalar, compiled with numba.
+
+    Parameters
+    ----------
+    dfields : dict
+        The big dictionnary with values and dependencies.
+    lode : list
+        Ordered list of the differential variables.
+    lstate : list
+        Ordered list of the state variables.
+
+    Returns
+    -------
+    tuple or None
+        (loop, lread), with `loop(y, p, dt, nsteps, ys, ss)` integrating `nsteps - 1` steps from the flat vector `y`
+        (updated in place), the parameters `p` being the values of the fields `lread`. The differential variables and
+        the state variables of each step are written in the rows of `ys` and `ss`.
+        None if numba is not installed, if a field is not a scalar, or if an equation uses something else than
+        arithmetic, numpy and math functions.
+
+    Notes
+    -----
+    The loop is compiled at its first call for each set of equations, and cached.
+    '''
+    try:
+        import numba
+    except ImportError:
+        return None
+    lcomputed = lstate + lode
+    key = (tuple(lode), tuple(lstate)) + tuple(_fingerprint(dfields[k]['func']) for k in lcomputed)
+    if key not in _DJIT:
+        out = None
+        try:
+            generated = _generate_scalar(dfields, lode, lstate)
+            if generated is not None:
+                source, lread = generated
+                import math
+                import numpy
+                namespace = {'np': numpy, 'numpy': numpy, 'math': math}
+                exec(compile(source, '<chimes jit loop>', 'exec'), namespace)
+                # numba resolves `_deriv` in the namespace when `_loop` is compiled
+                namespace['_deriv'] = numba.njit(error_model='numpy')(namespace['_deriv'])
+                out = (numba.njit(error_model='numpy')(namespace['_loop']), lread)
+        except Exception:
+            out = None
+        _DJIT[key] = out
+    return _DJIT[key]
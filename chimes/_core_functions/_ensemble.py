@@ -0,0 +1,214 @@
+"""
+Statistics of an ensemble of parallel runs (the `nx` axis), updated while the system is solved.
+
+The members are never stored: at each recorded step, the values of all the members of a field are merged
+into running statistics for this step. Ensembles larger than one run are done by batches whose statistics are merged.
+"""
+import numpy as np
+
+
+def _interp_columns(x, xp, fp):
+    '''
+    np.interp on each column: x (k, C), xp and fp (m, C) with x and xp sorted along the first axis.
+    Outside of xp, the values at the edges are taken.
+    '''
+    m, k = xp.shape[0], x.shape[0]
+    # number of xp <= x, from the position of x in the stable sort of both
+    order = np.argsort(np.concatenate([xp, x], axis=0), axis=0, kind='stable')
+    pos = np.empty_like(order)
+    np.put_along_axis(pos, order, np.broadcast_to(np.arange(m + k)[:, np.newaxis], order.shape), axis=0)
+    idx = np.clip(pos[m:] - np.arange(k)[:, np.newaxis], 1, m - 1)
+    x0 = np.take_along_axis(xp, idx - 1, axis=0)
+    x1 = np.take_along_axis(xp, idx, axis=0)
+    f0 = np.take_along_axis(fp, idx - 1, axis=0)
+    f1 = np.take_along_axis(fp, idx, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.where(x1 > x0, (x - x0) / (x1 - x0), 1.)
+    w = np.clip(w, 0, 1)
+    return f0 + w * (f1 - f0)
+
+
+class EnsembleStats:
+    '''
+    Running statistics over the members of an ensemble, for each field and each recorded step.
+
+    For each field, arrays with one row per recorded step and the shape of one member (nr, a, b):
+        * count, mean and M2 (sum of the squared deviations), merged with the parallel Welford formula (Chan et al.)
+        * min and max
+        * a quantile sketch: the values of the distribution at fixed levels (probabilities), that includes 0, 1 and
+          the requested `quantiles`. The sketch of a batch is exact (np.quantile), two sketches are merged through
+          their mixed cumulative distribution, so the quantiles are approximate once more than one batch is merged.
+    NaN values (diverging members) propagate into the statistics of their step, as with numpy reductions.
+    The memory is (number of levels + 4) values per recorded step and cell, 25 with the defaults: the one of the
+    trajectories of 25 members, so that the steps of smaller ensembles are better recorded less often.
+
+    Parameters
+    ----------
+    fields : list
+        Names of the fields.
+    nrows : int
+        Number of recorded steps.
+    quantiles : tuple, optional
+        Probabilities of the quantiles given by `get`. Default is (0.05, 0.25, 0.5, 0.75, 0.95).
+    nlevels : int, optional
+        Number of regularly spaced levels of the sketch (more is more precise when merging, and takes more memory).
+        Default is 21, every 5%.
+    buffersize : int, optional
+        The steps of a field are buffered and processed together up to this number of values (memory of the buffer).
+        Default is 2**20.
+    '''
+
+    def __init__(self, fields, nrows, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), nlevels=21, buffersize=2**20):
+        self.fields = list(fields)
+        self.nrows = int(nrows)
+        self.quantiles = tuple(float(q) for q in quantiles)
+        if any(q < 0 or q > 1 for q in self.quantiles):
+            raise Exception(f'quantiles are probabilities between 0 and 1, you gave {quantiles}')
+        # the regular levels that are the quantiles up to the rounding are replaced by them
+        quant = np.r_[self.quantiles, 0.5]
+        lin = np.linspace(0, 1, nlevels)
+        lin = lin[np.all(np.abs(lin[:, np.newaxis] - quant) > 1e-9, axis=1)]
+        self.levels = np.unique(np.r_[lin, quant])
+        self.buffersize = int(buffersize)
+        self.dstats = {}
+        self._dbuffer = {}
+
+    def _init(self, k0, shape):
+        nrows, nlev = self.nrows, len(self.levels)
+        self.dstats[k0] = {'count': np.zeros(nrows, dtype=int),
+                           'mean': np.full((nrows,) + shape, np.nan),
+                           'M2': np.full((nrows,) + shape, np.nan),
+                           'min': np.full((nrows,) + shape, np.nan),
+                           'max': np.full((nrows,) + shape, np.nan),
+                           'sketch': np.full((nrows, nlev) + shape, np.nan)}
+
+    def _merge_rows(self, k0, rows, n, mean, M2, vmin, vmax, sketch):
+        '''Merge the statistics of n[i] members in the row rows[i] of the field `k0`'''
+        S = self.dstats[k0]
+        na = S['count'][rows]
+        first = na == 0
+        for key, v in [('mean', mean), ('M2', M2), ('min', vmin), ('max', vmax), ('sketch', sketch)]:
+            S[key][rows[first]] = v[first]
+        S['count'][rows[first]] = n[first]
+        if np.all(first):
+            return
+        rows, na, n = rows[~first], na[~first], n[~first]
+        mean, M2, vmin, vmax, sketch = mean[~first], M2[~first], vmin[~first], vmax[~first], sketch[~first]
+
+        ntot = na + n
+        bshape = (-1,) + (1,) * (mean.ndim - 1)
+        delta = mean - S['mean'][rows]
+        S['mean'][rows] = S['mean'][rows] + delta * (n / ntot).reshape(bshape)
+        S['M2'][rows] = S['M2'][rows] + M2 + delta ** 2 * (na * n / ntot).reshape(bshape)
+        S['min'][rows] = np.minimum(S['min'][rows], vmin)
+        S['max'][rows] = np.maximum(S['max'][rows], vmax)
+        S['sketch'][rows] = self._merge_sketch(S['sketch'][rows], na, sketch, n)
+        S['count'][rows] = ntot
+
+    def _merge_sketch(self, qa, na, qb, nb):
+        '''
+        Values at the levels of the mixed distribution (na F_a + nb F_b) / (na + nb), each cumulative distribution F
+        being linear between the levels of its sketch. qa and qb are (rows, levels, ...), na and nb (rows,)
+        '''
+        nrows, nlev = qa.shape[:2]
+        shape = qa.shape
+        # levels on the first axis, one column per row and cell
+        qa = np.moveaxis(qa, 1, 0).reshape(nlev, -1)
+        qb = np.moveaxis(qb, 1, 0).reshape(nlev, -1)
+        ncell = qa.shape[1] // max(nrows, 1)
+        wa = np.repeat(na / (na + nb), ncell)
+        lev = np.broadcast_to(self.levels[:, np.newaxis], qa.shape)
+        X = np.sort(np.concatenate([qa, qb], axis=0), axis=0)
+        G = wa * _interp_columns(X, qa, lev) + (1 - wa) * _interp_columns(X, qb, lev)
+        out = _interp_columns(lev, G, X)
+        out[:, np.isnan(qa).any(axis=0) | np.isnan(qb).any(axis=0)] = np.nan
+        return np.moveaxis(out.reshape((nlev, nrows) + shape[2:]), 0, 1)
+
+    def _batch(self, values):
+        '''Statistics of the members of `values` (rows, nx, ...), the members being on the axis 1'''
+        nx = values.shape[1]
+        mean = np.mean(values, axis=1)
+        M2 = np.sum((values - mean[:, np.newaxis]) ** 2, axis=1)
+        # quantiles as np.quantile (linear), NaN being sorted at the end
+        S = np.sort(values, axis=1)
+        pos = self.levels * (nx - 1)
+        lo = np.floor(pos).astype(int)
+        hi = np.minimum(lo + 1, nx - 1)
+        frac = (pos - lo).reshape((1, -1) + (1,) * (values.ndim - 2))
+        sketch = S[:, lo] + frac * (S[:, hi] - S[:, lo])
+        isnan = np.isnan(S[:, -1])
+        sketch[np.broadcast_to(isnan[:, np.newaxis], sketch.shape)] = np.nan
+        vmin = np.where(isnan, np.nan, S[:, 0])
+        return mean, M2, vmin, np.where(isnan, np.nan, S[:, -1]), sketch
+
+    def update(self, k0, row, values):
+        '''Add all the members of `values` (nx, nr, a, b), the value of the field `k0` at the recorded step `row`'''
+        rows, lvalues = self._dbuffer.setdefault(k0, ([], []))
+        rows.append(row)
+        lvalues.append(np.array(values, dtype=float))
+        if len(rows) * lvalues[0].size >= self.buffersize:
+            self._flush(k0)
+
+    def _flush(self, k0):
+        rows, lvalues = self._dbuffer.pop(k0, ([], []))
+        if len(rows):
+            self.update_many(k0, rows, np.stack(lvalues))
+
+    def flush(self):
+        '''Process the buffered steps of all the fields'''
+        for k0 in list(self._dbuffer.keys()):
+            self._flush(k0)
+
+    def update_many(self, k0, rows, values):
+        '''Same as `update` for many steps, `values` (steps, nx, nr, a, b) having one row per step'''
+        values = np.asarray(values, dtype=float)
+        if k0 not in self.dstats:
+            self._init(k0, values.shape[2:])
+        rows = np.asarray(rows, dtype=int)
+        if len(np.unique(rows)) < len(rows):
+            # the same step more than once: one after the other
+            for row, v in zip(rows, values):
+                self.update_many(k0, [row], v[np.newaxis])
+            return
+        self._merge_rows(k0, rows, np.full(len(rows), values.shape[1]), *self._batch(values))
+
+    def truncate(self, nrows):
+        '''Keep only the first `nrows` recorded steps (a run that ended before its last step)'''
+        self.flush()
+        self.nrows = int(nrows)
+        for S in self.dstats.values():
+            for key in S.keys():
+                S[key] = S[key][:self.nrows]
+
+    def merge(self, other):
+        '''Merge the statistics of another ensemble (same fields, steps and levels) into this one'''
+        if other.nrows != self.nrows or not np.array_equal(other.levels, self.levels):
+            raise Exception('Ensemble statistics can only be merged with the same recorded steps and quantiles')
+        self.flush()
+        other.flush()
+        for k0, S in other.dstats.items():
+            if k0 not in self.dstats:
+                self._init(k0, S['mean'].shape[1:])
+            rows = np.nonzero(S['count'])[0]
+            self._merge_rows(k0, rows, S['count'][rows], S['mean'][rows], S['M2'][rows],
+                             S['min'][rows], S['max'][rows], S['sketch'][rows])
+        return self
+
+    def get(self, k0):
+        '''
+        Statistics of the field `k0`, arrays with the recorded steps on the first axis:
+        {'count', 'mean', 'stdv', 'min', 'max', 'median', 'quantiles': {probability: value}}
+        '''
+        self._flush(k0)
+        S = self.dstats[k0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            count = S['count'].reshape((-1,) + (1,) * (S['mean'].ndim - 1))
+            stdv = np.sqrt(S['M2'] / count)
+        dquant = {q: S['sketch'][:, np.searchsorted(self.levels, q), ...] for q in self.quantiles}
+        return {'count': S['count'],
+                'mean': S['mean'],
+                'stdv': stdv,
+                'min': S['min'],
+                'max': S['max'],
+                'median': S['sketch'][:, np.searchsorted(self.levels, 0.5), ...],
+                'quantiles': dquant}
@@ -1,7 +1,6 @@
 from .._core_functions import _utils, _utils
 import numpy as np
 import pandas as pd
-from .._core_functions import _Network
 import inspect
 
 
@@ -41,7 +40,7 @@ class getM:
         """
 
         d0 = self.dmisc['dmulti']
-        R = self.get_dfields()
+        R = self.get_dfields(returnas='view')
         OUT = {}
         for cat, liste in d0.items():
             if cat != 'NxNr':
@@ -70,7 +69,7 @@ class getM:
         2024/03/20
         """
 
-        R = self.get_dfields()
+        R = self.get_dfields(returnas='view')
         OUT = {}
         Dims = [field for field in R.keys() if R[field].get('eqtype', '') == 'size']
         for d in Dims:
@@ -195,11 +194,12 @@ class getM:
             If 'any', parameters that match any of the criteria will be selected. 
             Default is None, which means all parameters will be selected.
         returnas : type, optional
-            The type to return the selected parameters as. Can be dict, np.ndarray, list, or 'DataFrame'. 
-            If dict, returns a dictionary of the selected parameters. 
-            If np.ndarray, returns a dictionary of np.ndarrays of the selected parameters. 
+            The type to return the selected parameters as. Can be dict, list, or 'view'. 
+            If dict, returns a deep copy of the selected parameters. 
             If list, returns a list of the selected parameter keys. 
-            If 'DataFrame', returns a pandas DataFrame of the selected parameters. 
+            If 'view', returns the selected parameters without copy: arrays are read-only views on the hub values, 
+            and the other metadata are shared with the hub (do not modify them). 
+            Any other value falls back to dict. 
             Default is dict.
         verb : bool, optional
             If True, pretty-prints the selected parameters. Default is False.
@@ -223,6 +223,8 @@ class getM:
         It then selects the parameters from '_dfields' that match the specified criteria. 
         If verb is True, it pretty-prints the selected parameters. 
         Finally, it returns the selected parameters in the specified format.
+        Use returnas='view' (or the property `dfields_view`) for read-only access on big runs, 
+        as the default dict copies the whole time series.
 
         Author
         ------
@@ -234,11 +236,13 @@ class getM:
         """
         lcrit = ['key', 'dimension', 'units',
                  'type', 'group', 'eqtype', 'isneeded']
+        if returnas not in [dict, list, 'view']:
+            returnas = dict
 
         return _utils._get_dict_subset(
             indict=self._dfields,
             verb=False,
-            returnas=dict,
+            returnas=returnas,
             lcrit=lcrit,
             lprint=[],
             condition=condition,
@@ -378,7 +382,7 @@ class getM:
         ----
         2023
         """
-        R = self.get_dfields()
+        R = self.get_dfields(returnas='view')
 
         idx = np.arange(self.dmisc['dmulti']['NxNr'][0]) if idx is True else idx
         Region = np.arange(self.dmisc['dmulti']['NxNr'][1]) if Region is True else Region
@@ -391,16 +395,16 @@ class getM:
         statevars_and_diffs = self.dmisc['dfunc_order']['statevar'] + self.dmisc['dfunc_order']['differential']
 
         if len(self.dmisc['dmulti']['vector'] + self.dmisc['dmulti']['matrix']) < 1:
-            D = {k: R[k]['value'][:, idx, Region, 0, 0] for k in statevars_and_diffs}
+            D = {k: np.copy(R[k]['value'][:, idx, Region, 0, 0]) for k in statevars_and_diffs}
         elif len(self.dmisc['dmulti']['matrix']) == 0:
-            D = {k: R[k]['value'][:, idx, Region, :, 0] for k in statevars_and_diffs}
+            D = {k: np.copy(R[k]['value'][:, idx, Region, :, 0]) for k in statevars_and_diffs}
         else:
-            D = {k: R[k]['value'][:, idx, Region, :, :] for k in statevars_and_diffs}
+            D = {k: np.copy(R[k]['value'][:, idx, Region, :, :]) for k in statevars_and_diffs}
 
         if params:
             for k in self.dmisc['dfunc_order']['parameters']:
                 if not isinstance(R[k]['value'], (int, float)):
-                    D[k] = R[k]['value'].reshape(-1)
+                    D[k] = np.copy(R[k]['value'].reshape(-1))
 
         return D
 
@@ -533,7 +537,7 @@ class getM:
         2023
         """
         categories = ['definition', 'units', 'source_exp', 'com', 'group', 'symbol', 'isneeded', 'size', 'eqtype']
-        R = self.get_dfields()
+        R = self.get_dfields(returnas='view')
         # Rpandas = {k0: {k: v for k, v in R[k0].items() if k in categories} for k0 in R.keys()}
 
         Rpandas = {k0: {k: R[k0][k] for k, v in R[k0].items() if k in categories} for k0 in R.keys()}
@@ -602,11 +606,11 @@ class getM:
 
         # return df.transpose()
 
-        R0 = self.get_dfields()
+        R0 = self.get_dfields(returnas='view')
         if eqtype is False:
             R = R0
         else:
-            R = self.get_dfields(eqtype=eqtype)
+            R = self.get_dfields(eqtype=eqtype, returnas='view')
 
         # Time ids
         time = R0['time']['value'][:, 0, 0, 0, 0]
@@ -704,6 +708,49 @@ class getM:
             df = pd.DataFrame(newdict)
         return df.transpose()
 
+    def get_profile(self) -> pd.DataFrame:
+        """
+        Time spent in the function of each field during the last run, as measured by `run(profile=True)`.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per differential and state variable, sorted by cumulated time, with the columns:
+                * 'eqtype': differential or statevar
+                * 'calls': number of calls of the function
+                * 'time (s)': cumulated time inside the function
+                * 'ns/call': mean time of one call, in nanoseconds
+                * 'share': fraction of the run time spent inside the function
+                * 'bytes/call': mean size of the results (arrays allocated by the function)
+            The row 'solver' is the rest of the run: RK stages arithmetic, storage, checks, calls overhead.
+
+        Notes
+        -----
+        The functions are timed one by one, without the fusion of the equations of the usual runs: the absolute times
+        are higher, the shares show which equations dominate.
+        """
+        dprofile = self.dmisc.get('profile')
+        if dprofile is None:
+            raise Exception('No profile of the last run, use run(profile=True)')
+        R = self.get_dfields(returnas='view')
+        total = dprofile['total']
+        OUT = {}
+        for k0, (calls, ns, nbytes) in dprofile['fields'].items():
+            OUT[k0] = {'eqtype': R[k0]['eqtype'],
+                       'calls': calls,
+                       'time (s)': ns * 1e-9,
+                       'ns/call': ns / calls if calls else np.nan,
+                       'share': ns / total,
+                       'bytes/call': nbytes / calls if calls else np.nan}
+        rest = total - sum(v[1] for v in dprofile['fields'].values())
+        OUT['solver'] = {'eqtype': dprofile['solver'],
+                         'calls': dprofile['steps'],
+                         'time (s)': rest * 1e-9,
+                         'ns/call': rest / dprofile['steps'] if dprofile['steps'] else np.nan,
+                         'share': rest / total,
+                         'bytes/call': np.nan}
+        return pd.DataFrame.from_dict(OUT, orient='index').sort_values('time (s)', ascending=False)
+
     def get_Network(self,
                     filters=(),
                     auxilliary=False,
@@ -753,6 +800,7 @@ class getM:
         ----
         2023
         """
+        from .._core_functions import _Network
         return _Network.Network_pyvis(self,
                                       filters=filters,
                                       redirect=redirect,
@@ -807,7 +855,7 @@ class getM:
         """
 
         # Getting time vector
-        T = self.get_dfields(key=['time'])
+        T = self.get_dfields(key=['time'], returnas='view')
         vectime = T['time']['value'][:, 0, 0, 0]
 
         # Extracting values
@@ -815,7 +863,7 @@ class getM:
             idt = np.argmin(np.abs(vectime - t)) - 1
         else:
             idt = -1
-        R = self.get_dfields(key=('time', '__ONE__'))
+        R = self.get_dfields(key=('time', '__ONE__'), returnas='view')
 
         presetdict = {}
         for k, v in R.items():
@@ -823,9 +871,9 @@ class getM:
             if type in ['differential']:
                 presetdict[k] = v['value'][idt, :, :, :] * 1.
             elif type in ['parameters', None]:
-                presetdict[k] = v['value']
+                presetdict[k] = np.copy(v['value']) if isinstance(v['value'], np.ndarray) else v['value']
             elif type in ['size']:
-                presetdict[k] = v.get('list', v['value'])
+                presetdict[k] = list(v['list']) if 'list' in v else v['value']
         return presetdict
 
     def _short(self) -> None:
@@ -888,7 +936,7 @@ class getM:
                 print(f"{k.ljust(20)}{str(v['value']).ljust(20)}{v['definition']}")
 
         print(f"{20 * '#'} Dimensions {20 * '#'}")
-        sub = self.get_dfields(returnas=dict, eqtype=['size'],)
-        for k in list(sub.keys()):
+        sub = self.get_dfields(returnas=list, eqtype=['size'],)
+        for k in sub:
             v = Vals[k]
             print(f"{k.ljust(20)}{str(v['value']).ljust(20)}{v['definition']}")
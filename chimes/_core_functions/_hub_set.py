@@ -9,14 +9,16 @@ Created on Mon Mar 21 12:53:27 2022
 import numpy as np
 import inspect
 import functools
-# import os
-# import importlib
+import hashlib
+import os
+import importlib
 import copy
 import types
 
 # library specific
 from . import _hub_check
 from .. import libraries
+from ..libraries.operators_library import _issparse, _TOPOLOGIES
 from .._config import config
 
 # _LTYPES = config.get_current('_LTYPES')
@@ -30,6 +32,12 @@ from .._config import config
 # %% MAIN FUNCTION : LOAD MODEL
 
 
+# Structure of the models already loaded, {model: (address, hash of the file, compiled file, dmodel, dparam, dfunc_order)}
+_DSTRUCTURE = {}
+# Address of the model files, {(model, local model folder): address}
+_DADDRESS = {}
+
+
 def load_model(model=None, verb=None, from_user=None):
     """ Load a model from a model file
 
@@ -38,12 +46,62 @@ def load_model(model=None, verb=None, from_user=None):
             - from_user = False => loaded from the library
             - from_user = True => loaded the user's personal .chimes folder
         - the absolute path to an abitrary model file
+
+    The structure of the model (compiled model file, fields definitions and their arguments, order of the functions) is
+    cached with the hash of the model file. Each hub executes the compiled file in its own module, so that the state
+    defined in the file (objects, random draws...) is not shared between hubs, and binds the values and functions of
+    this module on the cached structure (see `_bind_structure`), then allocates its arrays.
+    The cache is built again when the model file changes.
     """
+    address, filehash = _model_file(model)
+    cached = _DSTRUCTURE.get(model)
+    if cached is None or cached[:2] != (address, filehash):
+        with open(address + '.py', 'rb') as f:
+            code = compile(f.read(), address + '.py', 'exec')
+        module = _exec_model(address, code)
+        _DSTRUCTURE[model] = (address, filehash, code) + _load_structure(model, module, verb=verb)
+    else:
+        module = _exec_model(address, cached[2])
+    dmodel = load_dmodel(model, module=module)
+    dmodel, dparam, dfunc_order = _bind_structure(*_DSTRUCTURE[model][3:], dmodel)
+
+    # Initial values and shapes
+    dparam = set_shapes_values(dparam, dfunc_order, verb=verb)
+
+    # Big dictionnary of pointers
+    dargs = get_dargs_by_reference(dparam, dfunc_order=dfunc_order)
+
+    return dmodel, dparam, dfunc_order, dargs
+
+
+def _model_file(model):
+    ''' Address (without .py) and hash of the file of `model` '''
+    key = (model, config.get_current('_LOCAL_MODEL'))
+    address = _DADDRESS.get(key)
+    if address is None or not os.path.isfile(address + '.py'):
+        address = list(libraries._scan_modelfolders(model).keys())[0]
+        _DADDRESS[key] = address
+    with open(address + '.py', 'rb') as f:
+        return address, hashlib.sha1(f.read()).hexdigest()
+
+
+def _exec_model(address, code):
+    ''' New module of the model file at `address`, executed from its compiled `code` '''
+    spec = importlib.util.spec_from_file_location(address, address + '.py')
+    module = importlib.util.module_from_spec(spec)
+    exec(code, module.__dict__)
+    return module
 
+
+def _load_structure(model, module, verb=None):
+    '''
+    Structural phase of `load_model`: model file, fields definitions and their arguments, order of the functions.
+    Returns (dmodel, dparam, dfunc_order), the values are not shaped yet
+    '''
     # LOAD THE FILE AND THE LIBRARY ###########################################
     # _hub_check_2.model_name(model, from_user, verb=verb)
 
-    dmodel = load_dmodel(model, from_user=None)
+    dmodel = load_dmodel(model, from_user=None, module=module)
 
     dfields = load_complete_DFIELDS(dmodel, verb=verb)
     _hub_check.dmodel(dmodel)
@@ -59,14 +117,71 @@ def load_model(model=None, verb=None, from_user=None):
     dfunc_order['parameters'] = lparam
 
     # _hub_check_2.dparam(dparam)
+    return dmodel, dparam, dfunc_order
 
-    # Initial values and shapes
-    dparam = set_shapes_values(dparam, dfunc_order, verb=verb)
-
-    # Big dictionnary of pointers
-    dargs = get_dargs_by_reference(dparam, dfunc_order=dfunc_order)
 
-    return dmodel, dparam, dfunc_order, dargs
+def _clone_function(func, dglobals=None):
+    '''
+    New function object with the same code, so that its defaults can be changed independently.
+    Its globals are the ones of `dglobals` (by id of the globals of `func`) if they are there.
+    '''
+    fglobals = func.__globals__ if dglobals is None else dglobals.get(id(func.__globals__), func.__globals__)
+    new = types.FunctionType(func.__code__, fglobals, func.__name__, func.__defaults__, func.__closure__)
+    new.__kwdefaults__ = func.__kwdefaults__
+    new.__qualname__ = func.__qualname__
+    new.__dict__.update(func.__dict__)
+    return new
+
+
+def _pair_objects(old, new, dout):
+    ''' Fill dout {id of an object of `old`: object at the same place in `new`}, for the mutable objects and functions '''
+    if isinstance(old, dict) and isinstance(new, dict):
+        for k, v in old.items():
+            if k in new:
+                _pair_objects(v, new[k], dout)
+    elif not isinstance(old, (type(None), bool, int, float, complex, str, tuple)):
+        dout[id(old)] = new
+    return dout
+
+
+def _bind_structure(dmodel, dparam, dfunc_order, dmodel_new):
+    '''
+    Copy of a cached structure for a new hub: the definitions are shared, the values, sectors lists and functions
+    (whose defaults are the values of the hub, see `_update_func_default_kwdargs`) are its own.
+    The ones defined in the model file are taken in `dmodel_new`, the model of the module executed for this hub,
+    the other ones are copied.
+    '''
+    dnew = _pair_objects(dmodel['logics'], dmodel_new['logics'], {})
+    dglobals = {id(f.__globals__): dnew[id(f)].__globals__ for f in [v.get('func') for v in dparam.values()]
+                if isinstance(f, types.FunctionType) and isinstance(dnew.get(id(f)), types.FunctionType)}
+    dparam2 = {}
+    for k0, v0 in dparam.items():
+        v = dict(v0)
+        for key in ['value', 'initial', 'list']:
+            if key in v:
+                v[key] = dnew[id(v[key])] if id(v[key]) in dnew else copy.deepcopy(v[key])
+        if id(v.get('func')) in dnew:
+            v['func'] = dnew[id(v['func'])]
+        elif isinstance(v.get('func'), types.FunctionType):
+            v['func'] = _clone_function(v['func'], dglobals)
+        dparam2[k0] = v
+    return dmodel_new, dparam2, copy.deepcopy(dfunc_order)
+
+
+def _own_module(model, dparam):
+    '''
+    Functions of `dparam` (of a copy of a hub, see `Hub.copy`) bound to a new module of the cached file of `model`,
+    so that the copy does not share the state defined in the model file with the hub. Returns dparam
+    '''
+    address, _, code = _DSTRUCTURE[model][:3]
+    module = _exec_model(address, code)
+    lfunc = [k0 for k0, v0 in dparam.items() if isinstance(v0.get('func'), types.FunctionType)
+             and v0['func'].__globals__.get('__name__') == address]
+    if len(lfunc):
+        dglobals = {id(dparam[lfunc[0]]['func'].__globals__): module.__dict__}
+        for k0 in lfunc:
+            dparam[k0]['func'] = _clone_function(dparam[k0]['func'], dglobals)
+    return dparam
 
 # #############################################################################
 # ###########                 SUB FUNCTION                        #############
@@ -75,11 +190,14 @@ def load_model(model=None, verb=None, from_user=None):
 # %% 1) LOAD_DMODEL
 
 
-def load_dmodel(model, from_user=False):
+def load_dmodel(model, from_user=False, module=None):
     """
-    Load the model from its file
+    Load the model from its file, or from its executed `module` if given
     """
-    _DMODEL = libraries._get_DMODEL(model)
+    if module is None:
+        _DMODEL = libraries._get_DMODEL(model)
+    else:
+        _DMODEL = {model: libraries._module_to_dmodel(module, model, module.__name__)}
 
     if model not in _DMODEL.keys():
         modellist = "".join(['* ' + str(f) + "\n" for f in list(_DMODEL.keys())])
@@ -91,7 +209,9 @@ def load_dmodel(model, from_user=False):
 
     # %% Complete size vector
     for k, v in dmodel['logics'].get('size', {}).items():
-        if 'value' not in v.keys():
+        if isinstance(v.get('value'), _TOPOLOGIES):
+            v['list'] = [str(v['value'])]
+        elif 'value' not in v.keys():
             v['value'] = len(v['list'])
         elif 'list' not in v.keys():
             v['list'] = [i for i in range(v['value'])]
@@ -428,12 +548,15 @@ def set_args_auxilliary(dparam, verb=False):
 def set_func_order(dparam, verb=False):
     '''
     Find equation resolution order
+
+    The functions of each group are sorted on the graph of their dependencies within the group.
+    dfunc_order['levels'][eqtype] groups them by dependency level: the functions of a level only depend on the
+    functions of the previous levels, and can be evaluated together.
     '''
     # %% a) subroutine for each group
-    dfunc_order = {
-        k0: _suggest_funct_order_by_group(eqtype=k0, dparam=dparam)
-        for k0 in ['parameter', 'statevar', 'differential']
-    }
+    dfunc_order, dlevels = {}, {}
+    for k0 in ['parameter', 'statevar', 'differential']:
+        dfunc_order[k0], dlevels[k0] = _suggest_funct_order_by_group(eqtype=k0, dparam=dparam)
 
     if verb is True:
         lstr = [f'\t- {k0}: {v0}' for k0, v0 in dfunc_order.items()]
@@ -441,53 +564,92 @@ def set_func_order(dparam, verb=False):
             "The following order has been determined for functions:\n" + "\n".join(lstr)
         )
         print(msg)
+    dfunc_order['levels'] = dlevels
     return dfunc_order
 
 
+def _find_cycle(lremain, ddeps):
+    '''
+    A cycle among the functions `lremain` that could not be sorted, each of them depending on at least another one.
+    Returns the list of the fields of the cycle, the first one being repeated at the end
+    '''
+    remain = set(lremain)
+    path, seen = [], {}
+    kk = lremain[0]
+    while kk not in seen:
+        seen[kk] = len(path)
+        path.append(kk)
+        kk = next(k1 for k1 in ddeps[kk] if k1 in remain)
+    return path[seen[kk]:] + [kk]
+
+
 def _suggest_funct_order_by_group(eqtype=None, dparam=None):
     """ Here we find a natural order for function of the same group
 
+    Kahn ordering on the graph of the dependencies within the group, linear in the number of dependencies.
+    The order is the one of successive passes on the functions in their order of definition, each pass taking
+    the functions whose dependencies are already sorted.
+
+    Returns
+    -------
+    lfsort : list
+        the functions in an order of resolution
+    levels : list
+        lists of functions by dependency level (0: no dependency in the group)
     """
 
     # Prepare list of relevant functsions
     lf = [kk for kk, vv in dparam.items() if vv.get('eqtype') == eqtype]
+    dpos = {kk: ii for ii, kk in enumerate(lf)}
+    ddeps = {kk: list(dict.fromkeys(dparam[kk]['args'][eqtype])) for kk in lf}
 
     try:
-        lfsort = []
-        keepon = True
-        ntry = 0
-        while keepon:
-
-            # Identify func that can be sorted
-            for kk in lf:
-                if kk in lfsort:
-                    continue
-                elif len(dparam[kk]['args'][eqtype]) == 0:
-                    lfsort.append(kk)
-                elif all([k1 in lfsort for k1 in dparam[kk]['args'][eqtype]]):
-                    lfsort.append(kk)
-
-            # evaluate termination condition
-            ntry += 1
-            if set(lf) == set(lfsort):
-                keepon = False
-            elif ntry == len(lf) - 1:
-                msg = f"No sorting order of func could be found for {eqtype}"
-                msg += f"Sorted :{lfsort} \n remaining {list(set(lf)-set(lfsort))}"
-                raise Exception(msg)
+        unknown = {kk: [k1 for k1 in v if k1 not in dpos] for kk, v in ddeps.items()}
+        unknown = {kk: v for kk, v in unknown.items() if len(v)}
+        if len(unknown):
+            raise Exception(f"No sorting order of func could be found for {eqtype}: dependencies on fields "
+                            f"that are not {eqtype} {unknown}")
+
+        # Kahn: number of unsorted dependencies, and reverse edges
+        dcount = {kk: len(v) for kk, v in ddeps.items()}
+        dchild = {kk: [] for kk in lf}
+        for kk, v in ddeps.items():
+            for k1 in v:
+                dchild[k1].append(kk)
+        stack = [kk for kk in reversed(lf) if dcount[kk] == 0]
+        dpass, dlevel = {}, {}
+        while stack:
+            kk = stack.pop()
+            # pass in which the function is sorted: after all its dependencies, one more if one comes after it
+            dpass[kk] = max([dpass[k1] + (dpos[k1] > dpos[kk]) for k1 in ddeps[kk]], default=1)
+            dlevel[kk] = max([dlevel[k1] + 1 for k1 in ddeps[kk]], default=0)
+            for k1 in dchild[kk]:
+                dcount[k1] -= 1
+                if dcount[k1] == 0:
+                    stack.append(k1)
+
+        if len(dpass) < len(lf):
+            lremain = [kk for kk in lf if kk not in dpass]
+            cycle = _find_cycle(lremain, ddeps)
+            msg = f"No sorting order of func could be found for {eqtype}, cyclic dependency: {' -> '.join(cycle)}\n"
+            msg += f"Sorted :{[kk for kk in lf if kk in dpass]} \n remaining {lremain}"
+            raise Exception(msg)
+
+        lfsort = sorted(lf, key=lambda kk: (dpass[kk], dpos[kk]))
+        levels = [[] for ii in range(max(dlevel.values(), default=-1) + 1)]
+        for kk in lfsort:
+            levels[dlevel[kk]].append(kk)
 
     except Exception as err:
         if eqtype == 'differential':
-            # function order not necessary => pick any order
-            lfsort = [
-                kk for kk, vv in dparam.items()
-                if vv.get('eqtype') == eqtype
-            ]
+            # function order not necessary => pick any order, all evaluated from the same state
+            lfsort = list(lf)
+            levels = [list(lf)] if len(lf) else []
         else:
             # For 'statevar' and 'parameter' a function order is necessary => raise
             raise err
 
-    return lfsort
+    return lfsort, levels
 
 # %% 8) GET DARCS
 
@@ -515,7 +677,80 @@ def get_dargs_by_reference(dparam, dfunc_order):
 # %% 8) INITIALISE SHAPE
 
 
-def set_shapes_values(dparam, dfunc_order, verb=True):
+def _allocate_timeseries(k0, shape, storage=None, record=None):
+    '''
+    Array of nan for the time series of `k0`.
+    If `storage` is a folder, the array is a memory-mapped .npy file in it, written directly by the solver.
+    If `record` is given, only the steps in record['steps'] are kept. A field that is not in record['fields']
+    has the memory of one time step, repeated along the time axis.
+    '''
+    if record is not None:
+        shape = (len(record['steps']),) + tuple(shape[1:])
+        if k0 not in record['fields']:
+            row = np.full((1,) + shape[1:], np.nan)
+            return np.lib.stride_tricks.as_strided(row, shape=shape, strides=(0,) + row.strides[1:], writeable=True)
+    if storage is None:
+        return np.full(shape, np.nan)
+    fname = os.path.join(storage, f'{k0}.npy')
+    if os.path.isfile(fname):
+        # Arrays still mapped on the previous file keep their data
+        os.remove(fname)
+    value = np.lib.format.open_memmap(fname, mode='w+', dtype=float, shape=shape)
+    value[...] = np.nan
+    return value
+
+
+def _share(value):
+    '''
+    Read-only view of a time series, shared between a hub and its copies (see `setM.copy`)
+    '''
+    view = value.view()
+    view.flags.writeable = False
+    return view
+
+
+def own_timeseries(dparam, keys, shared=None):
+    '''
+    Make the time series `keys` writable before they are written: the ones shared with a copy of the hub (read-only
+    in the copy, and in the set `shared` of the hub that was copied, see `setM.copy`) are copied, a one-step record
+    keeping its memory of one step.
+
+    Returns True if a time series was copied: the references of `get_dargs_by_reference` must then be updated.
+    '''
+    copied = False
+    for k0 in keys:
+        value = dparam[k0]['value']
+        if value.flags.writeable and not (shared and k0 in shared):
+            continue
+        if shared:
+            shared.discard(k0)
+        if value.ndim and value.strides[0] == 0:
+            row = np.array(value[:1])
+            value = np.lib.stride_tricks.as_strided(row, shape=value.shape, strides=(0,) + row.strides[1:], writeable=True)
+        else:
+            value = np.array(value)
+        dparam[k0]['value'] = value
+        copied = True
+    return copied
+
+
+def _reusable(value, shape):
+    '''
+    True if the array `value` can be kept instead of a new allocation of `shape`:
+    a plain array in RAM owning its memory (not a view, a memory-map or a one-step record), of the same shape
+    '''
+    return (type(value) is np.ndarray and value.base is None and value.flags.writeable
+            and value.dtype == float and value.shape == tuple(shape))
+
+
+def set_shapes_values(dparam, dfunc_order, verb=True, storage=None, record=None):
+    '''
+    Compute the function-parameters, then give their shape to the time series and parameters.
+
+    The update is incremental: the time series whose shape did not change keep their array (and its values, that
+    `reset` overwrites), the parameters and initial conditions that already have their shape are not copied.
+    Only the arrays whose shape changed are allocated.
+    '''
 
     # run all parameters func to set their values
     for k0 in dfunc_order['parameter']:
@@ -546,23 +781,31 @@ def set_shapes_values(dparam, dfunc_order, verb=True):
     for k0 in lfunc:
         sizes = [dparam[f]['value'] for f in dparam[k0]['size']]
 
-        shape = tuple(np.r_[dparam['nt']['value'],  # Time dimension
-                            dparam['nx']['value'],  # Parrallel
-                            dparam['nr']['value'],  # Regions
-                            sizes
-                            ])
+        shape = tuple(int(v) for v in [dparam['nt']['value'],  # Time dimension
+                                       dparam['nx']['value'],  # Parrallel
+                                       dparam['nr']['value'],  # Regions
+                                       *sizes])
 
         if dparam[k0]['eqtype'] not in ['parameter']:
-            dparam[k0]['value'] = np.full(shape, np.nan)
-        if dparam[k0]['eqtype'] == 'differential':
+            if record is not None:
+                shape = (len(record['steps']),) + shape[1:]
+            if not (storage is None and (record is None or k0 in record['fields'])
+                    and _reusable(dparam[k0]['value'], shape)):
+                dparam[k0]['value'] = _allocate_timeseries(k0, shape, storage=storage, record=record)
+        if dparam[k0]['eqtype'] == 'differential' and np.shape(dparam[k0]['initial']) != shape[1:]:
             dparam[k0]['initial'] = np.full(shape[1:], dparam[k0]['initial'])
 
     for k0 in lpar:
+        # Sparse coupling matrices are kept as they are
+        if _issparse(dparam[k0]['value']):
+            continue
         sizes = [dparam[f]['value'] for f in dparam[k0]['size']]
-        shape = tuple(np.r_[dparam['nx']['value'],  # Parrallel
-                            dparam['nr']['value'],  # Regions
-                            sizes
-                            ])
+        shape = tuple(int(v) for v in [dparam['nx']['value'],  # Parrallel
+                                       dparam['nr']['value'],  # Regions
+                                       *sizes])
+
+        if isinstance(dparam[k0]['value'], np.ndarray) and dparam[k0]['value'].shape == shape:
+            continue
 
         # THIS PART SHOULD BE REMOVED, BAD PATCH
         if len(shape) == len(np.shape(dparam[k0]['value'])):
@@ -1,6 +1,149 @@
 import os
+import json
 import cloudpickle
+import numpy as np
 from .._config import config  # _SAVE_FOLDER
+from . import _hub_set
+from ._ensemble import EnsembleStats
+from ..libraries import operators_library
+
+# Version of the columnar (.npz) save format
+_NPZ_VERSION = 1
+
+
+def _to_json(obj):
+    ''' json serialization of numpy types '''
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, operators_library._TOPOLOGIES):
+        return {'__topology__': type(obj).__name__, 'args': obj.todict()}
+    raise TypeError(f'{type(obj)} is not serializable')
+
+
+def _save_npz(hub, address, description=''):
+    '''
+    Save `hub` as a compressed .npz file: one array per time series, plus a json manifest in '__manifest__'.
+    The set_fields values that are arrays (parameters, initial conditions) are stored as '__set__/<field>',
+    sparse matrices as their csr arrays '__sparse__/<field>/<data, indices, indptr, shape>'.
+    Fields that are not recorded (see `run(record=...)`) are not saved.
+    The ensemble statistics of a `stats` run (dmisc['ensemble']) are stored as '__ensemble__/<field>/<statistic>',
+    with the levels of their quantile sketch in '__ensemble__/levels'.
+    '''
+    from .._parallel import _hub_to_spec
+    spec = _hub_to_spec(hub)
+    record = hub.dmisc.get('record')
+
+    darrays = {}
+    fields = {}
+    for k, v in spec['fields'].items():
+        if isinstance(v, np.ndarray):
+            darrays[f'__set__/{k}'] = v
+        elif _hub_set._issparse(v):
+            v = v.tocsr()
+            for attr in ['data', 'indices', 'indptr', 'shape']:
+                darrays[f'__sparse__/{k}/{attr}'] = np.asarray(getattr(v, attr))
+        else:
+            fields[k] = v
+    lts = hub.dmisc['dfunc_order']['differential'] + hub.dmisc['dfunc_order']['statevar']
+    for k in lts:
+        if record is None or k in record['fields']:
+            darrays[k] = hub._dfields[k]['value']
+    ensemble = hub.dmisc.get('ensemble')
+    if ensemble is not None:
+        ensemble.flush()
+        darrays['__ensemble__/levels'] = ensemble.levels
+        for k0, S in ensemble.dstats.items():
+            for key, v in S.items():
+                darrays[f'__ensemble__/{k0}/{key}'] = v
+
+    manifest = {'format': 'chimes-npz',
+                'version': _NPZ_VERSION,
+                'model': spec['model'],
+                'preset': spec['preset'],
+                'description': description,
+                'fields': fields,
+                'arrays': [k for k in darrays.keys() if k.startswith('__set__/')],
+                'sparse': [k for k, v in spec['fields'].items() if _hub_set._issparse(v)],
+                'timeseries': [k for k in lts if k in darrays.keys()],
+                'dflags': hub.dflags,
+                'solver': hub.dmisc.get('solver'),
+                'terminated': hub.dmisc.get('terminated'),
+                'converged': hub.dmisc.get('converged'),
+                'record': record,
+                'ensemble': None if ensemble is None else {'fields': ensemble.fields,
+                                                           'nrows': ensemble.nrows,
+                                                           'quantiles': ensemble.quantiles,
+                                                           'stats': list(ensemble.dstats.keys())}}
+    darrays['__manifest__'] = np.array(json.dumps(manifest, default=_to_json))
+    np.savez_compressed(address, **darrays)
+
+
+def _read_npz_manifest(address) -> dict:
+    ''' Read only the manifest of a .npz save '''
+    with np.load(address, allow_pickle=False) as data:
+        return json.loads(str(data['__manifest__']))
+
+
+def _read_npz_fields(address, fields) -> dict:
+    ''' Read only the arrays of `fields` in a .npz save, without rebuilding the hub '''
+    with np.load(address, allow_pickle=False) as data:
+        missing = [k for k in fields if k not in data.files]
+        if len(missing):
+            raise Exception(f'{missing} not in the save, available: {[k for k in data.files if not k.startswith("__")]}')
+        return {k: data[k] for k in fields}
+
+
+def _load_npz(address):
+    '''
+    Rebuild a hub from a .npz save: the model file is loaded again, with the preset and the saved set_fields values,
+    then the time series and the ensemble statistics are put back.
+    '''
+    from .._core import Hub
+    from ._calculate_methods import _set_ensemble
+    with np.load(address, allow_pickle=False) as data:
+        manifest = json.loads(str(data['__manifest__']))
+        fields = {k: getattr(operators_library, v['__topology__'])(**v['args']) if isinstance(v, dict) and '__topology__' in v else v
+                  for k, v in manifest['fields'].items()}
+        fields.update({k.split('/', 1)[1]: data[k] for k in manifest['arrays']})
+        if len(manifest.get('sparse', [])):
+            import scipy.sparse
+            for k in manifest['sparse']:
+                fields[k] = scipy.sparse.csr_matrix(tuple(data[f'__sparse__/{k}/{attr}'] for attr in ['data', 'indices', 'indptr']),
+                                                    shape=tuple(data[f'__sparse__/{k}/shape']))
+
+        hub = Hub(manifest['model'], preset=manifest['preset'], verb=False)
+        hub.set_fields(**fields, verb=False)
+
+        record = manifest['record']
+        if record is not None:
+            record = {'fields': record['fields'], 'steps': np.array(record['steps'])}
+        nt = data['time'].shape[0]
+        for k in hub.dmisc['dfunc_order']['differential'] + hub.dmisc['dfunc_order']['statevar']:
+            if k in manifest['timeseries']:
+                hub._dfields[k]['value'] = data[k]
+            else:
+                shape = (nt,) + np.shape(hub._dfields[k]['value'])[1:]
+                hub._dfields[k]['value'] = _hub_set._allocate_timeseries(k, shape, record=record)
+
+        densemble = manifest.get('ensemble')
+        if densemble is not None:
+            ensemble = EnsembleStats(densemble['fields'], densemble['nrows'], quantiles=densemble['quantiles'])
+            ensemble.levels = data['__ensemble__/levels']
+            ensemble.dstats = {k0: {key: data[f'__ensemble__/{k0}/{key}'] for key in ['count', 'mean', 'M2', 'min', 'max', 'sketch']}
+                               for k0 in densemble['stats']}
+
+    hub._dflags.update(manifest['dflags'])
+    hub._dmisc['record'] = record
+    hub._dmisc['solver'] = manifest['solver']
+    hub._dmisc['reset'] = False
+    for key in ['terminated', 'converged']:
+        if manifest.get(key) is not None:
+            hub._dmisc[key] = np.array(manifest[key], dtype=float)
+    if densemble is not None:
+        _set_ensemble(hub, ensemble)
+    return hub, manifest['description']
 
 
 class saveM:
@@ -13,15 +156,19 @@ class saveM:
              relativeaddress=True,
              verb=False):
         """
-        Save the current state of the hub as a .chm file for later use.
+        Save the current state of the hub as a .chm or .npz file for later use.
 
-        This function serializes the hub object and saves it to a .chm file. The file can be loaded later using `chm.load(name)`.
+        With a .chm extension (default), this function serializes the whole hub object with cloudpickle.
+        With a .npz extension, each time series is written as a compressed array, with a json manifest 
+        (model, preset, changed fields, flags, description). The hub is rebuilt from the model file on load, 
+        a single variable can be read with `chm.load_saved_fields`, and the file does not depend on the python version.
+        The files can be loaded later using `chm.load_saved(name)`.
 
         Parameters
         ----------
         name : str
             The name of the file to save. If a path is provided, the file will be saved at that location. 
-            The .chm extension is added automatically if not provided.
+            The .chm extension is added automatically if not provided, use .npz for the columnar format.
         description : str, optional
             A description of the run. Default is an empty string.
         relativeaddress : bool, optional
@@ -37,14 +184,17 @@ class saveM:
         Raises
         ------
         Exception
-            If the file extension provided in `name` is not .chm or no extension is provided, an exception is raised with the message 
-            "extension not understood :{extension}, expected .chm or nothing".
+            If the file extension provided in `name` is not .chm, .npz or no extension is provided, an exception is raised with the message 
+            "extension not understood :{extension}, expected .chm, .npz or nothing".
 
         Notes
         -----
-        The function first checks the file extension and raises an exception if it's not .chm or no extension is provided. 
+        The function first checks the file extension and raises an exception if it's not .chm, .npz or no extension is provided. 
         It then determines the save location based on the value of `relativeaddress`. 
         It opens the file at the save location in write mode and dumps the hub object and description into the file using cloudpickle.
+        The .npz format keeps the time series, the fields changed by `set_fields` or the preset, and the ensemble statistics
+        of a `stats` run: the other analysis results stored in the hub (sensitivity, cycles...) have to be computed again
+        after loading.
 
         Author
         ------
@@ -62,18 +212,24 @@ class saveM:
         _PATH_SAVE = os.path.join(os.path.dirname(os.path.dirname(_PATH_HERE)), _SAVE_FOLDER)
 
         # Extension management
-        if (name[-4:] != '.chm' and '.' not in name):
+        if (name[-4:] not in ['.chm', '.npz'] and '.' not in name):
             name = name + '.chm'
-        if name[-4:] == '.chm':
+        if name[-4:] in ['.chm', '.npz']:
             pass
         elif '.' in name:
-            raise Exception(f"extension not understood :{name.split('.')[1]}, expected .chm or nothing")
+            raise Exception(f"extension not understood :{name.split('.')[1]}, expected .chm, .npz or nothing")
 
         if relativeaddress:
             address = os.path.join(_PATH_SAVE, name)
         else:
             address = name
         # Saving
+        if address[-4:] == '.npz':
+            if verb:
+                print('File will be saved as : ', address)
+                print('Associated description: ', description)
+            _save_npz(self, address, description=description)
+            return
         with open(address, 'wb') as f:
             if verb:
                 print('File will be saved as : ', address)
@@ -1,7 +1,10 @@
 from .._config import config
 from .._core_functions import _hub_set
+from ..libraries.operators_library import _TOPOLOGIES
 import numpy as np
 import copy
+import os
+import tempfile
 """
 This file contains the methods to set fields, values and dimensions in the Hub object.
 All the methods are inside a class called setM, which is a child of the Hub class.
@@ -95,8 +98,20 @@ def _set_dimensions(self, verb=config.get_current('_VERB'), **kwargs):
     OLD
     """
     # we scan all fields that will need to have their values changed
-    setofdimensions = set(['nr', 'nx', 'dt', 'Tini', 'Tsim'] + list(self.get_dfields(eqtype=['size'])))
-    diffparam = set(self.get_dfields(eqtype=['differential', None])) - set(['__ONE__', 'time']) - setofdimensions
+    setofdimensions = set(['nr', 'nx', 'dt', 'Tini', 'Tsim'] + self.get_dfields(eqtype=['size'], returnas=list))
+    diffparam = set(self.get_dfields(eqtype=['differential', None], returnas=list)) - set(['__ONE__', 'time']) - setofdimensions
+
+    # A topology (Operators.Grid, Operators.Network) gives the sizes of its dimensions (nr, number of nodes and edges...)
+    for kk, vv in list(kwargs.items()):
+        if isinstance(vv, _TOPOLOGIES):
+            for dim, size in vv.dimensions.items():
+                if dim not in self._dfields:
+                    raise Exception(f"{kk} sets the size {dim}, which is not a field of the model")
+                if dim not in kwargs:
+                    if self._dfields[dim]['value'] != size:
+                        kwargs[dim] = size
+                elif (len(kwargs[dim]) if type(kwargs[dim]) is list else kwargs[dim]) != size:
+                    raise Exception(f"{kk} has {dim}={size}, but you gave {dim}={kwargs[dim]}")
 
     for kk in list(diffparam):
         V = self._dfields[kk]
@@ -120,13 +135,18 @@ def _set_dimensions(self, verb=config.get_current('_VERB'), **kwargs):
             elif type(vv) in [float, int]:
                 self._dfields[kk]['value'] = vv
                 self._dfields[kk]['list'] = list(np.arange(vv))
+            elif isinstance(vv, _TOPOLOGIES):
+                self._dfields[kk]['value'] = vv
+                self._dfields[kk]['list'] = [str(vv)]
             if verb:
                 print(f"Now {kk} has {self._dfields[kk]['value']} sectors with names {self._dfields[kk]['list']}")
         # Else, we just change values
         else:
             self._dfields[kk]['value'] = vv
 
-    self._dfields = _hub_set.set_shapes_values(self._dfields, self._dmisc['dfunc_order'])
+    self._dfields = _hub_set.set_shapes_values(self._dfields, self._dmisc['dfunc_order'],
+                                               storage=self._dmisc.get('storage'),
+                                               record=self._dmisc.get('record'))
     self._dargs = _hub_set.get_dargs_by_reference(self._dfields, self._dmisc['dfunc_order'])
     return self
 
@@ -160,6 +180,8 @@ def _set_fields(self, noreset=False, verb=config.get_current('_VERB'), **kwargs)
     Otherwise, it simply sets the new value to the parameter.
 
     If `noreset` is `False`, it reinitializes the shapes and dimensions of the parameters, gets the arguments by reference, and resets the data structure. 
+    Only the arrays whose shape changed are allocated again, the other ones are reset in place (see `_hub_set.set_shapes_values`): 
+    the views given by `get_dfields` follow the new values.
     Otherwise, it sets the new value to the current run of the parameter.
 
     Author
@@ -172,9 +194,9 @@ def _set_fields(self, noreset=False, verb=config.get_current('_VERB'), **kwargs)
     """
     # Get list of variables that might need a reshape
     # Exclude numerical parameters
-    parametersandifferential = list(set(self.get_dfields(eqtype=['differential', None]))
+    parametersandifferential = list(set(self.get_dfields(eqtype=['differential', None], returnas=list))
                                     - set(['__ONE__', 'time'])
-                                    - set(['nr', 'nx', 'dt', 'Tini', 'Tsim'] + list(self.get_dfields(eqtype=['size']))))
+                                    - set(['nr', 'nx', 'dt', 'Tini', 'Tsim'] + self.get_dfields(eqtype=['size'], returnas=list)))
 
     # Determine where the value of each parameter is located
     # If the parameter is of type 'differential', its value is located in 'initial'
@@ -222,6 +244,11 @@ def _set_fields(self, noreset=False, verb=config.get_current('_VERB'), **kwargs)
                     newvalue[kk] = __deep_set_fields(self, OLDVAL, v, kk)
             elif type(v) in [dict]:
                 newvalue[kk] = __deep_set_fields(self, OLDVAL, v, kk)
+            elif _hub_set._issparse(v):
+                # Sparse coupling matrix, see Operators.Rmatmul
+                newvalue[kk] = v.tocsr()
+            elif _hub_set._issparse(OLDVAL):
+                newvalue[kk] = kwargs[kk]
             else:
                 newvalue[kk] = kwargs[kk] + 0 * OLDVAL
         else:
@@ -232,11 +259,17 @@ def _set_fields(self, noreset=False, verb=config.get_current('_VERB'), **kwargs)
         for kk in parametersandifferential:
             if kk in kwargs.keys():
                 self._dfields[kk][direct[kk]] = newvalue[kk]
-        self._dfields = _hub_set.set_shapes_values(self._dfields, self._dmisc['dfunc_order'])
+        self._dfields = _hub_set.set_shapes_values(self._dfields, self._dmisc['dfunc_order'],
+                                                   storage=self._dmisc.get('storage'),
+                                                   record=self._dmisc.get('record'))
         self._dargs = _hub_set.get_dargs_by_reference(self._dfields, self._dmisc['dfunc_order'])
         self.reset()
     else:
         it = self.dflags['run'][0]
+        self._dmisc['reset'] = False
+        order = self._dmisc['dfunc_order']
+        if _hub_set.own_timeseries(self._dfields, order['differential'] + order['statevar'], self._dmisc.get('shared')):
+            self._dargs = _hub_set.get_dargs_by_reference(self._dfields, order)
         for kk in parametersandifferential:
             if kk in kwargs.keys():
                 if direct[kk] == 'initial':
@@ -528,9 +561,68 @@ class setM:
         super().__init__()
         # pass
 
-    def copy(self):
-        """Do a deep copy of the hub"""
-        return copy.deepcopy(self)
+    def copy(self, deep=False):
+        """
+        Copy of the hub, in a time proportional to the number of parameters and not to the size of the results.
+
+        The copy shares with the hub the parts that are never modified (model file and presets, equations and their order,
+        fields definitions), and has its own parameters, initial conditions and flags. The time series and the results
+        of the calculations (sensitivity, cycles, ensemble statistics) are shared until one of the hubs writes its time series
+        through its methods (`reset`, `run`, `set_fields`...): that hub then works on its own copy of them.
+        The copy reads the time series through read-only views, the arrays of the hub stay as they are.
+
+        Parameters
+        ----------
+        deep : bool, optional
+            If True, a complete copy of everything with `copy.deepcopy`. Default is False.
+
+        Returns
+        -------
+        Hub
+            The copy of the hub.
+
+        Notes
+        -----
+        Time series stored on disk (see `set_storage`) are read in RAM in the copy, whose storage is None.
+        Writing directly inside the arrays of the hub, not through its methods, also changes the values seen by its copies:
+        use `deep=True` if the hub is modified this way.
+        """
+        if deep:
+            return copy.deepcopy(self)
+
+        order = self._dmisc['dfunc_order']
+        lts = set(order['differential'] + order['statevar'])
+        # time series the hub copies before writing them, the copy reading them
+        shared = self._dmisc.setdefault('shared', set())
+        dfields = {}
+        for k, v in self._dfields.items():
+            v2 = dict(v)
+            value = v.get('value')
+            if k in lts:
+                if isinstance(value, np.memmap):
+                    v2['value'] = np.array(value)
+                else:
+                    # both hubs read the same array, the first one writing copies it
+                    shared.add(k)
+                    v2['value'] = _hub_set._share(value)
+            elif _hub_set._issparse(value):
+                v2['value'] = value.copy()
+            elif isinstance(value, np.ndarray):
+                v2['value'] = np.copy(value)
+            if isinstance(v.get('initial'), np.ndarray):
+                v2['initial'] = np.copy(v['initial'])
+            dfields[k] = v2
+
+        new = type(self).__new__(type(self))
+        new.__dict__.update(self.__dict__)
+        new._dmodel = dict(self._dmodel)
+        new._dfields = dfields
+        new._dflags = copy.deepcopy(self._dflags)
+        new._dmisc = {k: v if k in ['dfunc_order', 'ensemble'] else copy.deepcopy(v) for k, v in self._dmisc.items()}
+        new._dmisc['storage'] = None
+        new._dmisc['shared'] = set()
+        new._dargs = _hub_set.get_dargs_by_reference(dfields, order)
+        return new
 
     def set_name(self,
                  name: str):
@@ -541,6 +633,54 @@ class setM:
             raise Exception(f'The name type is invalid ! Please use a string. you gave {name}')
         self._name = name
 
+    def set_storage(self,
+                    folder=None,
+                    verb=config.get_current('_VERB')):
+        """
+        Choose where the time series (differential and state variables) are stored.
+
+        By default they are numpy arrays in RAM. With a folder, each of them is a `np.memmap` .npy file
+        in this folder, written step by step by the solver: long or large runs are then limited by the disk, not the RAM.
+
+        Parameters
+        ----------
+        folder : str, None or False, optional
+            * str: folder of the run, created if needed
+            * None: a new temporary folder
+            * False: back to the storage in RAM
+            Default is None.
+        verb : bool, optional
+            If True, print the folder. Default is config value.
+
+        Returns
+        -------
+        Hub
+            The hub itself.
+
+        Notes
+        -----
+        The time series are reallocated, so the results of a previous run are lost.
+        Each file can be read again without the hub with `np.load(path, mmap_mode='r')`.
+        `get_dfields(returnas='view')`, `dfields_view`, `get_dataframe` and the plots read the files lazily,
+        while `get_dfields()` with the default dict copies everything in RAM.
+        A reinterpolation (`NtimeOutput` in `run`) gives back arrays in RAM.
+        A copy of the hub (`copy`, also with deep=True, or a pickled hub) has its time series in RAM and no storage folder.
+        """
+        if folder is False:
+            folder = None
+        else:
+            if folder is None:
+                folder = tempfile.mkdtemp(prefix=f"chimes_{self._dmisc['model']}_")
+            folder = os.path.abspath(folder)
+            os.makedirs(folder, exist_ok=True)
+        self._dmisc['storage'] = folder
+        if verb:
+            print(f"Time series stored in {folder if folder is not None else 'RAM'}")
+
+        self._dflags['run'] = [0, 0.]
+        self.set_fields(**{}, verb=False)
+        return self
+
     def set_dpreset(self,
                     input,
                     preset=None,
@@ -765,15 +905,15 @@ class setM:
             kwargs[key] = value
 
         # DECOMPOSE INTO SIZE AND VALUES #######
-        setofdimensions = set(['nr', 'nx', 'dt', 'Tsim'] + list(self.get_dfields(eqtype=['size'])))
-        diffparam = set(self.get_dfields(eqtype=['differential', None])) - set(['__ONE__', 'time']) - setofdimensions
+        setofdimensions = set(['nr', 'nx', 'dt', 'Tsim'] + self.get_dfields(eqtype=['size'], returnas=list))
+        diffparam = set(self.get_dfields(eqtype=['differential', None], returnas=list)) - set(['__ONE__', 'time']) - setofdimensions
 
         dimtochange = {kk: vv for kk, vv in kwargs.items() if kk in list(setofdimensions)}
         fieldtochange = {kk: vv for kk, vv in kwargs.items() if kk in list(diffparam)}
         wrongfields = [kk for kk in kwargs.keys() if kk not in list(dimtochange.keys()) + list(fieldtochange.keys())]
 
         # Check if dimensions are changed
-        Rdim = self.get_dfields(keys=dimtochange.keys())
+        Rdim = self.get_dfields(key=list(dimtochange.keys()), returnas='view')
         ignored = [k for k, v in dimtochange.items() if (v == Rdim[k]['value'] or v == Rdim.get('list', []))]
         for k in ignored:
             wrongfields.append(k)
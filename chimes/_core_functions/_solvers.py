@@ -1,12 +1,32 @@
 # built-in
 import time
+import operator
 from copy import copy, deepcopy
 
 # common
 import numpy as np
 
 # specific
-from . import _hub_check
+from . import _hub_check, _compiler
+
+# Solvers that can be called through `Hub.run(solver=...)` or the `_SOLVER` config key
+_LSOLVERS = ['rk1', 'rk4', 'rk4-flat', 'dopri5', 'rk4-jit']
+
+# Dormand-Prince 5(4) tableau, FSAL: the last stage is the 5th order solution
+_DP_A = [
+    [],
+    [1 / 5],
+    [3 / 40, 9 / 40],
+    [44 / 45, -56 / 15, 32 / 9],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+    [35 / 384, 0., 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+]
+# Difference between 5th and 4th order weights, for the error estimate
+_DP_E = [71 / 57600, 0., -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40]
+# Dense output of order 4 (Hairer, Norsett, Wanner)
+_DP_D = [-12715105075 / 11282082432, 0., 87487479700 / 32700410799, -10690763975 / 1880347072,
+         701980252875 / 199316789632, -1453857185 / 822651844, 69997945 / 29380423]
 
 
 def solve(
@@ -16,7 +36,13 @@ def solve(
         stepend=0,
         dverb=None,
         ComputeStatevarEnd=False,
-        solver='rk4'
+        solver='rk4',
+        rtol=1e-6,
+        atol=1e-9,
+        record=None,
+        terminate=None,
+        converge=None,
+        profile=None,
 ):
     """
     Temporal solver of the system.
@@ -24,6 +50,8 @@ def solve(
     This function solves the system of differential equations over a specified time range using the specified solver. 
     It initializes the system state, then enters a loop where it computes the state at each time step and stores the 
     results. If ComputeStatevarEnd is True, it recomputes all state variables at the end.
+    Inside the stages, only the state variables needed by the differential equations are computed (see `_split_statevar`): 
+    the output-only ones are computed once per stored step, on the last stage.
 
     Parameters
     ----------
@@ -40,7 +68,29 @@ def solve(
     ComputeStatevarEnd : bool, optional
         Whether to recompute all state variables at the end. Default is False.
     solver : str, optional
-        The solver to use. Default is 'rk4'.
+        The solver to use, in `_LSOLVERS`. Default is 'rk4'.
+        'rk4-flat' is the same scheme as 'rk4', computed on one contiguous state vector.
+        'dopri5' is an adaptive Dormand-Prince 5(4) scheme, interpolated on the time grid.
+        'rk4-jit' is the same scheme as 'rk4', with the whole time loop compiled by numba (see `_solve_jit`).
+        It is only possible when numba is installed and every field is a scalar (nx=nr=1, no multisectoral field)
+        computed with arithmetic, numpy or math: otherwise 'rk4-flat' is used.
+    rtol, atol : float, optional
+        Relative and absolute tolerances of the adaptive solvers. Default are 1e-6 and 1e-9.
+    record : dict, optional
+        If given, {'fields': recorded fields, 'steps': recorded time steps}. The recorded fields are only written 
+        at the recorded steps (one row per recorded step), the other ones are not written and are nan at the end. 
+        It can also have 'stats', statistics over nx updated at the recorded steps (see `_ensemble.EnsembleStats`).
+        Default is None, everything is written at every step.
+    terminate : dict, optional
+        If given, the members (parallel systems nx) are stopped when they meet the criteria of `terminate['check']`,
+        see `_get_terminate` and `_solve_terminate`. Only with the 'rk1', 'rk4' and 'rk4-flat' solvers. Default is None.
+    converge : dict, optional
+        If given, the members are stopped once converged, and the run ends when none is running,
+        see `_get_converge` and `_solve_terminate`. Same solvers as `terminate`. Default is None.
+    profile : dict, optional
+        If given, the function of each differential and state variable is timed (see `_get_profile`), and its statistics
+        are written in profile['fields']. The equations are then not fused (see `_compiler.compile_step`) and 'rk4-jit'
+        runs as 'rk4-flat'. Default is None, nothing is timed.
 
     Returns
     -------
@@ -49,6 +99,9 @@ def solve(
     time : float
         The time at the final time step.
 
+    The temporal loop actually used is written in dmisc['solver']: 'rk4-flat' when 'rk4-jit' cannot be used, 'rk4' (or 'rk1')
+    with terminate or converge.
+
     Author
     ------
     Paul Valcke
@@ -62,14 +115,91 @@ def solve(
     lode = dmisc['dfunc_order']['differential']
     lstate = dmisc['dfunc_order']['statevar']
     lparam = dmisc['dfunc_order']['parameter'] + dmisc['dfunc_order']['parameters'] + ['dt']
+    store = _get_store(dfields, lode + lstate, record, stepend)
+
+    # Timed functions, each field being computed by its own function
+    compiled = profile is None
+    if profile is not None:
+        dfields, profile['fields'] = _get_profile(dfields, lode + lstate)
+        if solver == 'rk4-jit':
+            solver = 'rk4-flat'
+
+    # Only the state variables needed by the differential equations are computed at each stage
+    lneeded, loutput = _split_statevar(dfields, lode, lstate)
+    output = _get_func_statevar(dfields, loutput, compiled=compiled)
+
+    if terminate is not None or converge is not None:
+        if solver not in ['rk1', 'rk4', 'rk4-flat', 'rk4-jit']:
+            raise Exception(f"terminate and converge are only available with the 'rk1', 'rk4' and 'rk4-flat' solvers, not {solver}")
+        dmisc['solver'] = 'rk1' if solver == 'rk1' else 'rk4'
+        return _solve_terminate(dfields=dfields,
+                                lode=lode,
+                                lstate=lstate,
+                                lparam=lparam,
+                                stepini=stepini,
+                                stepend=stepend,
+                                dverb=dverb,
+                                ComputeStatevarEnd=ComputeStatevarEnd,
+                                store=store,
+                                lneeded=lneeded,
+                                output=output,
+                                rk1=solver == 'rk1',
+                                terminate=terminate,
+                                converge=converge,
+                                compiled=compiled)
+
+    dmisc['solver'] = solver
+    if solver == 'rk4-jit':
+        out = _solve_jit(dfields=dfields,
+                         lode=lode,
+                         lstate=lstate,
+                         stepini=stepini,
+                         stepend=stepend,
+                         ComputeStatevarEnd=ComputeStatevarEnd,
+                         store=store)
+        if out is not None:
+            return out
+        solver = 'rk4-flat'
+        dmisc['solver'] = solver
+
+    if solver == 'rk4-flat':
+        return _solve_flat(dfields=dfields,
+                           lode=lode,
+                           lstate=lstate,
+                           lparam=lparam,
+                           stepini=stepini,
+                           stepend=stepend,
+                           dverb=dverb,
+                           ComputeStatevarEnd=ComputeStatevarEnd,
+                           store=store,
+                           lneeded=lneeded,
+                           output=output,
+                           compiled=compiled)
+    if solver == 'dopri5':
+        return _solve_dopri5(dfields=dfields,
+                             dmisc=dmisc,
+                             lode=lode,
+                             lstate=lstate,
+                             lparam=lparam,
+                             stepini=stepini,
+                             stepend=stepend,
+                             dverb=dverb,
+                             ComputeStatevarEnd=ComputeStatevarEnd,
+                             rtol=rtol,
+                             atol=atol,
+                             store=store,
+                             lneeded=lneeded,
+                             output=output,
+                             compiled=compiled)
 
     # Define initial state and all functions to iterate in order with their references
     y0, dydt_func = get_func_dydt(
         dfields=dfields,
         lode=lode,
-        lstate=lstate,
+        lstate=lneeded,
         lparam=lparam,
-        stepini=stepini
+        stepini=stepini,
+        compiled=compiled
     )
 
     # Initialize y
@@ -92,13 +222,12 @@ def solve(
             y, state = _rk4(dydt_func=dydt_func, dt=dfields['dt']['value'], y=y)
 
         # Store result of ode
-        for k0 in lode:
-            dfields[k0]['value'][ii, ...] = y[k0]
+        store(ii, y, lode)
 
-        # Store state variables if not computing at the end
-        if not ComputeStatevarEnd:
-            for k0 in lstate:
-                dfields[k0]['value'][ii, ...] = state[k0]
+        # Store state variables if not computing at the end, the output-only ones are computed on the last stage
+        if not ComputeStatevarEnd and store.keep(ii):
+            output(state)
+            store(ii, state, lstate)
 
     # Print or wait if verbosity is greater than 0
     # if dverb['verb']:
@@ -107,11 +236,722 @@ def solve(
 
     # Compute statevar functions, in good order, if computing at the end
     if ComputeStatevarEnd:
-        for k0 in lstate:
-            dfields[k0]['value'][...] = dfields[k0]['func'](**{k: dfields[k]['value'][...] for k in dfields[k0]['kargs']})
+        _compute_statevar_end(dfields, lstate)
+
+    store.end()
 
     # Return the final time step and the time at the final time step
-    return stepend, dfields['time']['value'][ii, 0, 0, 0, 0]
+    return stepend, np.ravel(y['time'])[0]
+
+
+def _get_store(dfields, lfields, record, stepend):
+    '''
+    Return a function `store(ii, dvalues, lfields)` writing the values of the fields `lfields` at the step `ii` in dfields.
+
+    Without `record`, the step `ii` is written in the row `ii`.
+    With `record`, only the recorded fields are written, at the recorded steps, in their row in `record['steps']`.
+    The other fields are only kept in the solver state, and `store.end()` sets them to nan.
+    `store.keep(ii)` tells if anything is written at the step `ii`.
+    `store.many(lii, dvalues, lfields)` writes many steps `lii` at once, `dvalues[k]` having one row per step.
+    If `record` has 'stats' (see `_ensemble.EnsembleStats`), the values of its fields at the recorded steps
+    are added to the statistics of their row.
+    '''
+    if record is None:
+        def store(ii, dvalues, lfields):
+            for k0 in lfields:
+                dfields[k0]['value'][ii, ...] = dvalues[k0]
+        def many(lii, dvalues, lfields):
+            for k0 in lfields:
+                dfields[k0]['value'][lii, ...] = dvalues[k0]
+        store.end = lambda: None
+        store.keep = lambda ii: True
+        store.many = many
+        return store
+
+    rows = np.full(max(stepend, record['steps'][-1] + 1), -1)
+    rows[record['steps']] = np.arange(len(record['steps']))
+    lrecord = set(record['fields'])
+    stats = record.get('stats')
+    lstats = set() if stats is None else set(stats.fields)
+
+    def store(ii, dvalues, lfields):
+        row = rows[ii]
+        if row < 0:
+            return
+        for k0 in lfields:
+            if k0 in lrecord:
+                dfields[k0]['value'][row, ...] = dvalues[k0]
+            if k0 in lstats:
+                stats.update(k0, row, dvalues[k0])
+
+    def many(lii, dvalues, lfields):
+        lrow = rows[lii]
+        kept = lrow >= 0
+        for k0 in lfields:
+            if k0 in lrecord:
+                dfields[k0]['value'][lrow[kept], ...] = dvalues[k0][kept]
+            if k0 in lstats:
+                stats.update_many(k0, lrow[kept], dvalues[k0][kept])
+
+    def end():
+        for k0 in lfields:
+            if k0 not in lrecord:
+                dfields[k0]['value'][...] = np.nan
+    store.end = end
+    store.keep = lambda ii: rows[ii] >= 0
+    store.many = many
+    return store
+
+
+def _split_statevar(dfields, lode, lstate):
+    '''
+    Split the state variables between the ones needed to compute the differential equations
+    (directly or through other state variables), and the output-only ones. Both lists keep the order of `lstate`.
+    '''
+    sstate = set(lstate)
+    needed = set()
+    tocheck = [k for k0 in lode for k in dfields[k0]['kargs'] if k in sstate]
+    while tocheck:
+        k = tocheck.pop()
+        if k not in needed:
+            needed.add(k)
+            tocheck += [k1 for k1 in dfields[k]['kargs'] if k1 in sstate]
+    return [k for k in lstate if k in needed], [k for k in lstate if k not in needed]
+
+
+def _get_func_statevar(dfields, lstate, compiled=True):
+    '''
+    Return a function computing the state variables `lstate`, in order, inside a buffer dictionnary that contains their arguments
+    '''
+    step = _compiler.compile_step(dfields, [], lstate) if compiled else None
+    if step is not None:
+        return lambda dbuffer: step(dbuffer, None)
+
+    lfstate = [(k0, dfields[k0]['func'], _get_args_getter(dfields[k0]['kargs'])) for k0 in lstate]
+
+    def func(dbuffer):
+        for k0, f, getter in lfstate:
+            dbuffer[k0] = f(*getter(dbuffer))
+        return dbuffer
+    return func
+
+
+def _get_profile(dfields, lfields):
+    '''
+    Copy of `dfields` in which the functions of `lfields` are timed, and the statistics of each of them
+    {field: [number of calls, cumulated time (ns), cumulated size of the results (bytes)]}, updated at each call
+    '''
+    dprofile = {}
+    dfields = dict(dfields)
+    for k0 in lfields:
+        dprofile[k0] = [0, 0, 0]
+        dfields[k0] = dict(dfields[k0], func=_timed(dfields[k0]['func'], dprofile[k0]))
+    return dfields, dprofile
+
+
+def _timed(func, stat):
+    ''' `func` updating `stat` = [calls, time (ns), bytes of the results] at each call '''
+    def timed(*args, **kwargs):
+        t0 = time.perf_counter_ns()
+        out = func(*args, **kwargs)
+        stat[1] += time.perf_counter_ns() - t0
+        stat[0] += 1
+        stat[2] += getattr(out, 'nbytes', 0)
+        return out
+    return timed
+
+
+def _compute_statevar_end(dfields, lstate):
+    '''
+    Compute all statevar on the whole time vector at once, in the good order
+    '''
+    for k0 in lstate:
+        dfields[k0]['value'][...] = dfields[k0]['func'](**{k: dfields[k]['value'][...] for k in dfields[k0]['kargs']})
+
+
+def _solve_flat(
+        dfields=None,
+        lode=None,
+        lstate=None,
+        lparam=None,
+        stepini=0,
+        stepend=0,
+        dverb=None,
+        ComputeStatevarEnd=False,
+        store=None,
+        lneeded=None,
+        output=None,
+        compiled=True,
+):
+    """
+    Temporal loop of the 'rk4-flat' solver.
+
+    Same RK4 scheme as `_rk4`, but all differential variables are packed in one contiguous vector.
+    The stage buffers are allocated once per run, and each stage only writes inside them.
+    The values are written in dfields through `store` (see `_get_store`).
+    Only the state variables `lneeded` are computed at each stage, `output` computes the other ones on the last stage.
+
+    Returns
+    -------
+    stepend : int
+        The final time step.
+    time : float
+        The time at the final time step.
+    """
+    y, dydt_func, dviews = get_func_dydt_flat(
+        dfields=dfields,
+        lode=lode,
+        lstate=lneeded,
+        lparam=lparam,
+        stepini=stepini,
+        compiled=compiled
+    )
+    dt = dfields['dt']['value']
+
+    # Stage buffers, allocated once
+    k1, k2, k3, k4 = (np.empty_like(y) for _ in range(4))
+    ytmp = np.empty_like(y)
+    yview = dviews['y']
+
+    t0 = time.time()
+    ii = 0
+    for ii in range(stepini + 1, stepend):
+        if dverb['verb'] > 0:
+            t0 = _hub_check._print_or_wait(ii=ii, nt=dfields['nt']['value'], t0=t0, **dverb)
+
+        state = _rk4_flat(dydt_func=dydt_func, dt=dt, y=y, ytmp=ytmp, k1=k1, k2=k2, k3=k3, k4=k4)
+
+        store(ii, yview, lode)
+        if not ComputeStatevarEnd and store.keep(ii):
+            output(state)
+            store(ii, state, lstate)
+
+    if ComputeStatevarEnd:
+        _compute_statevar_end(dfields, lstate)
+    store.end()
+
+    return stepend, np.ravel(yview['time'])[0]
+
+
+def _get_terminate(dfields, lode, lstate, terminate):
+    """
+    Turn the `terminate` argument of `run` into {'check': function, 'needstate': bool}.
+
+    `check(dvalues)` gives, from the values of the differential and state variables of n members (first axis),
+    the boolean array (n,) of the members that are terminated. 'needstate' tells if all the state variables are needed.
+
+    Parameters
+    ----------
+    terminate : True or dict
+        True is {'finite': True}. The keys of the dict are:
+            * 'finite': bool, terminate a member when one of its differential variables is not finite (default True)
+            * 'bounds': {field: [min, max]} (None for no bound), or a list of fields to use their 'minmax'
+            * 'predicate': function(dvalues) returning the boolean array (n,) of the members to terminate
+    """
+    if terminate is True:
+        terminate = {}
+    wrong = [k for k in terminate.keys() if k not in ['finite', 'bounds', 'predicate']]
+    if len(wrong):
+        raise Exception(f"terminate keys are 'finite', 'bounds' and 'predicate', you gave {wrong}")
+    finite = terminate.get('finite', True)
+    bounds = terminate.get('bounds', {})
+    if isinstance(bounds, str):
+        bounds = [bounds]
+    if isinstance(bounds, (list, tuple)):
+        bounds = {k: dfields[k].get('minmax', [None, None]) for k in bounds}
+    wrong = [k for k in bounds.keys() if k not in lode + lstate]
+    if len(wrong):
+        raise Exception(f'terminate bounds are only on differential and state variables, you gave {wrong}')
+    predicate = terminate.get('predicate')
+
+    def members(v, n):
+        if np.shape(v)[0] != n:
+            v = np.broadcast_to(v, (n,) + np.shape(v)[1:])
+        return np.reshape(v, (n, -1))
+
+    def check(dvalues):
+        n = np.shape(dvalues['time'])[0]
+        dead = np.zeros(n, dtype=bool)
+        # A check on the whole arrays first, the members are only looked at when it fails
+        if finite and not np.isfinite(sum(float(np.sum(dvalues[k])) for k in lode)):
+            for k in lode:
+                dead |= ~np.all(np.isfinite(members(dvalues[k], n)), axis=1)
+        for k, (vmin, vmax) in bounds.items():
+            if vmin is not None and np.min(dvalues[k]) < vmin:
+                dead |= np.any(members(dvalues[k], n) < vmin, axis=1)
+            if vmax is not None and np.max(dvalues[k]) > vmax:
+                dead |= np.any(members(dvalues[k], n) > vmax, axis=1)
+        if predicate is not None:
+            dead |= np.asarray(predicate(dvalues), dtype=bool).reshape(n)
+        return dead
+
+    return {'check': check,
+            'needstate': predicate is not None or any(k in lstate for k in bounds)}
+
+
+def _get_converge(dfields, lode, lstate, converge):
+    """
+    Turn the `converge` argument of `run` into {'fields', 'rtol', 'atol', 'nwindow'}.
+
+    Parameters
+    ----------
+    converge : float or dict
+        A float is the relative tolerance {'rtol': converge}. The keys of the dict are:
+            * 'rtol': relative change under which a member is converged (default 1e-6)
+            * 'atol': absolute change added to the tolerance, for the values close to 0 (default 0)
+            * 'window': duration over which the change is measured (default 1, in the unit of time)
+            * 'fields': differential and state variables that must be converged (default all the differential variables)
+    """
+    if not isinstance(converge, dict):
+        converge = {'rtol': converge}
+    wrong = [k for k in converge.keys() if k not in ['rtol', 'atol', 'window', 'fields']]
+    if len(wrong):
+        raise Exception(f"converge keys are 'rtol', 'atol', 'window' and 'fields', you gave {wrong}")
+    fields = converge.get('fields', [k for k in lode if k != 'time'])
+    fields = [fields] if isinstance(fields, str) else list(fields)
+    wrong = [k for k in fields if k not in lode + lstate]
+    if len(wrong):
+        raise Exception(f'converge is only on differential and state variables, you gave {wrong}')
+    return {'fields': fields,
+            'rtol': float(converge.get('rtol', 1e-6)),
+            'atol': float(converge.get('atol', 0.)),
+            'nwindow': max(1, int(round(converge.get('window', 1.) / dfields['dt']['value'])))}
+
+
+def _solve_terminate(
+        dfields=None,
+        lode=None,
+        lstate=None,
+        lparam=None,
+        stepini=0,
+        stepend=0,
+        dverb=None,
+        ComputeStatevarEnd=False,
+        store=None,
+        lneeded=None,
+        output=None,
+        rk1=False,
+        terminate=None,
+        converge=None,
+        compiled=True,
+):
+    """
+    Temporal loop of the 'rk4' (or 'rk1') solver in which each member (parallel system nx) can be stopped.
+
+    After each step, the members meeting `terminate['check']` (see `_get_terminate`) are terminated, and every
+    `converge['nwindow']` steps the members whose `converge['fields']` changed less than `converge['rtol']` (relative)
+    plus `converge['atol']` since the previous check are converged (see `_get_converge`). The values of a stopped member
+    are frozen at this step (except 'time'), and the time is written in `terminate['terminated']` or
+    `converge['converged']` (nx,), nan for the members that are still running. The state, nx and the parameters are then
+    compacted on the running members, so that the next steps only compute them. Members already stopped are not run.
+    With `converge`, the run ends at the first stored step at which no member is running.
+
+    Returns
+    -------
+    stepend : int
+        The final time step (lower than `stepend` if the run ended before).
+    time : float
+        The time at the final time step.
+    """
+    nx = int(dfields['nx']['value'])
+    dt = dfields['dt']['value']
+    check = None if terminate is None else terminate['check']
+    needstate = terminate is not None and terminate['needstate']
+    tterm = np.full(nx, np.nan) if terminate is None else terminate['terminated']
+    tconv = np.full(nx, np.nan) if converge is None else converge['converged']
+
+    # Values of all the members, the stopped ones keep their last values
+    yfull = {k: np.array(dfields[k]['value'][stepini, ...], dtype=float) for k in lode}
+    sfull = {k: np.array(dfields[k]['value'][stepini, ...], dtype=float) for k in lstate}
+    active = np.nonzero(np.isnan(tterm) & np.isnan(tconv))[0]
+    if converge is not None:
+        # values at the previous check
+        dref = {k: np.copy(yfull[k] if k in lode else sfull[k]) for k in converge['fields']}
+        convstate = any(k in lstate for k in converge['fields'])
+
+    def compact(active):
+        ''' Initial state and time derivative of the active members only '''
+        sub = dict(dfields)
+        # The size of the system and all the fields on the members are the ones of the active members
+        sub['nx'] = dict(dfields['nx'], value=len(active))
+        for k, v in dfields.items():
+            v = v.get('value')
+            if k not in lode + lstate and isinstance(v, np.ndarray) and v.ndim and v.shape[0] == nx and nx > 1:
+                sub[k] = dict(dfields[k], value=v[active])
+        for k in lode:
+            sub[k] = dict(dfields[k], value=yfull[k][active][np.newaxis])
+        return get_func_dydt(dfields=sub, lode=lode, lstate=lneeded, lparam=lparam, compiled=compiled)
+
+    def converged(dvalues, active):
+        ''' Members whose fields changed less than the tolerance since the previous check '''
+        n = len(active)
+        conv = np.ones(n, dtype=bool)
+        for k in converge['fields']:
+            v = np.reshape(np.broadcast_to(dvalues[k], (n,) + np.shape(dvalues[k])[1:]), (n, -1))
+            ref = np.reshape(dref[k][active], (n, -1))
+            with np.errstate(invalid='ignore'):
+                conv &= np.all(np.abs(v - ref) <= converge['rtol'] * np.abs(v) + converge['atol'], axis=1)
+            dref[k][active] = np.reshape(v, dref[k][active].shape)
+        return conv
+
+    y, dydt_func = compact(active)
+    tnow = np.ravel(yfull['time'])[0]
+    t0 = time.time()
+    for ii in range(stepini + 1, stepend):
+        if dverb['verb'] > 0:
+            t0 = _hub_check._print_or_wait(ii=ii, nt=dfields['nt']['value'], t0=t0, **dverb)
+
+        keep = not ComputeStatevarEnd and store.keep(ii)
+        # While no member is stopped, the values written are the ones of the solver
+        dv, ds = yfull, sfull
+        if len(active):
+            y, state = _rk1(dydt_func=dydt_func, dt=dt, y=y) if rk1 else _rk4(dydt_func=dydt_func, dt=dt, y=y)
+            tnow = np.ravel(y['time'])[0]
+            checkconv = converge is not None and (ii - stepini) % converge['nwindow'] == 0
+            computed = keep or needstate or (checkconv and convstate)
+            if computed:
+                output(state)
+            dvalues = {**{k: state[k] for k in lstate if k in state}, **y}
+            dead = np.zeros(len(active), dtype=bool) if check is None else check(dvalues)
+            conv = converged(dvalues, active) & ~dead if checkconv else np.zeros(len(active), dtype=bool)
+            stopped = dead | conv
+
+            if len(active) == nx and not stopped.any():
+                dv, ds = y, state
+            else:
+                for k in lode:
+                    yfull[k][active] = y[k]
+                if computed or stopped.any():
+                    if not computed:
+                        output(state)
+                    for k in lstate:
+                        sfull[k][active] = state[k]
+            if stopped.any():
+                tterm[active[dead]] = tnow
+                tconv[active[conv]] = tnow
+                active = active[~stopped]
+                if len(active):
+                    y, dydt_func = compact(active)
+        else:
+            tnow = tnow + dt
+        if dv is yfull:
+            yfull['time'][...] = tnow
+
+        store(ii, dv, lode)
+        if keep:
+            store(ii, ds, lstate)
+        if converge is not None and not len(active) and store.keep(ii):
+            stepend = ii + 1
+            break
+
+    if ComputeStatevarEnd:
+        _compute_statevar_end(dfields, lstate)
+    store.end()
+    return stepend, tnow
+
+
+def _solve_jit(
+        dfields=None,
+        lode=None,
+        lstate=None,
+        stepini=0,
+        stepend=0,
+        ComputeStatevarEnd=False,
+        store=None,
+):
+    """
+    Temporal loop of the 'rk4-jit' solver.
+
+    The equations are inlined in one scalar function, and the whole RK4 loop is compiled with numba
+    (see `_compiler.compile_loop_jit`). All the steps are written in dfields at the end through `store.many`.
+    Same scheme and same convention for the state variables as 'rk4-flat'.
+
+    Returns
+    -------
+    tuple or None
+        (stepend, time at the final time step), or None if the loop cannot be compiled:
+        numba is not installed, a field is not a scalar, or an equation is not compatible.
+    """
+    if any(np.size(dfields[k]['value'][stepini, ...]) != 1 for k in lode + lstate):
+        return None
+    out = _compiler.compile_loop_jit(dfields, lode, lstate)
+    if out is None:
+        return None
+    loop, lread = out
+    if any(np.size(dfields[k]['value']) != 1 for k in lread):
+        return None
+
+    nsteps = stepend - stepini
+    y = np.array([float(np.ravel(dfields[k]['value'][stepini, ...])[0]) for k in lode])
+    p = np.array([float(np.ravel(dfields[k]['value'])[0]) for k in lread])
+    ys = np.empty((nsteps, len(lode)))
+    ss = np.empty((nsteps, max(len(lstate), 1)))
+    try:
+        loop(y, p, float(dfields['dt']['value']), nsteps, ys, ss)
+    except Exception:
+        # Typing or compilation error inside numba
+        return None
+
+    lii = np.arange(stepini + 1, stepend)
+    shape = (len(lii),) + np.shape(dfields[lode[0]]['value'])[1:]
+    store.many(lii, {k: ys[1:, ii].reshape(shape) for ii, k in enumerate(lode)}, lode)
+    if ComputeStatevarEnd:
+        _compute_statevar_end(dfields, lstate)
+    else:
+        store.many(lii, {k: ss[1:, ii].reshape(shape) for ii, k in enumerate(lstate)}, lstate)
+    store.end()
+
+    return stepend, y[lode.index('time')]
+
+
+def _solve_dopri5(
+        dfields=None,
+        dmisc=None,
+        lode=None,
+        lstate=None,
+        lparam=None,
+        stepini=0,
+        stepend=0,
+        dverb=None,
+        ComputeStatevarEnd=False,
+        rtol=1e-6,
+        atol=1e-9,
+        store=None,
+        lneeded=None,
+        output=None,
+        compiled=True,
+):
+    """
+    Temporal loop of the adaptive 'dopri5' solver.
+
+    The system is integrated with a Dormand-Prince 5(4) scheme, the time step being adapted to keep the
+    local error below `atol + rtol * |y|` (RMS norm over all differential variables and parallel systems).
+    The solution is written on the preallocated time grid (steps of `dt`) with the dense output of order 4,
+    so the internal steps can be much larger than `dt` on smooth trajectories.
+    The state variables are computed on each point of the grid, and the values are written through `store` (see `_get_store`).
+    Only the state variables `lneeded` are computed at each stage, `output` computes the other ones on the grid points.
+    The number of accepted and rejected steps, and of evaluations, are stored in dmisc['solver_stats'].
+
+    Notes
+    -----
+    Fields whose equations use `dt` directly (stochastic or external coupling models) still see the grid `dt`,
+    and should be run with a fixed-step solver.
+    Non-finite values (diverging systems) are ignored in the error estimate.
+    An exception is raised if the time step has to go below 1e-8 dt,
+    or if it needs more than max(10 nt, 100000) steps.
+
+    Returns
+    -------
+    stepend : int
+        The final time step.
+    time : float
+        The time at the final time step.
+    """
+    y, dydt_func, dviews = get_func_dydt_flat(
+        dfields=dfields,
+        lode=lode,
+        lstate=lneeded,
+        lparam=lparam,
+        stepini=stepini,
+        compiled=compiled
+    )
+    dslices = dviews['slices']
+    dt = float(np.ravel(dfields['dt']['value'])[0])
+    tini = float(dfields['time']['value'][stepini, 0, 0, 0, 0])
+    tend = tini + (stepend - 1 - stepini) * dt
+    t = tini
+    hmin = 1e-8 * dt
+    maxsteps = max(10 * (stepend - stepini), 100000)
+
+    # Buffers, allocated once
+    K = [np.empty_like(y) for _ in range(7)]
+    ytmp, ynew, err, yout, dout = (np.empty_like(y) for _ in range(5))
+
+    dshapes = {k0: dfields[k0]['value'].shape[1:] for k0 in lode}
+
+    def to_grid(ii, vec):
+        if not store.keep(ii):
+            return
+        store(ii, {k0: vec[dslices[k0]].reshape(dshapes[k0]) for k0 in lode}, lode)
+        if not ComputeStatevarEnd:
+            store(ii, output(dydt_func(vec, dout)), lstate)
+
+    stats = {'accepted': 0, 'rejected': 0, 'nfev': 1}
+    dydt_func(y, K[0])
+    if not ComputeStatevarEnd:
+        to_grid(stepini, y)
+
+    h = dt
+    ii = stepini + 1
+    t0 = time.time()
+    while ii < stepend:
+        h = max(min(h, tend - t), hmin)
+
+        # Stages 2 to 7
+        for jj in range(1, 7):
+            ytmp[...] = y
+            for ll, a in enumerate(_DP_A[jj]):
+                if a:
+                    ytmp += (h * a) * K[ll]
+            dydt_func(ytmp, K[jj])
+        ynew[...] = ytmp
+        stats['nfev'] += 6
+
+        # Local error estimate
+        err[...] = 0.
+        for ll, e in enumerate(_DP_E):
+            if e:
+                err += (h * e) * K[ll]
+        err /= atol + rtol * np.maximum(np.abs(y), np.abs(ynew))
+        np.copyto(err, 0., where=~np.isfinite(err))
+        errnorm = np.sqrt(np.mean(err**2))
+
+        if stats['accepted'] + stats['rejected'] > maxsteps:
+            raise Exception(f'dopri5: more than {maxsteps} steps before t={t}, the system is too stiff, diverging or stochastic.'
+                            ' Use a fixed-step solver (rk4) instead')
+        if errnorm > 1. and h <= hmin:
+            raise Exception(f'dopri5: time step below {hmin} at t={t}, the system is too stiff, diverging or stochastic.'
+                            ' Use a fixed-step solver (rk4) instead')
+
+        if errnorm <= 1.:
+            # Dense output on all grid points inside the step
+            tnew = t + h
+            while ii < stepend and tini + (ii - stepini) * dt <= tnew + 1e-9 * dt:
+                theta = (tini + (ii - stepini) * dt - t) / h
+                _dopri5_dense(y, ynew, K, h, theta, out=yout)
+                to_grid(ii, yout)
+                if dverb['verb'] > 0:
+                    t0 = _hub_check._print_or_wait(ii=ii, nt=dfields['nt']['value'], t0=t0, **dverb)
+                ii += 1
+
+            # FSAL: the last stage is the derivative at the new point
+            y, ynew = ynew, y
+            K[0], K[6] = K[6], K[0]
+            t = tnew
+            stats['accepted'] += 1
+        else:
+            stats['rejected'] += 1
+
+        # New step size
+        factor = 5. if errnorm == 0. else min(5., max(0.2, 0.9 * errnorm**(-0.2)))
+        h = h * factor
+
+    dmisc['solver_stats'] = stats
+
+    if ComputeStatevarEnd:
+        _compute_statevar_end(dfields, lstate)
+    store.end()
+
+    return stepend, tend
+
+
+def _dopri5_dense(y0, y1, K, h, theta, out=None):
+    '''
+    4th order dense output of a Dormand-Prince step from y0 to y1, at the fraction theta of the step
+    '''
+    r2 = y1 - y0
+    r3 = h * K[0] - r2
+    r4 = r2 - h * K[6] - r3
+    r5 = sum((h * d) * K[ll] for ll, d in enumerate(_DP_D) if d)
+    out[...] = y0 + theta * (r2 + (1. - theta) * (r3 + theta * (r4 + (1. - theta) * r5)))
+    return out
+
+
+def _get_args_getter(kargs):
+    '''
+    Return a function that extracts the positional arguments `kargs` from a buffer dictionnary, as a tuple
+    '''
+    if len(kargs) == 0:
+        return lambda dbuffer: ()
+    elif len(kargs) == 1:
+        k = kargs[0]
+        return lambda dbuffer: (dbuffer[k],)
+    return operator.itemgetter(*kargs)
+
+
+def get_func_dydt_flat(
+    dfields=None,
+    lode=None,
+    lstate=None,
+    lparam=None,
+    stepini=0,
+    compiled=True
+):
+    """
+    Flat-vector equivalent of `get_func_dydt`.
+
+    All differential variables are packed in one contiguous vector `y`, each variable being a reshaped view of its slice.
+    The slices, the views and the arguments getter of each function are computed once.
+
+    Parameters
+    ----------
+    dfields : dict
+        The big dictionnary with values and dependencies.
+    lode : list
+        Ordered list of the differential variables.
+    lstate : list
+        Ordered list of the state variables.
+    lparam : list
+        List of the existing parameters.
+    stepini : int, optional
+        The initial time step. Default is 0.
+    compiled : bool, optional
+        If True, the equations are fused in one generated function (see `_compiler.compile_step`),
+        with the interpreted loop as fallback. Default is True.
+
+    Returns
+    -------
+    y0 : np.ndarray
+        The flat vector of the differential variables at `stepini`.
+    func : function
+        `func(y, dydt)` writes the time derivatives of `y` inside `dydt` and returns the buffer of all fields.
+    dviews : dict
+        'slices' of each differential variable in the flat vector, and 'y' the reshaped views of each of them inside `y0`.
+    """
+    # Position of each differential variable in the flat vector
+    dshapes = {k: np.shape(dfields[k]['value'])[1:] for k in lode}
+    dslices = {}
+    i0 = 0
+    for k in lode:
+        size = int(np.prod(dshapes[k]))
+        dslices[k] = slice(i0, i0 + size)
+        i0 += size
+
+    y0 = np.empty(i0)
+    for k in lode:
+        y0[dslices[k]] = np.reshape(dfields[k]['value'][stepini, ...], -1)
+
+    def views(vec):
+        return {k: vec[dslices[k]].reshape(dshapes[k]) for k in lode}
+
+    # Parameters are fixed during the run
+    dbuffer = {k0: dfields[k0]['value'] for k0 in lparam}
+    dbuffer.update(views(y0))
+
+    lfstate = [(k0, dfields[k0]['func'], _get_args_getter(dfields[k0]['kargs'])) for k0 in lstate]
+    lfode = [(k0, dfields[k0]['func'], _get_args_getter(dfields[k0]['kargs'])) for k0 in lode]
+
+    step = _compiler.compile_step(dfields, lode, lstate, inplace=True) if compiled else None
+
+    # Views are cached for each buffer the function is called on (stage buffers are reused)
+    cache = {}
+
+    def func(y, dydt, dbuffer=dbuffer):
+        key = (id(y), id(dydt))
+        if key not in cache:
+            cache[key] = (views(y), views(dydt))
+        yv, dv = cache[key]
+
+        dbuffer.update(yv)
+        if step is not None:
+            return step(dbuffer, dv)
+        for k0, f, getter in lfstate:
+            dbuffer[k0] = f(*getter(dbuffer))
+        for k0, f, getter in lfode:
+            dv[k0][...] = f(*getter(dbuffer))
+        return dbuffer
+
+    return y0, func, {'slices': dslices, 'y': views(y0)}
 
 
 def get_func_dydt(
@@ -119,7 +959,8 @@ def get_func_dydt(
     lode=None,  # ordered list of differential equations
     lstate=None,  # ordered list of state variables
     lparam=None,  # list of existing parameters
-    stepini=0
+    stepini=0,
+    compiled=True  # fuse the equations in one generated function
 ):
     """
     Generate initial values and a function for computing time derivatives.
@@ -142,6 +983,9 @@ def get_func_dydt(
         A list of the names of the existing parameters.
     stepini : int, optional
         The initial time step. Default is 0.
+    compiled : bool, optional
+        If True, the equations are fused in one generated function (see `_compiler.compile_step`),
+        with the interpreted loop as fallback. Default is True.
 
     Returns
     -------
@@ -172,12 +1016,19 @@ def get_func_dydt(
     for k0 in lparam:
         dbuffer[k0] = dfields[k0]['value']
 
+    step = _compiler.compile_step(dfields, lode, lstate, inplace=False) if compiled else None
+
     # Define a function to compute the time derivatives of the differential equations
     def func(y, dbuffer=dbuffer, dydt=dydt, dfields=dfields):
         # Update the buffer with the current values of the differential equations
         for k0 in lode:
             dbuffer[k0] = y[k0]
 
+        # Fused equations
+        if step is not None:
+            step(dbuffer, dydt)
+            return copy(dydt), dbuffer
+
         # Compute the current values of the state variables and update the buffer
         for k0 in lstate:
             dbuffer[k0] = dfields[k0]['func'](**{k: dbuffer[k] for k in dfields[k0]['kargs']})
@@ -215,6 +1066,38 @@ def _rk4(dydt_func=None, dt=None, y=None):
     return yend, state
 
 
+def _rk4_flat(dydt_func=None, dt=None, y=None, ytmp=None, k1=None, k2=None, k3=None, k4=None):
+    """
+    The RK4 scheme of `_rk4` on a flat vector `y`, updated in place.
+    `ytmp`, `k1`, `k2`, `k3`, `k4` are preallocated buffers of the same shape as `y`.
+
+    Returns the buffer of the last stage, for the state variables (same convention as `_rk4`)
+    """
+    dydt_func(y, k1)
+    np.multiply(k1, dt, out=ytmp)
+    ytmp /= 2.
+    ytmp += y
+    dydt_func(ytmp, k2)
+    np.multiply(k2, dt, out=ytmp)
+    ytmp /= 2.
+    ytmp += y
+    dydt_func(ytmp, k3)
+    np.multiply(k3, dt, out=ytmp)
+    ytmp += y
+    state = dydt_func(ytmp, k4)
+
+    # y += (k1 + 2 k2 + 2 k3 + k4) dt / 6
+    k2 *= 2
+    k3 *= 2
+    k1 += k2
+    k1 += k3
+    k1 += k4
+    k1 *= dt
+    k1 /= 6
+    y += k1
+    return state
+
+
 def _rk1(dydt_func=None, dt=None, y=None):
     dy1_on_dt, state = dydt_func(y)
     return {k: y[k] + dy1_on_dt[k] * dt for k in y.keys()}, state
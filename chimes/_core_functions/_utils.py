@@ -8,6 +8,7 @@ import numpy as np
 from . import _utils
 
 from .._config import config
+from ..libraries.operators_library import _issparse
 from itertools import chain
 _LTYPES = [int, float, np.int_, np.float_]
 
@@ -32,6 +33,7 @@ def _get_dict_subset(
 
     Return as:
         - dict: dict
+        - 'view': dict of shallow field dicts, arrays as read-only views (no copy)
         - 'DataGFrame': a pandas DataFrame
         - np.ndarray: a dict of np.ndarrays
         - False: return nothing (useful of verb=True)
@@ -59,6 +61,7 @@ def _get_dict_subset(
         'np.ndarray': np.ndarray,
         'list': list,
         "'DataFrame'": 'DataFrame',
+        "'view'": 'view',
     }
 
     if returnas not in dreturn_ok.values():
@@ -130,6 +133,9 @@ def _get_dict_subset(
     if returnas is dict:
         # return a copy of the dict
         return copy.deepcopy({k0: dict(indict[k0]) for k0 in lk})
+    elif returnas == 'view':
+        # return the fields without copying their content
+        return {k0: _get_field_view(indict[k0]) for k0 in lk}
     elif returnas is list:
         # return only the keys
         return lk
@@ -146,6 +152,26 @@ def _get_dict_subset(
             return out
 
 
+def _readonly(value):
+    ''' Return a read-only view of an array, other objects are returned as they are '''
+    if isinstance(value, np.ndarray):
+        value = value.view()
+        value.flags.writeable = False
+    return value
+
+
+def _get_field_view(field):
+    '''
+    Return a shallow copy of a field dict, with 'value' and 'initial' as read-only views.
+    The other metadata are shared with the hub and must not be modified.
+    '''
+    out = dict(field)
+    for k in ['value', 'initial']:
+        if k in out:
+            out[k] = _readonly(out[k])
+    return out
+
+
 # #############################################################################
 # #############################################################################
 #           str representation
@@ -274,6 +300,13 @@ def _get_summary_numerical(hub):
     return col1, ar1
 
 
+def _parameter_at(value, idx, Region, idsectr):
+    ''' Value of a parameter for one system, region and sector (a sparse matrix has no system axis) '''
+    if _issparse(value):
+        return value[Region, idsectr]
+    return value[idx, Region, idsectr, 0]
+
+
 def _get_summary_parameters(hub, idx=0, Region=0, filtersector=()):
 
     # ----------------
@@ -300,7 +333,7 @@ def _get_summary_parameters(hub, idx=0, Region=0, filtersector=()):
         [
             k0,
             ksector,
-            f"{v0.get('value')[idx,Region,idsectr,0]:.3f}",
+            f"{_parameter_at(v0.get('value'), idx, Region, idsectr):.3f}",
             str(v0['units']),
             v0['group'],
             v0['definition'],
@@ -0,0 +1,253 @@
+"""
+Parallel execution of independent hubs on multiple processes.
+
+Hubs are never sent to the workers: each worker receives a light specification
+(model name, preset, field values), rebuilds the hub locally and runs it.
+The time series are sent back through shared memory blocks instead of being pickled.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from ._core_functions import _hub_check, _hub_set
+from ._core_functions._calculate_methods import _set_ensemble
+from .libraries.operators_library import _TOPOLOGIES
+
+# Results of a run kept in dmisc, sent back with the time series
+_LRUN_DMISC = ['record', 'ensemble', 'terminated', 'converged', 'profile', 'solver_stats']
+
+
+def _copy_value(value):
+    ''' Copy of a field value, sparse matrices staying sparse '''
+    return value.copy() if _hub_set._issparse(value) else np.copy(value)
+
+
+def _hub_to_spec(hub) -> dict:
+    """
+    Light description of the current state of a hub, from which it can be rebuilt.
+
+    Returns
+    -------
+    dict
+        {'model': model name,
+         'preset': name of the last preset applied (or None),
+         'fields': values to give to set_fields (dimensions, numerical parameters, parameters and initial conditions)}
+    """
+    R = hub._dfields
+    order = hub.dmisc['dfunc_order']
+    fields = {k: v['value'] if isinstance(v['value'], _TOPOLOGIES) else list(v['list'])
+              for k, v in R.items() if v.get('eqtype') == 'size' and k != '__ONE__'}
+    fields.update({k: R[k]['value'] for k in ['dt', 'Tsim']})
+    fields.update({k: _copy_value(R[k]['value']) for k in order['parameters']
+                   if R[k].get('group') != 'Numerical' and k not in fields})
+    fields.update({k: np.copy(R[k]['initial']) for k in order['differential'] if k != 'time'})
+    return {'model': hub.dmisc['model'],
+            'preset': hub.dmodel.get('preset'),
+            'fields': fields}
+
+
+def _check_spec(spec) -> dict:
+    '''
+    Turn a Hub, a model name or a (partial) specification dictionnary into a complete specification
+    '''
+    if isinstance(spec, str):
+        spec = {'model': spec}
+    elif not isinstance(spec, dict):
+        spec = _hub_to_spec(spec)
+    if 'model' not in spec.keys():
+        raise Exception(f"A specification needs at least a 'model' key, you gave {list(spec.keys())}")
+    return {'model': spec['model'],
+            'preset': spec.get('preset', None),
+            'fields': spec.get('fields', {})}
+
+
+def _same_value(v1, v2):
+    ''' True if two field values of a specification are known to be equal '''
+    try:
+        return type(v1) is type(v2) and not _hub_set._issparse(v1) and bool(np.array_equal(v1, v2))
+    except Exception:
+        return False
+
+
+def _build_hub(spec, dtemplate=None):
+    '''
+    Rebuild a hub from its specification.
+    With `dtemplate` {(model, preset): (hub, its fields)}, the hub is a copy of the one of its model and preset
+    (made at the first call), with its own module of the model file, on which only the fields that differ are set
+    '''
+    from ._core import Hub
+    if dtemplate is None:
+        hub = Hub(spec['model'], preset=spec['preset'], verb=False)
+        fields = spec['fields']
+    else:
+        key = (spec['model'], spec['preset'])
+        if key not in dtemplate:
+            template = Hub(spec['model'], preset=spec['preset'], verb=False)
+            dtemplate[key] = (template, _hub_to_spec(template)['fields'])
+        template, tfields = dtemplate[key]
+        hub = template.copy()
+        hub._dfields = _hub_set._own_module(spec['model'], hub._dfields)
+        fields = {k: v for k, v in spec['fields'].items() if not (k in tfields and _same_value(v, tfields[k]))}
+    if len(fields):
+        hub.set_fields(**fields, verb=False)
+    return hub
+
+
+def _create_shm(size):
+    ''' New shared memory block, released by the main process and not by the resource tracker of this process '''
+    try:
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+    except TypeError:
+        # Before python 3.13 the block is always tracked, and would be released when the worker stops
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        if os.name == 'posix':
+            resource_tracker.unregister(getattr(shm, '_name', '/' + shm.name), 'shared_memory')
+        return shm
+
+
+def _run_worker(spec, run_kwargs):
+    '''
+    Rebuild and run one hub in the worker process.
+    The time series are written in shared memory blocks, of which only the names are returned
+    '''
+    hub = _build_hub(spec)
+    hub.run(**run_kwargs)
+
+    R = hub._dfields
+    order, record = hub.dmisc['dfunc_order'], hub.dmisc.get('record')
+    dshm = {}
+    # With a record, the other fields only have the memory of one step, rebuilt in the main process
+    for k in order['differential'] + order['statevar']:
+        if record is not None and k not in record['fields']:
+            continue
+        value = np.ascontiguousarray(R[k]['value'])
+        # The main process owns the block from now on, and releases it
+        shm = _create_shm(max(value.nbytes, 1))
+        np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf)[...] = value
+        dshm[k] = (shm.name, value.shape, value.dtype.str)
+        shm.close()
+    return {'shm': dshm,
+            'dflags': hub.dflags,
+            'solver': hub.dmisc.get('solver'),
+            'dmisc': {k: hub.dmisc.get(k) for k in _LRUN_DMISC}}
+
+
+def _collect(spec, out, dtemplate=None):
+    '''
+    Rebuild the hub in the main process (see `_build_hub` for `dtemplate`) and fill it with the values
+    from the shared memory blocks (which are then released)
+    '''
+    hub = _build_hub(spec, dtemplate)
+    hub._dmisc.update(out['dmisc'])
+    if hub.dmisc['record'] is not None:
+        hub._dfields = _hub_set.set_shapes_values(hub._dfields, hub.dmisc['dfunc_order'], verb=False,
+                                                  record=hub.dmisc['record'])
+    for k, (name, shape, dtype) in out['shm'].items():
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            hub._dfields[k]['value'] = np.array(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+        finally:
+            shm.close()
+            shm.unlink()
+    hub._dargs = _hub_set.get_dargs_by_reference(hub._dfields, hub.dmisc['dfunc_order'])
+    hub._dflags.update(out['dflags'])
+    hub._dmisc['solver'] = out['solver']
+    hub._dmisc['reset'] = False
+    # The statistics give the 'sensitivity' of their fields
+    if hub.dmisc.get('ensemble') is not None:
+        _set_ensemble(hub, hub.dmisc['ensemble'])
+    return hub
+
+
+def _release(out):
+    ''' Free the shared memory blocks of a result that will not be collected '''
+    for name, _, _ in out['shm'].values():
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def run_many(hubs_or_specs: list,
+             workers: int = None,
+             verb=False,
+             **run_kwargs) -> list:
+    """
+    Run many independent hubs in parallel, on multiple processes.
+
+    Each element is transformed in a specification (model, preset, fields), sent to a worker process
+    in which the hub is rebuilt and run. The results are sent back through shared memory, into hubs that are
+    copies of one hub per model and preset (see `Hub.copy`) on which the fields of each specification are set.
+
+    Parameters
+    ----------
+    hubs_or_specs : list
+        Each element is either:
+            * a Hub (its current fields are sent, not the hub itself)
+            * a model name
+            * a dict {'model': model name, 'preset': preset name (optional), 'fields': dict for set_fields (optional)}
+    workers : int, optional
+        Number of processes. If None, the number of CPUs. If 1, everything is run in the current process. Default is None.
+    verb : bool or float, optional
+        Print the number of completed runs, same behavior as `verb` in `Hub.run`. Default is False.
+    **run_kwargs : dict
+        Arguments passed to `Hub.run` (NtimeOutput, NstepsInput, ComputeStatevarEnd, solver...).
+
+    Returns
+    -------
+    list
+        The hubs after their run, in the same order as `hubs_or_specs`.
+        The results of the run kept in dmisc ('record', 'ensemble'...) are sent back with the time series.
+
+    Examples
+    --------
+        hubs = chm.run_many([{'model': 'GK', 'preset': 'default'},
+                             {'model': 'GK', 'fields': {'alpha': 0.03}},
+                             chm.Hub('Goodwin_example')], workers=3)
+    """
+    specs = [_check_spec(s) for s in hubs_or_specs]
+    run_kwargs['verb'] = False
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(specs)))
+    dverb = _hub_check._run_verb_check(verb=verb)
+
+    # Hubs of the same model and preset are copies of the same template
+    dtemplate = {}
+
+    # Sequential case, no worker
+    if workers == 1:
+        out = []
+        t0 = time.time()
+        for ii, spec in enumerate(specs):
+            hub = _build_hub(spec, dtemplate)
+            hub.run(**run_kwargs)
+            out.append(hub)
+            if dverb['verb'] > 0:
+                t0 = _hub_check._print_or_wait(ii=ii, nt=len(specs), t0=t0, **dverb)
+        return out
+
+    out = [None] * len(specs)
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        dfuture = {executor.submit(_run_worker, spec, run_kwargs): ii for ii, spec in enumerate(specs)}
+        try:
+            for ndone, future in enumerate(as_completed(dfuture)):
+                ii = dfuture[future]
+                out[ii] = _collect(specs[ii], future.result(), dtemplate)
+                if dverb['verb'] > 0:
+                    t0 = _hub_check._print_or_wait(ii=ndone, nt=len(specs), t0=t0, **dverb)
+        except Exception as err:
+            # Stop the pending runs and free the memory of the finished ones
+            for future in dfuture:
+                future.cancel()
+            for future, ii in dfuture.items():
+                if out[ii] is None and not future.cancelled() and future.exception() is None:
+                    _release(future.result())
+            raise err
+    return out
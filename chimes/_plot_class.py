@@ -14,12 +14,9 @@ Last Modified: 2024-03-11
 """
 
 
-import pandas as pd
-import inspect
-import types
-
-import os
+import ast
 import importlib
+import os
 
 
 class PlotsClass:
@@ -28,6 +25,9 @@ class PlotsClass:
     You can type `chm.get_available_plots()` to see the list of available plots.
     You can access individual plots using `chm.Plots.NAME_OF_THE_PLOT`.
     To get the documentation of a specific plot, use `chm.Plots.NAME_OF_THE_PLOT.__doc__`.
+
+    The plot files are only parsed at creation (names, docstrings, signatures):
+    a plot module, and the plotting libraries it needs, is imported the first time one of its plots is accessed.
     """
 
     def __init__(self):
@@ -37,37 +37,54 @@ class PlotsClass:
         dir_path = os.path.join(os.path.dirname(__file__), 'plots')
 
         # Get list of .py files in the directory
-        py_files = [file for file in os.listdir(dir_path) if file.endswith('.py') and file != '__init__.py']
+        py_files = sorted(file for file in os.listdir(dir_path) if file.endswith('.py') and file != '__init__.py')
 
+        # {plot name: (module name, short description, signature)}
+        self._registry = {}
         for file_name in py_files:
             module_name = os.path.splitext(file_name)[0]
-            spec = importlib.util.spec_from_file_location(module_name, os.path.join(dir_path, file_name))
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
+            with open(os.path.join(dir_path, file_name), 'r', encoding='utf-8') as f:
+                tree = ast.parse(f.read())
 
-            # Iterate over objects in the module
-            module_functions = [func for name, func in inspect.getmembers(module, inspect.isfunction)
-                                if func.__module__ == module_name]
-            for func in module_functions:
-                # Add the function as a method to the class
-                setattr(self, func.__name__, func)
+            # Top-level functions of the module
+            for node in tree.body:
+                if isinstance(node, ast.FunctionDef):
+                    signature = f'({ast.unparse(node.args)})'
+                    if node.returns is not None:
+                        signature += f' -> {ast.unparse(node.returns)}'
+                    self._registry[node.name] = (module_name, ast.get_docstring(node, clean=False), signature)
 
-        #################################################
+        self.description = "CHIMES Plotting Toolbox. check `chm.Plots.documentation` for more information."
 
-        # Create a documentation dataframe
-        methods = [method for method in dir(self) if '__' not in method]
+    def __getattr__(self, name):
+        # Only called when the plot has not been imported yet
+        registry = self.__dict__.get('_registry', {})
+        if name not in registry:
+            raise AttributeError(f"Plots has no plot {name}. Available plots are {list(registry.keys())}")
+        module = importlib.import_module(f'.plots.{registry[name][0]}', package=__package__)
+        for plotname, (module_name, _, _) in registry.items():
+            if module_name == registry[name][0]:
+                setattr(self, plotname, getattr(module, plotname))
+        return self.__dict__[name]
+
+    def __dir__(self):
+        return list(super().__dir__()) + [k for k in self._registry.keys() if k not in self.__dict__]
+
+    @property
+    def documentation(self):
+        """ Dataframe of the short description and the signature of each plot """
+        import pandas as pd
         result = {}
-        for method in methods:
-            Docs = getattr(self, method).__doc__
-            signature = inspect.signature(getattr(self, method))
+        for method, (_, Docs, signature) in sorted(self._registry.items()):
+            if '__' in method:
+                continue
             if Docs:
                 Docs = Docs.split('\n')
                 result[method] = {'short description': Docs[1],
                                   'signature': signature}
             else:
                 print('PlotClass: No docstring found for method: ', method)
-        self.documentation = pd.DataFrame(result).transpose()
-        self.description = "CHIMES Plotting Toolbox. check `chm.Plots.documentation` for more information."
+        return pd.DataFrame(result).transpose()
 
 
 Plots = PlotsClass()
@@ -8,9 +8,11 @@ from ._config import config  # _SAVE_FOLDER
 from ._core_functions._distribution_generator import *
 import inspect
 from ._core_functions import _utils
+from ._core_functions import _save_method
 
 __all__ = [
     'load',
+    'load_saved_fields',
     'generate_dic_distribution'
 ]
 
@@ -173,44 +175,53 @@ def _printsubgroupe(sub, it):
     print('\n')
 
 
-def load_saved(name: str,
-               localsave=True,
-               verb=True):
+def _save_address(name: str, localsave=True):
     '''
-    Load a .chm file to create a hub. You can create those files, by creating a hub
-    `Hub=chm.Hub(modelname)
-    Hub.save(name)`
-
-    name if the path to the file. It can be relative, it can be with or without .chm
-    verb is a boolean, to get a loaded message or not when load
+    Complete path of a saved file: add the .chm extension if there is none, and the CHIMES save folder if localsave
     '''
-
     _SAVE_FOLDER = config.get_current('_SAVE_FOLDER')
     _PATH_SAVE = os.path.join(
         os.path.dirname(os.path.abspath(os.path.dirname(__file__))),
         _SAVE_FOLDER)
 
     # NAME MANAGEMENT
-    if (name[-4:] != '.chm' and '.' not in name):
+    if (name[-4:] not in ['.chm', '.npz'] and '.' not in name):
         name = name + '.chm'
-    if name[-4:] == '.chm':
+    if name[-4:] in ['.chm', '.npz']:
         pass
     elif '.' in name:
-        raise Exception(f"extension not understood :{name.split('.')[1]}, expected .chm or nothing")
+        raise Exception(f"extension not understood :{name.split('.')[1]}, expected .chm, .npz or nothing")
 
     # RELATIVE PATH
     if localsave:
-        address = os.path.join(_PATH_SAVE, name)
-    else:
-        address = name
+        return os.path.join(_PATH_SAVE, name)
+    return name
+
+
+def load_saved(name: str,
+               localsave=True,
+               verb=True):
+    '''
+    Load a .chm or .npz file to create a hub. You can create those files, by creating a hub
+    `Hub=chm.Hub(modelname)
+    Hub.save(name)`
+
+    name if the path to the file. It can be relative, it can be with or without .chm
+    verb is a boolean, to get a loaded message or not when load
+    A .npz file is rebuilt from its model file, which has to be available.
+    '''
+    address = _save_address(name, localsave)
 
     # LOADING FILE
     if verb:
         print('loading:', address)
-    with open(address, 'rb') as f:
-        file = cloudpickle.load(f)
-        hub = file['hub']
-        description = file['description']
+    if address[-4:] == '.npz':
+        hub, description = _save_method._load_npz(address)
+    else:
+        with open(address, 'rb') as f:
+            file = cloudpickle.load(f)
+            hub = file['hub']
+            description = file['description']
 
     # CHECKING INTEGRITY
     if verb:
@@ -218,3 +229,32 @@ def load_saved(name: str,
         print('Description:', description)
 
     return hub
+
+
+def load_saved_fields(name: str,
+                      fields: Union[str, list],
+                      localsave=True) -> dict:
+    '''
+    Read some time series of a .npz save, without rebuilding the hub.
+    Only the requested arrays are decompressed, so it stays fast on big saves.
+
+    Parameters
+    ----------
+    name : str
+        Path to the .npz file, relative to the CHIMES save folder if `localsave`.
+    fields : str or list
+        Name(s) of the fields to read.
+    localsave : bool, optional
+        If True, `name` is relative to the CHIMES save folder. Default is True.
+
+    Returns
+    -------
+    dict
+        {field: array of shape (nt, nx, nr, a, b)}
+    '''
+    if name[-4:] != '.npz':
+        name = name + '.npz'
+    address = _save_address(name, localsave)
+    if isinstance(fields, str):
+        fields = [fields]
+    return _save_method._read_npz_fields(address, fields)
@@ -1,10 +1,12 @@
 # IMPORTATIONS
 import os
+import ast
+import json
 import importlib
 
 from ._def_fields import _DFIELDS, _complete_DFIELDS
 from .functions_library import Funcs
-from .operators_library import Operators
+from .operators_library import Operators, _TOPOLOGIES
 
 
 # from .._config import _PATH_PRIVATE_MODELS, _PATH_MODELS  # _MODEL_NAME_CONVENTIONl, _MODEL_FOLDER_HIDDEN
@@ -58,6 +60,123 @@ def _scan_modelfolders(model: str = False,
     return _df
 
 
+# Model file attributes kept in the model index: key in the index, attribute in the model file
+_INDEX_ATTRIBUTES = {
+    'date': '_DATE',
+    'article': '_ARTICLE',
+    'Coder': '_CODER',
+    'Keywords': '_KEYWORDS',
+    'presets': '_PRESETS',
+    'longDescription': '_DESCRIPTION',
+    'Todo': '_TODO',
+}
+_INDEX_VERSION = 1
+# In-memory copy of the model index, {address: entry}
+_DINDEX = {}
+
+
+def _read_model_metadata(address: str) -> dict:
+    '''
+    Read the description, presets names and attributes of a model file without executing it.
+    The module is only executed if one of these attributes is not a literal (built by code, imported from another model...).
+    '''
+    with open(address + '.py', 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+
+    meta = {'description': ast.get_docstring(tree, clean=False)}
+    lpresets = []
+    static = True
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets, value = [node.target], node.value
+        else:
+            continue
+        for target in targets:
+            # _PRESETS['name'] = ...
+            if (isinstance(target, ast.Subscript) and isinstance(target.value, ast.Name)
+                    and target.value.id == '_PRESETS'):
+                key = target.slice.value if isinstance(target.slice, ast.Constant) else None
+                if key is None:
+                    static = False
+                elif key not in lpresets:
+                    lpresets.append(key)
+            elif isinstance(target, (ast.Tuple, ast.List)):
+                if any(isinstance(e, ast.Name) and e.id in _INDEX_ATTRIBUTES.values() for e in target.elts):
+                    static = False
+            elif isinstance(target, ast.Name) and target.id == '_PRESETS':
+                if isinstance(value, ast.Dict) and all(isinstance(k, ast.Constant) for k in value.keys):
+                    lpresets = [k.value for k in value.keys]
+                elif (isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and value.func.id == 'dict'
+                      and not value.args and all(k.arg is not None for k in value.keywords)):
+                    lpresets = [k.arg for k in value.keywords]
+                else:
+                    static = False
+            elif isinstance(target, ast.Name) and target.id in _INDEX_ATTRIBUTES.values():
+                try:
+                    meta[target.id] = ast.literal_eval(value)
+                except ValueError:
+                    static = False
+
+    if not static:
+        spec = importlib.util.spec_from_file_location(address, address + '.py')
+        foo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(foo)
+        dic = _add_model_elements(foo, {'description': foo.__doc__})
+        dic['presets'] = list(dic['presets'])
+        return {k: dic[k] for k in ['description'] + list(_INDEX_ATTRIBUTES.keys())}
+
+    out = {'description': meta['description'],
+           'presets': lpresets}
+    for key, attr in _INDEX_ATTRIBUTES.items():
+        if key != 'presets':
+            out[key] = meta.get(attr, meta['description'] if key == 'longDescription' else
+                                [] if key in ['Keywords', 'Todo'] else '')
+    return out
+
+
+def _get_model_index(_LOCAL_MODEL: str = None) -> dict:
+    '''
+    Index of all models, {model name: {'name', 'file', 'address', 'description', 'presets', 'Keywords', ...}}.
+
+    The entries are kept in memory with the modification time and size of each model file: only the new or modified
+    files are read again, and they are not executed (see `_read_model_metadata`). If the `_MODEL_INDEX` key of the
+    config is a file (None by default), the entries are also kept in it between sessions.
+    '''
+    index_file = config.get_current('_MODEL_INDEX')
+    if not _DINDEX and index_file and os.path.isfile(index_file):
+        try:
+            with open(index_file, 'r') as f:
+                content = json.load(f)
+            if content.get('version') == _INDEX_VERSION:
+                _DINDEX.update(content['models'])
+        except (OSError, ValueError):
+            pass
+
+    changed = False
+    out = {}
+    for address, name in _scan_modelfolders(None, _LOCAL_MODEL).items():
+        stat = os.stat(address + '.py')
+        key = [stat.st_mtime_ns, stat.st_size]
+        entry = _DINDEX.get(address)
+        if entry is None or entry['key'] != key:
+            entry = {'key': key, 'meta': _read_model_metadata(address)}
+            _DINDEX[address] = entry
+            changed = True
+        out[name] = dict(entry['meta'], name=name, file=address + '.py', address=address)
+
+    if changed and index_file:
+        try:
+            os.makedirs(os.path.dirname(index_file), exist_ok=True)
+            with open(index_file + '.tmp', 'w') as f:
+                json.dump({'version': _INDEX_VERSION, 'models': _DINDEX}, f, default=str)
+            os.replace(index_file + '.tmp', index_file)
+        except OSError:
+            pass
+    return out
+
+
 def _add_model_elements(foo, dic):
     '''Automatically add specified attributes from foo to dic.'''
     attributes = {
@@ -109,23 +228,29 @@ def _get_DMODEL(model: str = None,
         foo = importlib.util.module_from_spec(spec)
 
         spec.loader.exec_module(foo)
-        _DMODEL[v0] = {
-            'logics': {k0: dict(v0) for k0, v0 in foo._LOGICS.items()},
-            'file': foo.__file__,
-            'description': foo.__doc__,
-            'name': v0,
-            'address': k0,
-        }
-
-        _DMODEL[v0] = _add_model_elements(foo, _DMODEL[v0])
-        _DMODEL[v0] = expandabbreviates(_DMODEL[v0])
-        _DMODEL[v0] = _detect_sizes(_DMODEL[v0])
-        _DMODEL[v0] = _change_categories_names(_DMODEL[v0])
-        _DMODEL[v0] = detect_multiple_definitions(_DMODEL[v0])
-        _DMODEL[v0] = replace_keys_fields(_DMODEL[v0])
+        _DMODEL[v0] = _module_to_dmodel(foo, v0, k0)
     return _DMODEL
 
 
+def _module_to_dmodel(foo, name, address):
+    '''Model dictionnary of the executed model file `foo`'''
+    dmodel = {
+        'logics': {k0: dict(v0) for k0, v0 in foo._LOGICS.items()},
+        'file': foo.__file__,
+        'description': foo.__doc__,
+        'name': name,
+        'address': address,
+    }
+
+    dmodel = _add_model_elements(foo, dmodel)
+    dmodel = expandabbreviates(dmodel)
+    dmodel = _detect_sizes(dmodel)
+    dmodel = _change_categories_names(dmodel)
+    dmodel = detect_multiple_definitions(dmodel)
+    dmodel = replace_keys_fields(dmodel)
+    return dmodel
+
+
 def replace_keys_fields(model):
     """
     For each variables in the model, improve key names if hastly written
@@ -191,7 +316,9 @@ def _detect_sizes(model):
     """check if the sizes are consistent with the list of values. If not, correct it.
     """
     for k, v in model['logics'].get('size', {}).items():
-        if 'value' not in v.keys():
+        if isinstance(v.get('value'), _TOPOLOGIES):
+            v['list'] = [str(v['value'])]
+        elif 'value' not in v.keys():
             v['value'] = len(v['list'])
         elif 'list' not in v.keys():
             v['list'] = [i for i in range(v['value'])]
@@ -1160,4 +1160,20 @@ ADDITIONAL_FIELDS = {
             'units': '',
         },
     },
+    'Spatial': {
+        'grid': {
+            'value': 1,
+            'list': [''],
+            'units': '',
+            'definition': 'Topology of the regions as a regular grid (Operators.Grid), 1D by default',
+            'eqtype': 'size',
+        },
+        'network': {
+            'value': 1,
+            'list': [''],
+            'units': '',
+            'definition': 'Topology of a network of nodes and edges (Operators.Network), given in a preset',
+            'eqtype': 'size',
+        },
+    },
 }
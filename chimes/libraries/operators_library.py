@@ -2,7 +2,190 @@ import numpy as np
 
 # ######################## OPERATORS ####################################
 '''Those are operators that can be used to do multisectoral operations :
-coupling, transposition, sums...'''
+coupling, transposition, sums...
+
+Coupling matrices (the M of `matmul`, the nabla of `Rmatmul`) can be scipy.sparse matrices:
+they are stored as they are by `set_fields` and the presets, with only the two coupled dimensions (no nx).'''
+
+
+def _issparse(M):
+    '''True if M is a scipy.sparse matrix or array (without importing scipy)'''
+    return type(M).__module__.startswith('scipy.sparse')
+
+
+def _shift(X, axis, step, boundary):
+    '''Value of the neighbour at +1 or -1 (`step`) along `axis`, the outer neighbour being the edge itself for 'neumann' '''
+    if boundary == 'periodic':
+        return np.roll(X, -step, axis=axis)
+    n = X.shape[axis]
+    out = np.empty_like(X)
+    before = (slice(None),) * axis
+    if step == 1:
+        out[before + (slice(0, n - 1),)] = X[before + (slice(1, n),)]
+        out[before + (slice(n - 1, n),)] = X[before + (slice(n - 1, n),)]
+    else:
+        out[before + (slice(1, n),)] = X[before + (slice(0, n - 1),)]
+        out[before + (slice(0, 1),)] = X[before + (slice(0, 1),)]
+    return out
+
+
+class Grid:
+    '''Regions seen as the cells of a regular 1D, 2D or 3D grid, for matrix-free finite differences.
+
+    grid = Grid(shape, dx=1., boundary='periodic') with shape=(nx,), (nx, ny) or (nx, ny, nz), and prod(shape)=nr.
+    The region r is the cell np.unravel_index(r, shape). dx is the cell size (one value, or one per axis),
+    boundary is 'periodic' or 'neumann' (no flux: the outer neighbour of an edge cell is the cell itself).
+    In a model, it is the value of the size field `grid`, given in a preset: the operators are called as
+    `lapC = O.Grid.laplacian(C, grid)`. If `grid` is not set, the regions are a 1D periodic grid of step 1.
+    An axis that the grid does not have is considered as made of one cell (its derivatives are 0).
+    Each operator costs O(nr) and uses no matrix.'''
+
+    def __init__(self, shape, dx=1., boundary='periodic'):
+        self.shape = tuple(int(n) for n in np.atleast_1d(shape))
+        self.ndim = len(self.shape)
+        self.size = int(np.prod(self.shape))
+        self.dx = tuple(float(d) for d in np.broadcast_to(dx, (self.ndim,)))
+        if boundary not in ['periodic', 'neumann']:
+            raise Exception(f"Grid boundary should be 'periodic' or 'neumann', you gave {boundary}")
+        self.boundary = boundary
+
+    def __repr__(self):
+        return f'Grid(shape={self.shape}, dx={self.dx}, boundary={self.boundary!r})'
+
+    def __str__(self):
+        return f"{'x'.join(str(n) for n in self.shape)} {self.boundary}"
+
+    def todict(self):
+        '''Description of the grid, such that Grid(**grid.todict()) is the same grid'''
+        return {'shape': list(self.shape), 'dx': list(self.dx), 'boundary': self.boundary}
+
+    @property
+    def dimensions(self):
+        '''Sizes fixed by the grid, set with it by `set_fields`'''
+        return {'nr': self.size}
+
+    @staticmethod
+    def _reshape(C, grid):
+        '''C with its regions axis unfolded on the grid, the grid, and the position of the first grid axis'''
+        if not isinstance(grid, Grid):
+            grid = Grid(np.shape(C)[-3])
+        shape = np.shape(C)
+        return np.reshape(C, shape[:-3] + grid.shape + shape[-2:]), grid, len(shape) - 3
+
+    def laplacian(C, grid):
+        '''Laplacian of C on the grid, second order centred:
+        Z = sum_d (C_{i+1} - 2 C_i + C_{i-1}) / dx_d^2'''
+        X, grid, first = Grid._reshape(C, grid)
+        Z = np.zeros_like(X)
+        for d in range(grid.ndim):
+            Z += (_shift(X, first + d, 1, grid.boundary) + _shift(X, first + d, -1, grid.boundary) - 2 * X) / grid.dx[d] ** 2
+        return np.reshape(Z, np.shape(C))
+
+    def gradient(C, grid, axis=0):
+        '''Derivative of C along the grid `axis`, centred:
+        Z = (C_{i+1} - C_{i-1}) / (2 dx)'''
+        X, grid, first = Grid._reshape(C, grid)
+        if axis >= grid.ndim:
+            return np.zeros_like(C)
+        Z = (_shift(X, first + axis, 1, grid.boundary) - _shift(X, first + axis, -1, grid.boundary)) / (2 * grid.dx[axis])
+        return np.reshape(Z, np.shape(C))
+
+    def advection(C, u, grid, axis=0):
+        '''Advection term u dC/dx along the grid `axis`, upwind:
+        Z = u (C_i - C_{i-1}) / dx if u>0, u (C_{i+1} - C_i) / dx otherwise.
+        u is a scalar or has the shape of C. The transport equation is dC/dt = -advection(C, u, grid)'''
+        X, grid, first = Grid._reshape(C, grid)
+        if axis >= grid.ndim:
+            return np.zeros_like(C)
+        U = np.reshape(np.broadcast_to(u, np.shape(C)), np.shape(X))
+        back = X - _shift(X, first + axis, -1, grid.boundary)
+        front = _shift(X, first + axis, 1, grid.boundary) - X
+        return np.reshape(U * np.where(U > 0, back, front) / grid.dx[axis], np.shape(C))
+
+
+class Network:
+    '''Nodes linked by edges, stored as an edge list, for matrix-free dynamics on a network.
+
+    network = Network(node1, node2, Nnodes=None, nodes='Nnodes', edges='Nedges'): the edge j goes from the node node1[j]
+    to the node node2[j], Nnodes is the number of nodes (by default the largest index + 1).
+    `nodes` and `edges` are the names of the size fields along which the model puts its nodes and its edges
+    (multisectoral axis): giving the network to `set_fields` sets both of them.
+    In a model, it is the value of the size field `network`, given once in a preset: per-edge fields are computed with
+    `dx = O.Network.difference(x, network)`, then summed back on the nodes with `F = O.Network.divergence(f, network)`.
+    Each operator costs O(Nedges), where the dense (Nnodes, Nnodes) formulation costs O(Nnodes^2).'''
+
+    def __init__(self, node1, node2, Nnodes=None, nodes='Nnodes', edges='Nedges'):
+        self.node1 = np.atleast_1d(np.asarray(node1, dtype=int))
+        self.node2 = np.atleast_1d(np.asarray(node2, dtype=int))
+        if self.node1.shape != self.node2.shape or self.node1.ndim != 1:
+            raise Exception(f'Network needs two lists of nodes of the same length, you gave {self.node1.shape} and {self.node2.shape}')
+        self.Nnodes = int(np.max(np.r_[self.node1, self.node2]) + 1) if Nnodes is None else int(Nnodes)
+        self.Nedges = len(self.node1)
+        if self.Nedges and (min(self.node1.min(), self.node2.min()) < 0
+                            or max(self.node1.max(), self.node2.max()) >= self.Nnodes):
+            raise Exception(f'Network nodes should be between 0 and {self.Nnodes - 1}')
+        self.nodes = nodes
+        self.edges = edges
+        self._dindex = {}
+
+    def __repr__(self):
+        return f'Network(Nnodes={self.Nnodes}, Nedges={self.Nedges}, nodes={self.nodes!r}, edges={self.edges!r})'
+
+    def __str__(self):
+        return f'{self.Nnodes} nodes {self.Nedges} edges'
+
+    def todict(self):
+        '''Description of the network, such that Network(**network.todict()) is the same network'''
+        return {'node1': self.node1.tolist(), 'node2': self.node2.tolist(), 'Nnodes': self.Nnodes,
+                'nodes': self.nodes, 'edges': self.edges}
+
+    @property
+    def dimensions(self):
+        '''Sizes fixed by the network, set with it by `set_fields`'''
+        return {self.nodes: self.Nnodes, self.edges: self.Nedges}
+
+    @staticmethod
+    def from_matrix(M, **kwargs):
+        '''Network with one edge for each non-zero M_ij, i<j, of a symmetric (Nnodes, Nnodes) matrix.
+        The weights of the edges are M[network.node1, network.node2]'''
+        node1, node2 = np.nonzero(np.triu(np.asarray(M), 1))
+        return Network(node1, node2, Nnodes=np.shape(M)[-1], **kwargs)
+
+    def _index(self, end, m):
+        '''Flat position of each edge end for m vectors of nodes, cached'''
+        if (end, m) not in self._dindex:
+            node = self.node1 if end == 0 else self.node2
+            self._dindex[(end, m)] = (np.arange(m)[:, None] * self.Nnodes + node[None, :]).ravel()
+        return self._dindex[(end, m)]
+
+    def gather(X, network, end=0):
+        '''Value of the node field X at the first (end=0) or second (end=1) node of each edge:
+        Z_j = X_{node1_j}'''
+        return np.take(X, network.node1 if end == 0 else network.node2, axis=-2)
+
+    def difference(X, network):
+        '''Difference of the node field X along each edge:
+        Z_j = X_{node1_j} - X_{node2_j}'''
+        return np.take(X, network.node1, axis=-2) - np.take(X, network.node2, axis=-2)
+
+    def scatter(E, network, end=0):
+        r'''Sum of the edge field E on the first (end=0) or second (end=1) node of each edge:
+        Z_i = \sum_{j, node1_j=i} E_j'''
+        X = np.moveaxis(np.asarray(E, dtype=float), -2, -1)
+        X = np.broadcast_to(X, X.shape[:-1] + (network.Nedges,))
+        lead = X.shape[:-1]
+        m = int(np.prod(lead))
+        Z = np.bincount(network._index(end, m), weights=X.reshape(-1), minlength=m * network.Nnodes)
+        return np.moveaxis(Z.reshape(lead + (network.Nnodes,)), -1, -2)
+
+    def divergence(E, network):
+        r'''Sum on each node of the edge field E, counted positively on the first node of the edge and negatively on the second
+        (such as the forces of springs): Z_i = \sum_{j, node1_j=i} E_j - \sum_{j, node2_j=i} E_j'''
+        return Network.scatter(E, network, 0) - Network.scatter(E, network, 1)
+
+
+# Objects describing a topology, kept as they are as the value of their size field (`grid`, `network`)
+_TOPOLOGIES = (Grid, Network)
 
 
 class Operators:
@@ -34,7 +217,11 @@ class Operators:
         return np.moveaxis(X, -1, -2)
 
     def matmul(M, V):
-        '''Matrix product Z=matmul(M,V) Z_i = \sum_j M_{ij} V_j'''
+        r'''Matrix product Z=matmul(M,V) Z_i = \sum_j M_{ij} V_j
+        M can be a scipy.sparse matrix of shape (multi, multi), applied on the multisectoral axis of V'''
+        if _issparse(M):
+            X = np.moveaxis(V, -2, 0)
+            return np.moveaxis((M @ X.reshape(X.shape[0], -1)).reshape(X.shape), 0, -2)
         return np.matmul(M, V)
 
     # ## Regional operations (Coupling regions) #########################
@@ -47,11 +234,22 @@ class Operators:
         return np.moveaxis(X, -2, -3)
 
     def Rmatmul(nabla, C):
-        '''Matrix product but with the axis of Regions rather than multisectoral'''
+        r'''Matrix product but with the axis of Regions rather than multisectoral:
+        Z=Rmatmul(X,M) Z_i = \sum_j X_j M_{ji} with i,j regions.
+        M can be a scipy.sparse matrix of shape (nr, nr), which makes the cost proportional to its number of non-zero elements'''
+        if _issparse(C):
+            X = np.moveaxis(nabla, -3, 0)
+            return np.moveaxis((C.T @ X.reshape(X.shape[0], -1)).reshape(X.shape), 0, -3)
         # np.einsum('...ij,...jk->...ik', nabla, C)
         return np.matmul(np.swapaxes(nabla, -3, -1),
                          np.swapaxes(C, -3, -2))
 
+    # ## Regular grid of regions (finite differences without matrix) ####
+    Grid = Grid
+
+    # ## Network of nodes and edges (edge list, without matrix) #########
+    Network = Network
+
     # ## Matrix generation ##############################################
 
     def Identity(X):
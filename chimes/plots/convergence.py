@@ -59,7 +59,7 @@ def convergence(hub, finalpoint: dict, showtrajectory=False, returnFig=False):
     ax.scatter(finalpoint[keys[0]], finalpoint[keys[1]], finalpoint[keys[2]], s=100, c='k')
 
     # Scatter plot with color representing convergence rate
-    R = hub.get_dfields(key=list(finalpoint.keys()) + ['time'], returnas=dict)
+    R = hub.get_dfields(key=list(finalpoint.keys()) + ['time'], returnas='view')
     scat = ax.scatter(R[keys[0]]['value'][0, ConvergeRate > 0.0001],
                       R[keys[1]]['value'][0, ConvergeRate > 0.0001],
                       R[keys[2]]['value'][0, ConvergeRate > 0.0001],
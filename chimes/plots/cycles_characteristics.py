@@ -82,7 +82,7 @@ def cycles_characteristics(
         print('NO RUN DONE YET, DO RUN ON THE SYSTEM STATE')
         hub.run()
 
-    if not hub.dmisc.get('cycles', False):
+    if not hub.dflags.get('cycles', False):
         print('Calculation of cycles on each field as ref...')
         hub.calculate_Cycles(ref=ref)
 
@@ -98,14 +98,15 @@ def cycles_characteristics(
     AllX = []
     AllY = []
     AllC1 = []
-    R = hub.get_dfields()
-    cycs = R[ref]['cycles_bykey']
+    R = hub.get_dfields(returnas='view')
+    cycs = R[ref]['cycles']
 
-    for i in range(hub.dfields['nx']['value']):  # loop on parallel system
-        for j, ids in enumerate(cycs['period_indexes'][i]):  # loop on cycles decomposition
+    for i in range(R['nx']['value']):  # loop on parallel system
+        for j in range(cycs['ncycles'][i, Region, 0, 0]):  # loop on cycles decomposition
+            ids = cycs['period_indexes'][j, i, Region, 0, 0]
             AllX.append(R[xaxis]['value'][ids[0]:ids[1], i, Region, xsector])
             AllY.append(R[yaxis]['value'][ids[0]:ids[1], i, Region, ysector])
-            AllC1.append(cycs[type1][i][j])
+            AllC1.append(cycs[type1][j, i, Region, 0, 0])
 
     if normalize:
         AllC1 /= np.amax(AllC1)
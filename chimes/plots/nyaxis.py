@@ -99,7 +99,7 @@ def nyaxis(
 
     # Local organisation
     allvarname = [x] + [item for sublist in y for item in sublist]
-    R = hub.get_dfields(keys=[allvarname], returnas=dict)
+    R = hub.get_dfields(returnas='view')
     # Prepare x axis
     vx = value(R, x, idt0, idt1, idx, Region)
 
@@ -133,7 +133,7 @@ def nyaxis(
 
                 symbol = name[:-1] + '_{' + sectorname + '}$'
 
-            if sensitivity and ('sensitivity' in hub.dfields[name].keys()):
+            if sensitivity and ('sensitivity' in R[name].keys()):
                 stdy = R[name]['sensitivity'][Region]['']['stdv'][idt0:idt1]
                 vy[ii][yyy] = R[name]['sensitivity'][Region]['']['mean'][idt0:idt1]
 
@@ -93,13 +93,13 @@ def XY(
     hub, idx, Region, idt0, idt1 = _indexes(hub, idx, Region, tini, tend)
 
     # ## INPUT TRANSLATION #############
-    R = hub.dfields
+    R = hub.dfields_view
     x, xsect, xname = _key(R, x)
     y, ysect, yname = _key(R, y)
     color, csect, cname = _key(R, color)
 
     # ## PLOT #################
-    allvars = hub.get_dfields(returnas=dict)
+    allvars = hub.get_dfields(returnas='view')
     t = allvars[color]['value'][idt0:idt1, idx, Region, csect, 0]
     yval = allvars[y]['value'][idt0:idt1, idx, Region, ysect, 0]
     xval = allvars[x]['value'][idt0:idt1, idx, Region, xsect, 0]
@@ -167,7 +167,7 @@ def XYZ(
     hub, idx, Region, idt0, idt1 = _indexes(hub, idx, Region, tini, tend)
 
     # ## INPUT TRANSLATION #############
-    R = hub.dfields
+    R = hub.dfields_view
 
     x, xsect, xname = _key(R, x)
     y, ysect, yname = _key(R, y)
@@ -229,7 +229,7 @@ def PhaseSpace(
     '''
 
     # Load all the value already in the system
-    R = hub.get_dfields()
+    R = hub.get_dfields(returnas='view')
 
     # Check that type are correct
     x, xsect, xname = _key(R, x)
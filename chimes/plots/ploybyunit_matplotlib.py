@@ -100,7 +100,7 @@ def byunits(
            for i, key in enumerate(groupsoffields.keys())}
 
     # GETTING THE DATA
-    R = hub.get_dfields(keys=[allvars], returnas=dict)
+    R = hub.get_dfields(returnas='view')
     vx = R['time']['value'][idt0:idt1, idx, Region, 0, 0]
     vy = {}
     sectorname = {}
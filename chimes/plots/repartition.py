@@ -122,7 +122,7 @@ def repartition(
     else:
         refsign = -1
 
-    R = hub.get_dfields()
+    R = hub.get_dfields(returnas='view')
     # Sector names ##################################################
     if sector in ['', False, None]:
         sectindex = 0
@@ -77,7 +77,7 @@ def Showsensitivity(
         plt.figure(v)
         dic[v] = {}
         for k, H in OUT.items():
-            R = H.get_dfields()
+            R = H.get_dfields(returnas='view')
             time = R['time']['value'][:, 0, 0, 0, 0]
             dic[v][k] = go.Scatter(x=time, y=R[v]['sensitivity'][0]['']['stdv'], mode='lines', name=R.get(k, {'symbol': k})['symbol'])
 
@@ -30,19 +30,19 @@ class ShowSensitivity(PlotlyOfflinePlot):
             if filter._include is True:
                 has_include = True
                 for key, value in hub.items():
-                    filter.fn(key, value.get_dfields(), self.variables)
+                    filter.fn(key, value.get_dfields(returnas='view'), self.variables)
 
         # If there were no include filters, copy each variable into the variable set
         if has_include is False:
             for key, value in hub.items():
-                self.variables[key] = value.get_dfields()
+                self.variables[key] = value.get_dfields(returnas='view')
                 # self.variables[key]['value'] = np.copy(value['value'])
 
         # Finally, run any exclude filters if they are present
         for filter in filters:
             if filter._include is False:
                 for key, value in hub.items():
-                    filter.fn(key, value.get_dfields(), self.variables)
+                    filter.fn(key, value.get_dfields(returnas='view'), self.variables)
 
     def generate(self, variable):
         if variable is None or variable == '':
@@ -180,7 +180,7 @@ def _indexes(hub,
     -------------
     Date: 2024-01-19
     """
-    R = hub.dfields
+    R = hub.dfields_view
 
     if not hub.dflags['run'][0]:
         print('NO RUN DONE YET, SYSTEM IS DOING A RUN WITH GIVEN FIELDS')
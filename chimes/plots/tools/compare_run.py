@@ -9,7 +9,7 @@ def ParrallelRegion(hub, par_reg, typ='parrallel'):
     # par_reg management
 
     if type(par_reg) is bool and par_reg is True:
-        R = hub.get_dfields()
+        R = hub.get_dfields(returnas='view')
         if typ == 'parrallel':
             out = np.arange(R['nx']['value'])
         else:
@@ -64,7 +64,7 @@ def Prepare_data(hubs, variables=(), x='time', parrallel=True, Regions=True, tin
         parrallel = dhub.get('nx', ParrallelRegion(hub, parrallel))
         tini = dhub.get('tini', tini)
         tend = dhub.get('tend', tend)
-        R = hub.get_dfields()
+        R = hub.get_dfields(returnas='view')
 
         # IF hubs have the same
         name = hub.name
@@ -1,14 +1,10 @@
 from enum import Enum
 
-import numpy as np
-
 
 # Globally define the filter functions so that they can be hooked in to each of the classes below
 def key_filter_fn(self, key, value, variables):
     if key == self._field and self._include is True:
         variables[key] = value
-        if 'value' in variables[key]:
-            variables[key]['value'] = np.copy(value['value'])
     elif key == self._field and self._include is False:
         if key in variables:
             del variables[key]
@@ -17,8 +13,6 @@ def key_filter_fn(self, key, value, variables):
 def unit_filter_fn(self, key, value, variables):
     if value['units'] == self._field and self._include is True:
         variables[key] = value
-        if 'value' in variables[key]:
-            variables[key]['value'] = np.copy(value['value'])
     elif value['units'] == self._field and self._include is False:
         if key in variables:
             del variables[key]
@@ -123,9 +123,8 @@ class Plot:
         self._hub = hub
 
         # Reset any previously loaded variables
-        # Make a copy of the d_params so that any modifications made by the filters don't
-        # impact the hub itself
-        dfields = hub.get_dfields()
+        # Fields are read-only views, so that the filters can't impact the hub itself
+        dfields = hub.get_dfields(returnas='view')
         self.variables = {}
 
         # Scan the filters list for include filters and run any we find
@@ -140,7 +139,6 @@ class Plot:
         if has_include is False:
             for key, value in dfields.items():
                 self.variables[key] = value
-                self.variables[key]['value'] = np.copy(value['value'])
 
         # Finally, run any exclude filters if they are present
         for filter in self.filters:
@@ -172,9 +170,9 @@ class CalculateIndicesPlot(Plot):
             pass
         elif isinstance(idx, str):
             try:
-                idx = hub.dfields['nx']['list'].index(idx)
+                idx = hub.dfields_view['nx']['list'].index(idx)
             except BaseException:
-                liste = hub.dfields['nx']['list']
+                liste = hub.dfields_view['nx']['list']
                 raise Exception(f'the parrallel system cannot be found !\n you gave {idx} in {liste}')
         else:
             raise Exception(f'the parrallel index cannot be understood ! you gave {idx}')
@@ -187,9 +185,9 @@ class CalculateIndicesPlot(Plot):
             pass
         elif isinstance(region, str):
             try:
-                region = hub.dfields['nr']['list'].index(region)
+                region = hub.dfields_view['nr']['list'].index(region)
             except BaseException:
-                liste = hub.dfields['nr']['list']
+                liste = hub.dfields_view['nr']['list']
                 raise Exception(f'the parrallel system cannot be found !\n you gave {region} in {liste}')
         else:
             raise Exception(f'the parrallel index cannot be understood ! you gave {region}')
@@ -212,7 +210,7 @@ class CalculateIndicesPlot(Plot):
         return R, idx, region, idt0, idt1
 
     def _calculate_indexes(self, hub, idx, region, tini, tend):
-        R = hub.dfields
+        R = hub.dfields_view
 
         # RUN
         # if not hub.dmisc['run']:
@@ -68,7 +68,7 @@ class PlotByUnits(PlotlyOfflinePlot, CalculateIndicesPlot):
         i = ((row - 1) * SUBPLOT_COLUMNS) + (col - 1)
         self.figure.layout.annotations[i]['text'] = plot_title
 
-        R = self._hub.get_dfields(returnas=dict)
+        R = self._hub.get_dfields(returnas='view')
         vx = R['time']['value'][idt0:idt1, idx, region, 0, 0]
 
         for param in params:
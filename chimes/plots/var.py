@@ -92,7 +92,7 @@ def Var(
         hub.calculate_Cycles()
         print('Done')
 
-    R = hub.dfields
+    R = hub.dfields_view
     key, keysect, keyname = _key(R, key)
 
     fig = plt.figure()
@@ -100,7 +100,7 @@ def Var(
     ax = plt.gca()
 
     # PLOT OF THE BASE
-    allvars = hub.get_dfields(returnas=dict)
+    allvars = hub.get_dfields(returnas='view')
     y = allvars[key]['value'][idt0:idt1, idx, Region, keysect, 0]
     t = allvars['time']['value'][idt0:idt1, idx, Region, 0, 0]
 
@@ -109,10 +109,10 @@ def Var(
 
     # PLOT OF THE CYCLES
     if mode == 'cycles':
-        cycleindex = idx * (R['nx']['value'] * R['nr']['value'] * R[R[key]['size'][0]]['value']) +\
-            Region * (R['nr']['value'] * R[R[key]['size'][0]]['value']) + keysect
-
-        cyclvar = allvars[key]['cycles'][cycleindex]
+        cycles = allvars[key]['cycles']
+        nc = cycles['ncycles'][idx, Region, keysect, 0]
+        cyclvar = {k: cycles[k][:nc, idx, Region, keysect, 0] for k in
+                   ['period_T_intervals', 't_mean_cycle', 'minval', 'maxval', 'meanval', 'medval', 'stdval']}
         tmcycles = cyclvar['t_mean_cycle']
 
         # Plot of each period by a rectangle
@@ -141,14 +141,14 @@ def Var(
         plt.legend()
 
     if mode == 'sensitivity':
-        time = hub.dfields['time']['value'][idt0:idt1, idx, Region, keysect, 0]
+        time = R['time']['value'][idt0:idt1, idx, Region, keysect, 0]
 
-        V = hub.dfields[key]['sensitivity'][Region][keyname]
+        V = R[key]['sensitivity'][Region][keyname]
 
         # Plot all trajectory
 
         for jj in range(len(allvars[key]['value'][0, :, 0, 0, 0])):
-            ax.plot(time, hub.dfields[key]['value'][idt0:idt1, jj, Region, 0, 0], c='k', ls='--', lw=0.5)
+            ax.plot(time, R[key]['value'][idt0:idt1, jj, Region, 0, 0], c='k', ls='--', lw=0.5)
             if jj == 30:
                 print('WARNING: plotvar should be coded with a linecollection...')
 
@@ -21,22 +21,8 @@ plt.show()
 ```
 """
 import numpy as np
-# ######################## OPERATORS ####################################
-'''
-Those are operators that can be used to do multisectoral operations :
-coupling, transposition, sums...
-'''
-
-
-def matmul(M, V):
-    '''Matrix product Z=matmul(M,V) Z_i = \sum_j M_{ij} V_j'''
-    return np.matmul(M, V)
-
-
-def Rmatmul(nabla, C):
-    '''Matrix product but with the axis of Regions rather than multisectoral'''
-    return matmul(np.swapaxes(nabla, -3, -1),
-                  np.swapaxes(C, -3, -2))
+import scipy.sparse
+from chimes.libraries import Operators as O
 
 
 # #######################################################################
@@ -98,18 +84,18 @@ _LOGICS = {
     },
     'statevar': {
         'gradCx': {
-            'func': lambda C, nablax: Rmatmul(C, nablax),
+            'func': lambda C, nablax: O.Rmatmul(C, nablax),
             'definition': '1d gradient of C',
             'com': 'calculated with nabla matrix multiplication'},
         'gradCy': {
-            'func': lambda C, nablay: Rmatmul(C, nablay),
+            'func': lambda C, nablay: O.Rmatmul(C, nablay),
             'definition': '1d gradient of C',
             'com': 'calculated with nabla matrix multiplication'},
         'lapxC': {
-            'func': lambda C, lapx: Rmatmul(C, lapx),
+            'func': lambda C, lapx: O.Rmatmul(C, lapx),
         },
         'lapyC': {
-            'func': lambda C, lapy: Rmatmul(C, lapy),
+            'func': lambda C, lapy: O.Rmatmul(C, lapy),
         },
     },
     'parameter': {
@@ -143,34 +129,29 @@ X2 = XX.reshape(-1)
 Y2 = YY.reshape(-1)
 
 # Spatial operator (should be normalized etc)
+# Sparse (NN, NN) matrices, applied on the regions by O.Rmatmul: only the 5-point stencil is stored
+def stencil(entries):
+    '''Sparse (NN, NN) matrix from a list of (rows, columns, value)'''
+    rows = np.concatenate([r for r, c, v in entries])
+    cols = np.concatenate([c for r, c, v in entries])
+    vals = np.concatenate([np.full(NN, v) for r, c, v in entries])
+    return scipy.sparse.csr_matrix((vals, (rows, cols)), shape=(NN, NN))
 
 
+ii = np.arange(NN)
 # THOSE TWO SEEMS TO BE NOT WORKING
-diffmatX = np.zeros((NN, NN))
-diffmatX[np.arange(NN) % NN, (np.arange(NN) + 1) % NN] = 1 / (2 * dx)
-diffmatX[(np.arange(NN) + 1) % NN, np.arange(NN) % NN] = -1 / (2 * dx)
-diffmatY = np.zeros((NN, NN))
-diffmatY[(np.arange(NN)) % NN, (N + np.arange(NN)) % NN] = 1 / (2 * dx)
-diffmatY[(N + np.arange(NN)) % NN, (np.arange(NN)) % NN] = -1 / (2 * dx)
-nablax = np.zeros((1, NN, NN, 1))
-nablax[0, :, :, 0] = diffmatX
-nablay = np.zeros((1, NN, NN, 1))
-nablay[0, :, :, 0] = diffmatY * 0
+nablax = stencil([(ii, (ii + 1) % NN, 1 / (2 * dx)),
+                  ((ii + 1) % NN, ii, -1 / (2 * dx))])
+nablay = stencil([(ii, (N + ii) % NN, 1 / (2 * dx)),
+                  ((N + ii) % NN, ii, -1 / (2 * dx))]) * 0
 
 # LAPLACIAN IS WORKING
-lapX = np.zeros((NN, NN))
-lapX[np.arange(NN) % NN, np.arange(NN) % NN] = -2
-lapX[(np.arange(NN) + 1) % NN, np.arange(NN) % NN] = 1
-lapX[(np.arange(NN)) % NN, (np.arange(NN) + 1) % NN] = 1
-
-lapY = np.zeros((NN, NN))
-lapY[np.arange(NN) % NN, np.arange(NN) % NN] = -2
-lapY[(np.arange(NN) + N) % NN, np.arange(NN) % NN] = 1
-lapY[(np.arange(NN)) % NN, (np.arange(NN) + N) % NN] = 1
-Lapx = np.zeros((1, NN, NN, 1))
-Lapx[0, :, :, 0] = lapX
-Lapy = np.zeros((1, NN, NN, 1))
-Lapy[0, :, :, 0] = lapY
+Lapx = stencil([(ii, ii, -2),
+                ((ii + 1) % NN, ii, 1),
+                (ii, (ii + 1) % NN, 1)])
+Lapy = stencil([(ii, ii, -2),
+                ((ii + N) % NN, ii, 1),
+                (ii, (ii + N) % NN, 1)])
 
 ZZ = np.exp(- 50 * (np.sqrt((XX - 0.5)**2 + (YY - 0.5)**2)))
 C = np.zeros((1, NN, 1, 1))
@@ -17,104 +17,81 @@ _LOGICS = {
     'size': {
     },
     'differential': {
-        'h': dict(func=lambda nablax, nablay, H, h, u, v: -O.Rmatmul((H+h)*u, nablax)-O.Rmatmul((H+h)*v, nablay),
-                  definition='wave height',
-                  initial=0.0,
-                  ),
-
-        'u': dict(fun=lambda hx, u, v, ux, uy, uxx, uyy, g, k, nu: -g*hx-k*u+nu*(uxx+uyy)-u*ux-v*uy,
-                  ),
-        'v': dict(fun=lambda hy, u, v, vx, vy, vxx, vyy, g, k, nu: -g*hy-k*u+nu*(vxx+vyy)-u*vx-v*vy,
-                  ),
-
+        'h': {
+            'func': lambda H, h, u, v, grid: -O.Grid.gradient((H + h) * u, grid, 0) - O.Grid.gradient((H + h) * v, grid, 1),
+            'definition': 'wave height',
+            'initial': 0.0,
+        },
+        'u': {
+            'func': lambda hx, u, advu, lapu, g, k, nu: -g * hx - k * u + nu * lapu - advu,
+            'definition': 'speed along x',
+            'initial': 0.0,
+        },
+        'v': {
+            'func': lambda hy, v, advv, lapv, g, k, nu: -g * hy - k * v + nu * lapv - advv,
+            'definition': 'speed along y',
+            'initial': 0.0,
+        },
     },
     'statevar': {
-        'ux': dict(lambda u, nablax: O.Rmatmul(u, nablax)),
-        'uy': dict(lambda u, nablay: O.Rmatmul(u, nablay)),
-        'vx': dict(lambda v, nablax: O.Rmatmul(v, nablax)),
-        'vy': dict(lambda v, nablay: O.Rmatmul(v, nablay)),
-        'hx': dict(lambda h, nablax: O.Rmatmul(h, nablax)),
-        'hy': dict(lambda h, nablay: O.Rmatmul(h, nablay)),
-
-        'uxx': dict(lambda ux, nablax: O.Rmatmul(ux, nablax)),
-        'uyy': dict(lambda uy, nablay: O.Rmatmul(uy, nablay)),
-        'vxx': dict(lambda vx, nablax: O.Rmatmul(vx, nablax)),
-        'vyy': dict(lambda vy, nablay: O.Rmatmul(vy, nablay)),
+        'hx': {
+            'func': lambda h, grid: O.Grid.gradient(h, grid, 0),
+            'definition': 'x-gradient of the height',
+        },
+        'hy': {
+            'func': lambda h, grid: O.Grid.gradient(h, grid, 1),
+            'definition': 'y-gradient of the height',
+        },
+        'advu': {
+            'func': lambda u, v, grid: O.Grid.advection(u, u, grid, 0) + O.Grid.advection(u, v, grid, 1),
+            'definition': 'advection of u, upwind',
+        },
+        'advv': {
+            'func': lambda u, v, grid: O.Grid.advection(v, u, grid, 0) + O.Grid.advection(v, v, grid, 1),
+            'definition': 'advection of v, upwind',
+        },
+        'lapu': {
+            'func': lambda u, grid: O.Grid.laplacian(u, grid),
+            'definition': 'laplacian of u',
+        },
+        'lapv': {
+            'func': lambda v, grid: O.Grid.laplacian(v, grid),
+            'definition': 'laplacian of v',
+        },
     },
     'parameter': {
-        'H': dict(value=3),
-        'g': dict(value=10),
-        'nu': dict(value=1),
-        'nablax': {'value': 0,
-                   'definition': 'spatial operator',
-                   'size': ['nr']},
-        'nablay': {'value': 0,
-                   'definition': 'spatial operator',
-                   'size': ['nr']}
+        'H': {'value': 3, 'definition': 'mean depth'},
+        'g': {'value': 10, 'definition': 'gravity'},
+        'k': {'value': 0.1, 'definition': 'friction'},
+        'nu': {'value': 0.1, 'definition': 'viscosity'},
     },
 }
 
 
-def plot(hub):
-    '''Plot time-slices of the concentration (horizontal time, vertical spatial).
-    First concentration, second time variation, third gradient, fourth laplacian'''
+def plot(hub, t=-1):
+    '''Height of the water on the grid at the time index t'''
     import matplotlib.pyplot as plt
     R = hub.get_dfields()
-    C = R['C']['value'][:, 0, :, 0]
-    dC = R['dC']['value'][:, 0, :, 0]
-    gradC = R['gradCx']['value'][:, 0, :, 0]
-    lapC = R['lapC']['value'][:, 0, :, 0]
+    grid = R['grid']['value']
     plt.figure()
-    Tsim = -1
-    plt.subplot(4, 1, 1)
-    plt.pcolormesh(np.transpose(C)[0, :, :Tsim])
-    plt.colorbar()
-    plt.ylabel('C')
-    plt.subplot(4, 1, 2)
-    plt.pcolormesh(np.transpose(dC)[0, :, :Tsim])
+    plt.pcolormesh(np.reshape(R['h']['value'][t, 0, :, 0, 0], grid.shape))
     plt.colorbar()
-    plt.ylabel(r'$\dfrac{\partial C}{\partial t}$')
-    plt.subplot(4, 1, 3)
-    plt.pcolormesh(np.transpose(gradC)[0, :, :Tsim])
-    plt.colorbar()
-    plt.ylabel(r'$\nabla C$')
-    plt.subplot(4, 1, 4)
-    plt.pcolormesh(np.transpose(lapC)[0, :, :Tsim])
-    plt.colorbar()
-    plt.ylabel(r'$\nabla \nabla C$')
-    plt.xlabel('time')
+    plt.title(f"h at t={R['time']['value'][t, 0, 0, 0, 0]:.2f}")
     plt.show()
 
 
-def generate(diffcoeff, c, v, N):
-    '''Generate all parameters for the simulation'''
-    N = 100
-    # Spatial operator (should be normalized etc)
-    nabla0 = np.zeros((N, N))
-    nabla0[np.arange(N - 1), np.arange(N - 1) + 1] = 1 / 2
-    nabla0[np.arange(N - 1) + 1, np.arange(N - 1)] = -1 / 2
-    nabla0[-1, 0] = 1 / 2
-    nabla0[0, -1] = -1 / 2
-    nabla = np.zeros((1, N, N, 1))
-    nabla[0, :, :, 0] = nabla0 / 5
-
-    x = np.linspace(0, 1, N, endpoint=False)
-    # Concentration
-    C0 = np.exp(-50 * (x - 0.3)**2)
-    C = np.zeros((1, N, 1, 1))
-    C[0, :, 0, 0] = C0
-    # C0=np.sin(2*np.pi*x)
-
+def generate(N=50, dx=1., boundary='periodic'):
+    '''Gaussian bump of water at the center of a (N, N) grid, without speed'''
+    grid = O.Grid((N, N), dx=dx, boundary=boundary)
+    x, y = np.meshgrid(np.arange(N) * dx, np.arange(N) * dx, indexing='ij')
+    h = np.zeros((1, N * N, 1, 1))
+    h[0, :, 0, 0] = 0.5 * np.exp(-((x - N * dx / 2)**2 + (y - N * dx / 2)**2) / (3 * dx)**2).reshape(-1)
     preset = {
-        'nr': N,
-        'dt': 0.1,
-        'Tsim': 1000,
+        'grid': grid,
+        'dt': 0.05,
+        'Tsim': 20,
         'nx': 1,
-        'diffCoeff': diffcoeff,
-        'C': C,
-        'nabla': nabla,
-        'c': c,
-        'v': v
+        'h': h,
     }
     return preset
 
@@ -124,11 +101,10 @@ _SUPPLEMENTS = {
     'Generate': generate
 }
 
-# ####################### PRESETS #######################################
 _PRESETS = {
     'Basic': {
-        'fields': generate(2, 3, 2, 100),
-        'com': ('A diffusion on 100 elements of a gaussian'),
+        'fields': generate(50),
+        'com': ('A gaussian bump of water on a 50x50 periodic grid'),
         'plots': {},
     },
 }
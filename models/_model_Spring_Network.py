@@ -7,7 +7,7 @@ from chimes.libraries import merge_model       # Merge two model logics into eac
 from chimes.libraries import Funcs            # Prewritten functions from CHIMES use `chm.get_available_Functions()`
 import numpy as np                          # if you need exponential, pi, log
 
-_DESCRIPTION = """
+_DESCRIPTION = r"""
 ## What is this model ?
 
 A Spring Network is an ensemble of nodes, that are linked by springs. 
@@ -18,32 +18,29 @@ Typically, it is an excellent example of local wave propagation on a network str
 
 The way it is coded here is the following: 
 * Each nodes $_i \in N_{nodes}$ has a position $x_i,y_i$, and a speed $v^x_i,v^y_i$
-* The dynamics is a classic $\dot{v}^x_i = (F^x_i - damp*v^y_i)/m_i$ where damp is fluid friction, and F the force resulting from the spring network
+* The dynamics is a classic $\dot{v}^x_i = (F^x_i - damp*v^x_i)/m_i$ where damp is fluid friction, and F the force resulting from the spring network
 
 ### How to represent the spring network 
 
-Spring are here represented by tensors, and not as individuals. 
-Preliminarily, we consider $N_{springs}$. They have four characteristics:
+The network is an edge list (`Operators.Network`), declared once in a preset as the field `network`.
+We consider $N_{edges}$ springs. They have four characteristics:
 1. The index of their first node extremity $I^1_j$
 2. The index of their second node extremity $I^2_j $
 3. A stiffness $k_j$
 4. An unstrenched length $L^0_j$
 
-The strategy is to consider that each node is linked to each node, but with a stiffness 0 by default
-In consequence, we define $k_{ij}$ the stiffness matrix of the network
+The positions are gathered along each spring, which gives its elongation and the force it applies on its first node:
+$$f^x_j = - k_j (dist_j - L^0_j) \frac{x_{I^1_j} - x_{I^2_j}}{dist_j}$$
 
-In consequence, the dynamics is : 
-$$\dot{v}_i = - \sum_j k_{ij} (dist(x_i,x_j)-L0_{ij}) cos(\theta_i) - \eta v_i$$
+With $dist_j = ((x_{I^1_j} - x_{I^2_j})^2 + (y_{I^1_j} - y_{I^2_j})^2)^{1/2}$. The forces are then summed back on the nodes,
+positively on the first node of each spring and negatively on the second:
+$$F^x_i = \sum_{j, I^1_j=i} f^x_j - \sum_{j, I^2_j=i} f^x_j$$
 
-With $dist(x_i,x_j)= ((x_i - x_j )**2 + (y_i - y_j )**2)**{1/2}$ and $\theta_i = atan( (y_i-y_j) / (x_i-x_j))$
-
-To create $k_{ij}$ and $L^0_{ij}$:
-
-
-Instead of calculating this using loops, the calculations can be done using networks.
-
-1. $k$ and $L^0$ are now matrices with 
+Every step costs $O(N_{edges})$, where a dense representation with a stiffness matrix $k_{ij}$ costs $O(N_{nodes}^2)$.
+`Springlist_to_network` gives the fields of a preset from a list of springs, `generate_mesh` the ones of a square mesh.
 
+The dense fields `Kmat` and `L0Mat` of the previous versions are replaced by `network`, `k` and `L0`: presets and scripts
+that set them have to use `Springlist_to_network`. `Springlist_to_K_L0` still gives the dense matrices of a list of springs.
 
 ## Why is it interesting ? 
 
@@ -65,6 +62,10 @@ _LOGICS = dict(
     size=dict(
         Nnodes=dict(value=1,
                     definition='Number of nodes in the network'),
+        Nedges=dict(value=1,
+                    definition='Number of springs in the network'),
+        network=dict(value=O.Network([0], [0], 1),
+                     definition='Springs as an edge list between the nodes'),
     ),
     differential=dict(
         vx=dict(
@@ -85,24 +86,32 @@ _LOGICS = dict(
             initial=0),
     ),
     statevar=dict(
-        dx=dict(func=lambda x: x - np.moveaxis(x, -1, -2)),
-        dy=dict(func=lambda y: y - np.moveaxis(y, -1, -2)),
-
-        distance=dict(func=lambda dx, dy: (dx**2 + dy**2)**(1/2)),
-        angle=dict(func=lambda dx, dy: np.arctan2(dy, dx)),
-
-        Fmx=dict(func=lambda Kmat, distance, L0Mat, angle: -Kmat*(distance-L0Mat)*np.cos(angle)),
-        Fmy=dict(func=lambda Kmat, distance, L0Mat, angle: -Kmat*(distance-L0Mat)*np.cos(angle)),
-
-        Fx=dict(func=lambda Kmat, distance, L0Mat, angle: O.ssum2(-Kmat*(distance-L0Mat)*np.cos(angle))),
-        Fy=dict(func=lambda Kmat, distance, L0Mat, angle: O.ssum2(-Kmat*(distance-L0Mat)*np.sin(angle))),
+        dx=dict(func=lambda x, network: O.Network.difference(x, network),
+                definition='horizontal extension of each spring'),
+        dy=dict(func=lambda y, network: O.Network.difference(y, network),
+                definition='vertical extension of each spring'),
+
+        distance=dict(func=lambda dx, dy: (dx**2 + dy**2)**(1/2),
+                      definition='length of each spring'),
+        tension=dict(func=lambda k, distance, L0: -k*(distance-L0),
+                     definition='force of each spring on its first node, along the spring'),
+
+        Fmx=dict(func=lambda tension, dx, distance: tension*np.divide(dx, distance, out=np.zeros_like(dx), where=distance > 0),
+                 definition='horizontal force of each spring on its first node'),
+        Fmy=dict(func=lambda tension, dy, distance: tension*np.divide(dy, distance, out=np.zeros_like(dy), where=distance > 0),
+                 definition='vertical force of each spring on its first node'),
+
+        Fx=dict(func=lambda Fmx, network: O.Network.divergence(Fmx, network),
+                definition='horizontal force on each node'),
+        Fy=dict(func=lambda Fmy, network: O.Network.divergence(Fmy, network),
+                definition='vertical force on each node'),
 
         Kinetic=dict(func=lambda m, vx, vy: 0.5*O.ssum(m*(vx**2 + vy**2))),
-        # Potential = dict(func= lambda m,vx,vy: 0.5*O.ssum(Kmat*(distance-L0Mat)**2 ))m
+        Potential=dict(func=lambda k, distance, L0: 0.5*O.ssum(k*(distance-L0)**2)),
     ),
     parameter=dict(
-        L0Mat=1,
-        Kmat=1,
+        L0=dict(value=1, definition='length of each spring without tension'),
+        k=dict(value=1, definition='stiffness of each spring'),
         m=1,
         damp=0,
     )
@@ -115,6 +124,7 @@ def Springlist_to_K_L0(Node1, Node2, k, L0, Nnodes, **kwargs):
     k is the stiffness of the spring as a list
     l0 is the length at which there is no force in the spring as a list
     Nnodes is the number of nodes in the Network. 
+    The model uses the edge list of `Springlist_to_network` instead of these matrices.
     '''
 
     k_matrix = np.zeros((Nnodes, Nnodes))
@@ -129,15 +139,54 @@ def Springlist_to_K_L0(Node1, Node2, k, L0, Nnodes, **kwargs):
     return k_matrix, L0_matrix
 
 
-_SUPPLEMENTS = {'Springlist_to_K_L0': Springlist_to_K_L0}
-
+def Springlist_to_network(Node1, Node2, k, L0, Nnodes=None, **kwargs):
+    '''Fields of a preset from a list of springs.
+    Node1 and Node2 are the list of nodes at both extremity of the spring
+    k is the stiffness of the spring as a list
+    l0 is the length at which there is no force in the spring as a list
+    Nnodes is the number of nodes in the Network (by default the largest index + 1).
+    Other keyword arguments are added to the fields (initial positions...)
+    '''
+    network = O.Network(Node1, Node2, Nnodes)
+    fields = {'network': network,
+              'k': np.broadcast_to(np.asarray(k, dtype=float), (network.Nedges,)) + 0,
+              'L0': np.broadcast_to(np.asarray(L0, dtype=float), (network.Nedges,)) + 0}
+    fields.update(kwargs)
+    return fields
+
+
+def generate_mesh(N=10, k=1, L0=1, damp=0.1, kick=0.5):
+    '''Square mesh of NxN nodes at their rest position, linked to their horizontal and vertical neighbours.
+    The corner node is moved by `kick` in both directions'''
+    index = np.arange(N * N).reshape(N, N)
+    Node1 = np.r_[index[:, :-1].ravel(), index[:-1, :].ravel()]
+    Node2 = np.r_[index[:, 1:].ravel(), index[1:, :].ravel()]
+    x = (np.arange(N * N) % N) * float(L0)
+    y = (np.arange(N * N) // N) * float(L0)
+    x[0] -= kick
+    y[0] -= kick
+    return Springlist_to_network(Node1, Node2, k, L0, N * N,
+                                 x=x, y=y, damp=damp, dt=0.05, Tsim=20)
+
+
+_SUPPLEMENTS = {'Springlist_to_K_L0': Springlist_to_K_L0,
+                'Springlist_to_network': Springlist_to_network,
+                'generate_mesh': generate_mesh}
+
+_PRESETS = {
+    'Mesh': {
+        'fields': generate_mesh(10),
+        'com': ('A square mesh of 10x10 nodes and 180 springs, with its corner pulled away'),
+        'plots': {},
+    },
+}
 
 Dimensions = {
-    'scalar': [],
-    # 'vector': [],
-    'matrix': ['L0Mat', 'Kmat', 'dx', 'dy', 'angle', 'distance', 'Fmx', 'Fmy'],
+    'scalar': ['Kinetic', 'Potential', 'm', 'damp'],
+    'vector': ['vx', 'vy', 'x', 'y', 'Fx', 'Fy'],
+    'edges': ['L0', 'k', 'dx', 'dy', 'distance', 'tension', 'Fmx', 'Fmy'],
 }
 DIM = {'scalar': ['__ONE__'],
        'vector': ['Nnodes'],
-       'matrix': ['Nnodes', 'Nnodes']}
+       'edges': ['Nedges']}
 _LOGICS = fill_dimensions(_LOGICS, Dimensions, DIM)
@@ -0,0 +1,47 @@
+"""
+Benchmark of the construction of a Hub: wall time of `Hub(model)` with and without the cache of the model structure.
+
+Without the cache, the model file is executed and its structure (fields, arguments, order of the functions) is
+computed for each hub, as it was before the cache. With the cache, the next hubs only execute the compiled model file,
+bind its values and allocate their arrays (see `_hub_set.load_model`).
+Run it from the repository root:
+    python tests/benchmarks/bench_hub.py [model] [repeat]
+"""
+import sys
+import time
+
+import numpy as np
+
+import chimes as chm
+from chimes._core_functions import _hub_set
+
+
+def measure_hub(model: str = 'GK', repeat: int = 20) -> dict:
+    '''
+    Build `repeat` hubs of `model`, with the structure cache emptied before each of them, then with the cache.
+
+    Returns
+    -------
+    dict
+        {'uncached': median wall time (s), 'cached': median wall time (s), 'speedup': ratio of both}
+    '''
+    dout = {}
+    for case in ['uncached', 'cached']:
+        chm.Hub(model, verb=False)
+        times = []
+        for _ in range(repeat):
+            if case == 'uncached':
+                _hub_set._DSTRUCTURE.clear()
+            t0 = time.perf_counter()
+            chm.Hub(model, verb=False)
+            times.append(time.perf_counter() - t0)
+        dout[case] = float(np.median(times))
+    dout['speedup'] = dout['uncached'] / dout['cached']
+    return dout
+
+
+if __name__ == '__main__':
+    model = sys.argv[1] if len(sys.argv) > 1 else 'GK'
+    res = measure_hub(model, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+    print(f"Hub('{model}') without cache: {1000 * res['uncached']:.2f} ms")
+    print(f"Hub('{model}') with cache:    {1000 * res['cached']:.2f} ms ({res['speedup']:.1f}x faster)")
@@ -0,0 +1,52 @@
+"""
+Benchmark of the startup of CHIMES: wall time of `import chimes` and number of imported modules.
+
+Each measure is done in a new python process, so that nothing is already imported.
+Run it from the repository root:
+    python tests/benchmarks/bench_import.py [repeat]
+"""
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+# Libraries that should only be imported when they are needed (plots, networks, notebooks)
+_LHEAVY = ['matplotlib', 'plotly', 'pyvis', 'IPython', 'ipywidgets']
+
+_CODE = f"""
+import json, sys, time
+t0 = time.perf_counter()
+import chimes
+t1 = time.perf_counter()
+print(json.dumps({{'time': t1 - t0,
+                  'modules': len(sys.modules),
+                  'heavy': [m for m in {_LHEAVY} if m in sys.modules]}}))
+"""
+
+
+def measure_import(repeat: int = 5) -> dict:
+    '''
+    Import chimes `repeat` times in new processes.
+
+    Returns
+    -------
+    dict
+        {'time': median wall time (s), 'times': all wall times, 'modules': number of modules in sys.modules,
+         'heavy': heavy libraries imported by `import chimes`}
+    '''
+    out = []
+    for _ in range(repeat):
+        res = subprocess.run([sys.executable, '-c', _CODE], capture_output=True, text=True, check=True)
+        out.append(json.loads(res.stdout.strip().split('\n')[-1]))
+    times = [o['time'] for o in out]
+    return {'time': float(np.median(times)),
+            'times': times,
+            'modules': out[-1]['modules'],
+            'heavy': out[-1]['heavy']}
+
+
+if __name__ == '__main__':
+    res = measure_import(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
+    print(f"import chimes: {res['time']:.3f} s (median of {len(res['times'])}), {res['modules']} modules")
+    print(f"heavy libraries imported: {res['heavy'] if res['heavy'] else 'none'}")
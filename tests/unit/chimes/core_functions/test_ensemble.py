@@ -0,0 +1,88 @@
+import numpy as np
+
+import chimes as chm
+
+
+class TestEnsemble():
+    '''Statistics and cycles over the parallel runs (nx) of a hub'''
+
+    def test_run_stats(self):
+        '''Statistics accumulated during the run are the ones of the trajectories, which are not stored'''
+        hub = chm.Hub('Goodwin_example', verb=False)
+        hub.set_fields(Tsim=20, nx=50, k0=list(np.linspace(-0.007, -0.006, 50)), verb=False)
+        hub2 = hub.copy()
+        hub.run(verb=False)
+        hub.calculate_StatSensitivity()
+        hub2.run(verb=False, stats=[0.1, 0.9])
+        R, R2 = hub.get_dfields(returnas='view'), hub2.get_dfields(returnas='view')
+        for k in ['omega', 'employment', 'pi']:
+            s, s2 = R[k]['sensitivity'][0][''], R2[k]['sensitivity'][0]['']
+            for stat in ['mean', 'stdv', 'min', 'max', 'median']:
+                assert np.allclose(s[stat], s2[stat], rtol=1e-12, atol=1e-15)
+            assert np.allclose(s2['quantiles'][0.9], np.quantile(R[k]['value'][:, :, 0, 0, 0], 0.9, axis=1))
+        assert np.all(np.isnan(R2['omega']['value']))
+
+        # Without record_every, a long run keeps its statistics on a coarse set of steps
+        hub4 = chm.Hub('Goodwin_example', verb=False)
+        hub4.set_fields(Tsim=500, nx=10, verb=False)
+        hub4.run(verb=False, stats=True)
+        ensemble = hub4.dmisc['ensemble']
+        assert len(ensemble.levels) == 21 and ensemble.nrows == len(hub4.dmisc['record']['steps']) <= 501
+        assert hub4.dmisc['record']['steps'][-1] == hub4.dfields_view['nt']['value'] - 1
+
+        # Batches: exact count, mean and extrema, approximate quantiles
+        hub3 = chm.Hub('Goodwin_example', verb=False)
+        hub3.set_fields(Tsim=20, verb=False)
+        hub3.run_uncertainty(uncertainty=5, N=300, batch=100, stats=True, verb=False)
+        dstat = hub3.dmisc['ensemble'].get('omega')
+        assert np.all(dstat['count'] == 300)
+        assert np.all(dstat['min'] <= dstat['median']) and np.all(dstat['median'] <= dstat['max'])
+
+    def test_save_npz_stats(self, tmp_path):
+        '''The ensemble statistics of a stats run are saved in the columnar format, and loaded back'''
+        hub = chm.Hub('Goodwin_example', verb=False)
+        hub.set_fields(Tsim=20, verb=False)
+        hub.run_uncertainty(uncertainty=5, N=60, batch=30, stats=[0.1, 0.9], verb=False)
+        address = str(tmp_path / 'stats.npz')
+        hub.save(address, relativeaddress=False)
+        test = chm.load_saved(address, localsave=False, verb=False)
+        ensemble, ensemble2 = hub.dmisc['ensemble'], test.dmisc['ensemble']
+        assert ensemble2.quantiles == ensemble.quantiles and np.array_equal(ensemble2.levels, ensemble.levels)
+        for k in ensemble.fields:
+            d, d2 = ensemble.get(k), ensemble2.get(k)
+            for stat in ['count', 'mean', 'stdv', 'min', 'max', 'median']:
+                assert np.array_equal(d[stat], d2[stat], equal_nan=True), (k, stat)
+            assert np.array_equal(d['quantiles'][0.9], d2['quantiles'][0.9], equal_nan=True)
+        s, s2 = hub.dfields_view['omega']['sensitivity'][0][''], test.dfields_view['omega']['sensitivity'][0]['']
+        assert np.array_equal(s['mean'], s2['mean']) and test.dflags['sensitivity']
+
+        # Statistics merged after loading
+        ensemble2.merge(ensemble)
+        assert np.all(ensemble2.get('omega')['count'] == 120)
+
+    def test_cycles(self):
+        '''Batched cycles give the statistics of each cycle between consecutive maxima, for every trajectory'''
+        hub = chm.Hub('Goodwin_example', verb=False)
+        hub.set_fields(nx=3, Tsim=100, k0=[-0.0065, -0.006, -0.007], verb=False)
+        hub.run(verb=False)
+        hub.calculate_Cycles()
+        R = hub.get_dfields(returnas='view')
+        cycles = R['omega']['cycles']
+        assert cycles['meanval'].shape[1:] == (3, 1, 1, 1)
+        for ix in range(3):
+            y = R['omega']['value'][:, ix, 0, 0, 0]
+            peaks = [i for i in range(1, len(y) - 2) if y[i - 1] < y[i] > y[i + 1]]
+            assert cycles['ncycles'][ix, 0, 0, 0] == len(peaks) - 1
+            for j in range(len(peaks) - 1):
+                seg = y[peaks[j]:peaks[j + 1] + 1]
+                assert list(cycles['period_indexes'][j, ix, 0, 0, 0]) == [peaks[j], peaks[j + 1] + 1]
+                assert np.isclose(cycles['meanval'][j, ix, 0, 0, 0], np.mean(seg))
+                assert np.isclose(cycles['medval'][j, ix, 0, 0, 0], np.median(seg))
+                assert np.isclose(cycles['stdval'][j, ix, 0, 0, 0], np.std(seg))
+                assert cycles['minval'][j, ix, 0, 0, 0] == np.amin(seg)
+            assert np.all(np.isnan(cycles['meanval'][len(peaks) - 1:, ix]))
+
+            # Layout of the previous versions
+            assert cycles[ix]['period_indexes'] == [[peaks[j], peaks[j + 1] + 1] for j in range(len(peaks) - 1)]
+            assert cycles[ix]['meanval'] == list(cycles['meanval'][:len(peaks) - 1, ix, 0, 0, 0])
+            assert cycles.bykey()['maxval'][ix] == cycles[ix]['maxval']
@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+import pytest
+
+import chimes as chm
+
+
+class TestHubSet():
+    '''Construction of the hubs: structure cache, order of the functions, allocation, copies and storage'''
+
+    def test_model_structure_cache(self):
+        '''Hubs of the same model reuse its cached structure, with their own values and functions'''
+        from chimes._core_functions import _hub_set
+        hub = chm.Hub('GK', verb=False)
+        cached = _hub_set._DSTRUCTURE['GK']
+        hub2 = chm.Hub('GK', verb=False)
+        assert _hub_set._DSTRUCTURE['GK'] is cached
+        hub2.set_fields(alpha=0.03, verb=False)
+        assert hub._dfields['alpha']['value'][0, 0, 0, 0] != 0.03
+        assert hub._dfields['omega']['func'] is not hub2._dfields['omega']['func']
+        assert hub.dmisc['dfunc_order'] == hub2.dmisc['dfunc_order']
+
+        # A modified model file is loaded again
+        _hub_set._DSTRUCTURE['GK'] = cached[:1] + ('modified',) + cached[2:]
+        chm.Hub('GK', verb=False)
+        assert _hub_set._DSTRUCTURE['GK'][1] == cached[1]
+
+    def test_model_structure_cache_module(self):
+        '''The objects defined in the model file are not shared between the hubs of a cached model'''
+        hub = chm.Hub('_EXTERNALCOUPLING', verb=False)
+        hub2 = chm.Hub('_EXTERNALCOUPLING', verb=False)
+        external = hub._dfields['Flow']['func'].__globals__['_EXTERNAL']
+        external2 = hub2._dfields['Flow']['func'].__globals__['_EXTERNAL']
+        assert external is not external2
+        hub.run(verb=False)
+        hub2.set_fields(nx=3, verb=False)
+        hub2.run(verb=False)
+        assert np.all(np.isfinite(hub2.get_dfields(returnas='view')['Stock']['value']))
+        assert external._zero.shape[0] == 1 and external2._zero.shape[0] == 3
+
+    def test_func_order_levels(self):
+        '''Functions are sorted after their dependencies, by levels, and a cycle is reported'''
+        from chimes._core_functions import _hub_set
+        hub = chm.Hub('GK', verb=False)
+        R = hub._dfields
+        order = hub.dmisc['dfunc_order']
+        levels = order['levels']['statevar']
+        assert sorted(sum(levels, [])) == sorted(order['statevar'])
+        for ii, lev in enumerate(levels):
+            for k0 in lev:
+                deps = R[k0]['args']['statevar']
+                assert all(order['statevar'].index(k1) < order['statevar'].index(k0) for k1 in deps)
+                assert all(k1 in sum(levels[:ii], []) for k1 in deps)
+
+        # dependencies defined in reverse order, and a cycle
+        dparam = {f'x{ii}': {'eqtype': 'statevar', 'args': {'statevar': [f'x{ii + 1}'] if ii < 4 else []}}
+                  for ii in range(5)}
+        assert _hub_set._suggest_funct_order_by_group('statevar', dparam)[0] == ['x4', 'x3', 'x2', 'x1', 'x0']
+        dparam['x4']['args']['statevar'] = ['x2']
+        with pytest.raises(Exception, match='x2 -> x3 -> x4 -> x2'):
+            _hub_set._suggest_funct_order_by_group('statevar', dparam)
+
+    def test_set_fields_incremental(self):
+        '''set_fields only allocates the arrays whose shape changed, and a new run gives the same results'''
+        hub = chm.Hub('GK', verb=False)
+        hub.set_fields(Tsim=20, verb=False)
+        hub.run(verb=False)
+        ref = np.copy(hub._dfields['omega']['value'])
+        alpha = hub._dfields['alpha']['value'][0, 0, 0, 0]
+        omega = hub._dfields['omega']['value']
+        hub.set_fields(alpha=0.03, verb=False)
+        assert hub._dfields['omega']['value'] is omega
+        assert np.all(np.isnan(omega[1:])) and hub.dmisc['reset']
+        hub.run(verb=False)
+        hub.set_fields(alpha=alpha, verb=False)
+        hub.run(verb=False)
+        assert hub._dfields['omega']['value'] is omega and np.array_equal(omega, ref)
+        hub.set_fields(nx=2, verb=False)
+        assert hub._dfields['omega']['value'].shape == (ref.shape[0], 2) + ref.shape[2:]
+
+    def test_copy_template(self):
+        '''Copies share their time series until one of the hubs writes them, templates give the same hubs as Hub'''
+        hub = chm.Hub('GK', preset='default', verb=False)
+        hub.set_fields(Tsim=20, verb=False)
+        hub.run(verb=False)
+        ref = np.copy(hub.dfields_view['omega']['value'])
+        copy = hub.copy()
+        assert np.shares_memory(copy._dfields['omega']['value'], hub._dfields['omega']['value'])
+        assert hub._dfields['omega']['value'].flags.writeable
+        assert not copy._dfields['omega']['value'].flags.writeable
+        hub.get_dfields()['omega']['value'][0] = ref[0]
+        copy.set_fields(alpha=0.03, verb=False)
+        copy.run(verb=False)
+        assert np.array_equal(hub.dfields_view['omega']['value'], ref)
+        assert not np.array_equal(copy.dfields_view['omega']['value'], ref)
+        copy2 = hub.copy()
+        hub.reset()
+        assert np.isnan(hub.dfields_view['omega']['value'][-1]).all()
+        assert np.array_equal(copy2.dfields_view['omega']['value'], ref)
+
+        template = chm.HubTemplate('GK')
+        hub2 = template.new(preset='default', Tsim=20)
+        hub2.run(verb=False)
+        assert np.array_equal(hub2.dfields_view['omega']['value'], ref)
+        assert np.isnan(template.hub.dfields_view['omega']['value'][-1]).all()
+
+    def test_storage(self, tmp_path):
+        '''Time series stored on disk give the same run as in RAM'''
+        ref = chm.Hub('GK', verb=False)
+        ref.run(verb=False)
+        hub = chm.Hub('GK', verb=False)
+        hub.set_storage(str(tmp_path), verb=False)
+        hub.run(verb=False)
+        R = hub.get_dfields(returnas='view')
+        assert isinstance(R['omega']['value'], np.memmap)
+        assert np.allclose(ref.get_dfields(returnas='view')['omega']['value'], R['omega']['value'])
+        assert np.allclose(np.load(os.path.join(str(tmp_path), 'omega.npy'), mmap_mode='r'), R['omega']['value'])
+
+        # A deep copy has its time series in RAM, and never writes in the files of the hub
+        deep = hub.copy(deep=True)
+        assert deep.dmisc['storage'] is None
+        deep.set_fields(alpha=0.03, verb=False)
+        deep.run(verb=False)
+        assert np.allclose(np.load(os.path.join(str(tmp_path), 'omega.npy')), ref.get_dfields(returnas='view')['omega']['value'])
+        hub.set_storage(False, verb=False)
+        assert not isinstance(hub.get_dfields(returnas='view')['omega']['value'], np.memmap)
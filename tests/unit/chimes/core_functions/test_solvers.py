@@ -0,0 +1,220 @@
+import numpy as np
+import pytest
+
+import chimes as chm
+
+
+class TestSolvers():
+    '''Solvers of `Hub.run`: fixed-step and adaptive schemes, recording, termination, convergence and profiling'''
+
+    def test_rk4_flat(self):
+        '''The flat-vector solver gives the same trajectories as rk4 on all models'''
+        modelist = chm.get_available_models(Return=dict)
+        for model in modelist.keys():
+            dout = {}
+            for solver in ['rk4', 'rk4-flat']:
+                np.random.seed(0)  # some models have stochastic components
+                hub = chm.Hub(model, verb=False)
+                hub.run(NstepsInput=20, verb=False, solver=solver)
+                dout[solver] = hub.get_dfields()
+            for k in hub.dmisc['dfunc_order']['differential'] + hub.dmisc['dfunc_order']['statevar']:
+                assert np.allclose(dout['rk4'][k]['value'], dout['rk4-flat'][k]['value'],
+                                   rtol=1e-10, atol=1e-12, equal_nan=True), f'{model}: {k}'
+
+    def test_dopri5(self):
+        '''The adaptive solver follows rk4 with far fewer steps, on the same time grid'''
+        dout = {}
+        for solver in ['rk4', 'dopri5']:
+            hub = chm.Hub('GK', verb=False)
+            hub.set_fields(**{'Tsim': 20, 'dt': 0.01}, verb=False)
+            hub.run(verb=False, solver=solver)
+            dout[solver] = hub.get_dfields(returnas='view')
+        assert hub.dmisc['solver_stats']['accepted'] < hub.dfields_view['nt']['value'] / 10
+        assert np.allclose(dout['rk4']['time']['value'], dout['dopri5']['time']['value'])
+        for k in hub.dmisc['dfunc_order']['differential']:
+            assert np.allclose(dout['rk4'][k]['value'], dout['dopri5'][k]['value'], rtol=1e-4, atol=1e-5), k
+
+    def test_record(self):
+        '''Only the recorded fields are stored, at the recorded steps, with the same values'''
+        ref = chm.Hub('GK', verb=False)
+        ref.run(verb=False)
+        hub = chm.Hub('GK', verb=False)
+        hub.run(verb=False, record=['omega', 'employment'], record_every=10)
+        R, Rref = hub.get_dfields(returnas='view'), ref.get_dfields(returnas='view')
+        steps = hub.dmisc['record']['steps']
+        assert steps[-1] == Rref['nt']['value'] - 1
+        assert hub.dflags['run'][0] == len(steps) - 1
+        for k in ['time', 'omega', 'employment']:
+            assert np.allclose(R[k]['value'], Rref[k]['value'][steps]), k
+        assert np.all(np.isnan(R['d']['value'])) and R['d']['value'].strides[0] == 0
+        hub.run(verb=False)
+        assert hub.dmisc['record'] is None
+        assert np.allclose(hub.get_dfields(returnas='view')['d']['value'], Rref['d']['value'])
+
+    def test_split_statevar(self):
+        '''Output-only state variables are never read by the differential equations or by the needed state variables'''
+        from chimes._core_functions import _solvers
+        for model in ['GK', 'CHI', 'Goodwin_example']:
+            hub = chm.Hub(model, verb=False)
+            R = hub.get_dfields(returnas='view')
+            order = hub.dmisc['dfunc_order']
+            lneeded, loutput = _solvers._split_statevar(R, order['differential'], order['statevar'])
+            assert sorted(lneeded + loutput) == sorted(order['statevar'])
+            for k in order['differential'] + lneeded:
+                assert not set(R[k]['kargs']) & set(loutput), (model, k)
+
+    def test_compiled_step(self):
+        '''The fused equations give the same derivatives as the interpreted ones, and def functions are called as they are'''
+        from chimes._core_functions import _solvers
+        for model in ['GK', 'TUTORIAL']:
+            hub = chm.Hub(model, verb=False)
+            R = hub.get_dfields(returnas='view')
+            order = hub.dmisc['dfunc_order']
+            lparam = order['parameter'] + order['parameters']
+            out = []
+            for compiled in [True, False]:
+                y, func, _ = _solvers.get_func_dydt_flat(R, order['differential'], order['statevar'], lparam,
+                                                         compiled=compiled)
+                dydt = np.empty_like(y)
+                state = func(y, dydt)
+                out.append((dydt, {k: np.copy(state[k]) for k in order['statevar']}))
+            assert np.array_equal(out[0][0], out[1][0], equal_nan=True)
+            for k in order['statevar']:
+                assert np.array_equal(out[0][1][k], out[1][1][k], equal_nan=True), (model, k)
+
+    def test_compiled_step_used(self, monkeypatch):
+        '''A GK run computes its equations with the fused step, and a broken generated source is reported'''
+        from chimes._core_functions import _compiler
+        compile_step = _compiler.compile_step
+        steps = []
+
+        def recorded(*args, **kwargs):
+            steps.append(compile_step(*args, **kwargs))
+            return steps[-1]
+        monkeypatch.setattr(_compiler, 'compile_step', recorded)
+        for solver in ['rk4', 'rk4-flat']:
+            steps.clear()
+            hub = chm.Hub('GK', verb=False)
+            hub.run(verb=False, solver=solver)
+            assert len(steps) and all(step is not None for step in steps), solver
+            assert any("dv['K']" in step.source for step in steps) and any("dbuffer['omega']" in step.source for step in steps)
+
+        monkeypatch.setattr(_compiler, '_generate', lambda *args: ('def _step(:\n', []))
+        monkeypatch.setattr(_compiler, '_DCOMPILED', {})
+        hub = chm.Hub('GK', verb=False)
+        order = hub.dmisc['dfunc_order']
+        assert compile_step(hub._dfields, order['differential'], order['statevar']) is None
+
+    def test_rk4_jit(self):
+        '''rk4-jit gives the rk4 trajectories, with numba or through its fallback, and its generated loop is valid python'''
+        from chimes._core_functions import _compiler
+        import math
+        for model in ['GK', 'Goodwin_example']:
+            dout = {}
+            for solver in ['rk4-flat', 'rk4-jit']:
+                hub = chm.Hub(model, verb=False)
+                hub.run(NstepsInput=50, verb=False, solver=solver)
+                dout[solver] = hub.get_dfields(returnas='view')
+            for k in hub.dmisc['dfunc_order']['differential'] + hub.dmisc['dfunc_order']['statevar']:
+                assert np.allclose(dout['rk4-flat'][k]['value'], dout['rk4-jit'][k]['value'], rtol=1e-10), (model, k)
+
+        # The generated loop, without numba
+        hub = chm.Hub('GK', verb=False)
+        R = hub.get_dfields(returnas='view')
+        lode, lstate = hub.dmisc['dfunc_order']['differential'], hub.dmisc['dfunc_order']['statevar']
+        source, lread = _compiler._generate_scalar(R, lode, lstate)
+        namespace = {'np': np, 'numpy': np, 'math': math}
+        exec(source, namespace)
+        y = np.array([R[k]['value'][0, 0, 0, 0, 0] for k in lode])
+        ys, ss = np.empty((11, len(lode))), np.empty((11, len(lstate)))
+        namespace['_loop'](y, np.array([np.ravel(R[k]['value'])[0] for k in lread]), R['dt']['value'], 11, ys, ss)
+        hub.run(steps=10, verb=False, solver='rk4-flat')
+        assert np.allclose(ys[10], [R[k]['value'][10, 0, 0, 0, 0] for k in lode], rtol=1e-12)
+
+    def test_terminate(self):
+        '''Stopped members are frozen at their termination, the other ones are not changed'''
+        hub = chm.Hub('Goodwin_example', verb=False)
+        hub.set_fields(Tsim=20, nx=20, alpha=np.linspace(0.01, 0.5, 20), verb=False)
+        hub2 = hub.copy()
+        hub.run(verb=False)
+        hub2.run(verb=False, terminate={'bounds': {'K': [None, 500.]}, 'predicate': lambda d: d['omega'][:, 0, 0, 0] > 0.9})
+        R, R2 = hub.get_dfields(returnas='view'), hub2.get_dfields(returnas='view')
+        tterm = hub2.dmisc['terminated']
+        alive = np.isnan(tterm)
+        assert alive.any() and not alive.all()
+        assert np.array_equal(R2['time']['value'], R['time']['value'])
+        for k in ['K', 'omega', 'employment']:
+            assert np.array_equal(R2[k]['value'][:, alive], R[k]['value'][:, alive])
+            for i in np.nonzero(~alive)[0]:
+                it = np.argmin(np.abs(R['time']['value'][:, i, 0, 0, 0] - tterm[i]))
+                assert np.array_equal(R2[k]['value'][:it + 1, i], R[k]['value'][:it + 1, i])
+                assert np.all(R2[k]['value'][it:, i] == R2[k]['value'][it, i])
+
+    def test_terminate_nx(self):
+        '''The running members are computed with their own size, for the equations that read nx'''
+        hub = chm.Hub('Attractor1D', verb=False)
+        hub.set_fields(Tsim=5, nx=4, x=np.array([6., -6, -6, -6]), verb=False)
+        hub.run(verb=False, terminate={'bounds': {'x': [None, 0.]}})
+        x = hub.get_dfields(returnas='view')['x']['value'][:, :, 0, 0, 0]
+        tterm = hub.dmisc['terminated']
+        assert tterm[0] > 0 and np.all(np.isnan(tterm[1:]))
+        assert np.all(np.isfinite(x)) and np.all(x[2:, 0] == x[1, 0])
+        assert not np.all(x[-1, 1:] == x[1, 1:])
+
+    def test_converge(self):
+        '''A run stops once all members are converged, its time series are truncated after the last step'''
+        hub = chm.Hub('GK', verb=False)
+        hub.set_fields(Tsim=200, nx=3, alpha=np.linspace(0.015, 0.03, 3), verb=False)
+        hub2 = hub.copy()
+        hub.run(verb=False)
+        hub2.run(verb=False, converge={'rtol': 1e-6, 'window': 2, 'fields': ['omega', 'employment', 'd']})
+        R, R2 = hub.get_dfields(returnas='view'), hub2.get_dfields(returnas='view')
+        tconv = hub2.dmisc['converged']
+        nt = len(R2['time']['value'])
+        assert not np.any(np.isnan(tconv)) and nt < len(R['time']['value'])
+        assert hub2.dflags['run'][0] == nt - 1 and R2['omega']['value'].shape[0] == nt
+        assert np.isclose(R2['time']['value'][-1, 0, 0, 0, 0], np.max(tconv))
+        assert np.array_equal(R2['time']['value'], R['time']['value'][:nt])
+        assert np.allclose(R2['omega']['value'][-1], R['omega']['value'][-1], rtol=1e-6)
+
+    def test_converge_nx(self):
+        '''The members still running after a convergence keep the equations that read nx'''
+        x0 = np.min(np.roots([0.4, 0, -20, 0.5]).real)
+        hub = chm.Hub('Attractor1D', verb=False)
+        hub.set_fields(Tsim=5, nx=4, x=np.array([x0, -6, -6, -6]), T=np.array([0., 40, 40, 40]), verb=False)
+        hub.run(verb=False, converge={'rtol': 1e-6, 'fields': ['x']})
+        x = hub.get_dfields(returnas='view')['x']['value'][:, :, 0, 0, 0]
+        tconv = hub.dmisc['converged']
+        assert tconv[0] > 0 and np.all(np.isnan(tconv[1:]))
+        assert x.shape[0] == hub.dfields['nt']['value'] and np.all(np.isfinite(x))
+        assert np.allclose(x[:, 0], x0)
+
+    def test_profile(self):
+        '''A profiled run gives the same values, and the time of each field function'''
+        hub = chm.Hub('GK', verb=False)
+        hub.run(verb=False, solver='rk4-flat')
+        assert hub.dmisc['profile'] is None
+        with pytest.raises(Exception):
+            hub.get_profile()
+        ref = hub.get_dfields()['omega']['value']
+
+        hub2 = chm.Hub('GK', verb=False)
+        hub2.run(verb=False, solver='rk4-flat', profile=True)
+        assert np.allclose(hub2.get_dfields()['omega']['value'], ref, rtol=1e-12)
+        df = hub2.get_profile()
+        order = hub2.dmisc['dfunc_order']
+        assert set(df.index) == set(order['differential'] + order['statevar'] + ['solver'])
+        assert list(df['time (s)']) == sorted(df['time (s)'], reverse=True)
+        assert df.loc['omega', 'calls'] >= 4 * (hub2.dflags['run'][0])
+        assert np.isclose(df['share'].sum(), 1)
+
+    def test_solver_used(self):
+        '''The solver recorded is the temporal loop that ran'''
+        hub = chm.Hub('GK', verb=False)
+        hub.set_fields(Tsim=5, verb=False)
+        hub.run(verb=False, solver='rk4-flat')
+        assert hub.dmisc['solver'] == 'rk4-flat'
+        hub.run(verb=False, solver='rk4-jit', profile=True)
+        assert hub.dmisc['solver'] == 'rk4-flat' and hub.dmisc['profile']['solver'] == 'rk4-flat'
+        hub.run(verb=False, solver='rk4-flat', converge={'rtol': 1e-6})
+        assert hub.dmisc['solver'] == 'rk4'
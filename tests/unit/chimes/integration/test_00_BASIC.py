@@ -64,6 +64,17 @@ class Test00_Get():
             for Return in [dict, list, False]:
                 out = chm.get_available_models(FULL=FULL, Return=Return)
 
+    def test01a2_CHM_model_index(self):
+        '''The model index, read without executing the files, agrees with the model files'''
+        from chimes import libraries
+        index = libraries._get_model_index()
+        dmodel = libraries._get_DMODEL()
+        assert sorted(index.keys()) == sorted(dmodel.keys())
+        for k, v in dmodel.items():
+            for key in ['description', 'Keywords', 'file']:
+                assert index[k][key] == v[key], (k, key)
+            assert index[k]['presets'] == list(v['presets']), k
+
     def test01b_CHM_get_model_documentation(self):
         # Find model documentation for each
         for model in chm.get_available_models(Return=list):
@@ -79,6 +90,15 @@ class Test00_Get():
         # Collect all plots
         chm.get_available_plots()
 
+    def test01d2_CHM_lazy_plots(self):
+        '''Plotting libraries are only imported when a plot is accessed'''
+        import subprocess
+        code = ("import sys, chimes; "
+                "assert 'matplotlib' not in sys.modules and 'plotly' not in sys.modules; "
+                "chimes.Plots.Var; assert 'matplotlib' in sys.modules")
+        subprocess.run([sys.executable, '-c', code], check=True)
+        assert sorted(chm.get_available_plots().index) == sorted(k for k in chm.Plots._registry.keys() if '__' not in k)
+
     def test01e_CHM_get_available_functions(self):
         # Collect all functions
         chm.get_available_functions()
@@ -166,6 +186,18 @@ class Test00_Get():
         hub.run()
         hub.reinterpolate_dfields(10)
 
+    def test03b_dfields_view(self):
+        # Views share memory with the hub and cannot modify it
+        hub = chm.Hub('GK', verb=False)
+        hub.run()
+        R = hub.get_dfields(returnas='view', eqtype=['differential'])
+        assert np.shares_memory(R['a']['value'], hub._dfields['a']['value'])
+        assert not R['a']['value'].flags.writeable
+        with pytest.raises(ValueError):
+            R['a']['value'][0, ...] = 0.
+        assert set(R.keys()) == set(hub.get_dfields(returnas=list, eqtype=['differential']))
+        assert np.array_equal(hub.dfields_view['p']['value'], hub.dfields['p']['value'], equal_nan=True)
+
     def test_reinterpolate_run(self):
         # Check that reinterpolate work as intended
         hub = chm.Hub('GK', verb=False)
@@ -466,6 +498,22 @@ class Test00_Get():
         test.set_fields('Tsim', 10)
         test.run()
 
+    def test10b_loadsave_npz(self, tmp_path):
+        '''The columnar save rebuilds the same hub, and single fields can be read without it'''
+        hub = chm.Hub('GK', verb=False)
+        hub.set_fields(**{'nx': 2, 'alpha': [0.02, 0.03], 'Tsim': 10}, verb=False)
+        hub.run(verb=False)
+        address = os.path.join(str(tmp_path), 'localtest.npz')
+        hub.save(address, 'Test file generated by a unit test', relativeaddress=False)
+
+        test = chm.load_saved(address, localsave=False, verb=False)
+        assert test.dflags['run'] == hub.dflags['run']
+        for k in ['time', 'omega', 'd', 'alpha']:
+            assert np.allclose(test.get_dfields(returnas='view')[k]['value'], hub.get_dfields(returnas='view')[k]['value']), k
+        omega = chm.load_saved_fields(address, 'omega', localsave=False)['omega']
+        assert np.allclose(omega, hub.get_dfields(returnas='view')['omega']['value'])
+        assert 'localtest.npz' in chm.get_available_saves(path=str(tmp_path), returnas=dict)
+
     def test11_sensitivity(self):
         hub = chm.Hub('GK')
         hub.set_fields('Delta', 0.01)
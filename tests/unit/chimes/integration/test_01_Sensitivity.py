@@ -143,3 +143,21 @@ class Test01_Sensitivity():
                                   Noutput=500,
                                   verb=True)
         F = chm.Plots.Showsensitivity(OUT, ['employment', 'omega'], returnFig=True)
+
+    def testB_01j_Sensitivity(self):
+        '''Check that a batched sensitivity gives the same trajectories as sequential runs'''
+        hub = chm.Hub('Goodwin_example', verb=False)
+        hub.set_fields('Tsim', 1)
+        OUT = hub.run_sensitivity(keys=['a', 'alpha'], combined_run='independant', N=3, Noutput=20, batched=True)
+        assert '_SWEEP_' in list(OUT.keys())
+        assert OUT['_SWEEP_'].get_dfields(returnas='view')['nx']['value'] == 6
+        for k in ['a', 'alpha']:
+            assert OUT[k]['omega']['value'].shape[1] == 3
+
+            hub2 = chm.Hub('Goodwin_example', verb=False)
+            hub2.set_fields('Tsim', 1)
+            hub2.set_fields('nx', 3, verb=False)
+            direct = 'initial' if k == 'a' else 'value'
+            hub2.set_fields(k, np.copy(OUT[k][k][direct]), verb=False)
+            hub2.run(NtimeOutput=20, verb=False)
+            assert np.allclose(hub2.get_dfields(returnas='view')['omega']['value'], OUT[k]['omega']['value'])
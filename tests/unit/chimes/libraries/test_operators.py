@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+
+import chimes as chm
+
+
+class TestOperators():
+    '''Sparse coupling matrices, grid and network operators'''
+
+    def test_sparse_operator(self, tmp_path):
+        '''A scipy.sparse coupling matrix gives the same run as the dense one, and is kept sparse in saves'''
+        import scipy.sparse
+        hub = chm.Hub('PDE-Diffusion', preset='Basic', verb=False)
+        hub.set_fields(Tsim=5, verb=False)
+        nabla = hub.get_dfields(returnas='view')['nabla']['value'][0, :, :, 0]
+        hub2 = hub.copy()
+        hub2.set_fields(nabla=scipy.sparse.csr_matrix(nabla), verb=False)
+        assert scipy.sparse.issparse(hub2.get_dfields(returnas='view')['nabla']['value'])
+        hub.run(verb=False)
+        hub2.run(verb=False)
+        for k in ['C', 'gradC', 'lapC']:
+            assert np.allclose(hub.get_dfields(returnas='view')[k]['value'],
+                               hub2.get_dfields(returnas='view')[k]['value'], rtol=1e-12, atol=1e-15)
+
+        address = os.path.join(str(tmp_path), 'sparse.npz')
+        hub2.save(address, relativeaddress=False)
+        hub3 = chm.load_saved(address, localsave=False, verb=False)
+        assert scipy.sparse.issparse(hub3.get_dfields(returnas='view')['nabla']['value'])
+        assert np.array_equal(hub3.get_dfields(returnas='view')['C']['value'], hub2.get_dfields(returnas='view')['C']['value'])
+
+    def test_grid_operators(self):
+        '''Matrix-free grid operators give the same values as their matrices applied with Rmatmul'''
+        from chimes.libraries import Operators as O
+        N = 12
+        C = np.random.rand(3, N, 1, 1)
+        for boundary in ['periodic', 'neumann']:
+            grid = O.Grid(N, dx=0.5, boundary=boundary)
+            nxt, prv = (np.arange(N) + 1) % N, (np.arange(N) - 1) % N
+            if boundary == 'neumann':
+                nxt, prv = np.minimum(np.arange(N) + 1, N - 1), np.maximum(np.arange(N) - 1, 0)
+            # M[j, i] is the weight of the region j in the value of the region i
+            lap, grad = np.zeros((N, N)), np.zeros((N, N))
+            for i in range(N):
+                lap[nxt[i], i] += 4
+                lap[prv[i], i] += 4
+                lap[i, i] -= 8
+                grad[nxt[i], i] += 1
+                grad[prv[i], i] -= 1
+            assert np.allclose(O.Grid.laplacian(C, grid), O.Rmatmul(C, lap[np.newaxis, :, :, np.newaxis]))
+            assert np.allclose(O.Grid.gradient(C, grid), O.Rmatmul(C, grad[np.newaxis, :, :, np.newaxis]))
+
+        # 2D: the laplacian is the sum of the second derivatives along each axis
+        grid = O.Grid((3, 4), dx=(1., 2.))
+        C = np.random.rand(1, 12, 1, 1)
+        X = C[0, :, 0, 0].reshape(3, 4)
+        ref = (np.roll(X, 1, 0) + np.roll(X, -1, 0) - 2 * X) + (np.roll(X, 1, 1) + np.roll(X, -1, 1) - 2 * X) / 4
+        assert np.allclose(O.Grid.laplacian(C, grid)[0, :, 0, 0], ref.reshape(-1))
+        # Upwind advection at constant speed is the backward difference
+        assert np.allclose(O.Grid.advection(C, 2., grid, 0)[0, :, 0, 0], (2 * (X - np.roll(X, 1, 0))).reshape(-1))
+
+    def test_network_operators(self, tmp_path):
+        '''Edge-list spring forces are the ones of the dense stiffness matrix, and the network is kept in saves'''
+        from chimes.libraries import Operators as O
+        N = 8
+        K = np.triu(np.random.rand(N, N) * (np.random.rand(N, N) > 0.5), 1)
+        net = O.Network.from_matrix(K)
+        k = K[net.node1, net.node2][:, np.newaxis]
+        x, y = np.random.rand(2, N, 1), np.random.rand(2, N, 1)
+        dx, dy = O.Network.difference(x, net), O.Network.difference(y, net)
+        F = O.Network.divergence(-k * np.sqrt(dx**2 + dy**2) * np.cos(np.arctan2(dy, dx)), net)
+        Kmat = K + K.T
+        Dx, Dy = x - O.transpose(x), y - O.transpose(y)
+        assert np.allclose(F, O.ssum2(-Kmat * np.sqrt(Dx**2 + Dy**2) * np.cos(np.arctan2(Dy, Dx))))
+
+        hub = chm.Hub('Spring_Network', preset='Mesh', verb=False)
+        hub.set_fields(Tsim=1, verb=False)
+        R = hub.get_dfields(returnas='view')
+        assert R['Nnodes']['value'] == 100 and R['Nedges']['value'] == 180
+        hub.run(verb=False)
+        address = os.path.join(str(tmp_path), 'network.npz')
+        hub.save(address, relativeaddress=False)
+        hub2 = chm.load_saved(address, localsave=False, verb=False)
+        net2 = hub2.get_dfields(returnas='view')['network']['value']
+        assert np.array_equal(net2.node1, R['network']['value'].node1)
+        assert np.array_equal(hub2.get_dfields(returnas='view')['x']['value'], hub.get_dfields(returnas='view')['x']['value'])
@@ -34,7 +34,7 @@ class TestPlot:
         mock = Mock()
         monkeypatch.setattr(Filter, 'fn', mock)
 
-        hub = SimpleNamespace(get_dfields=lambda: self.dfields)
+        hub = SimpleNamespace(get_dfields=lambda returnas=dict: self.dfields)
         return hub
 
     @pytest.fixture
@@ -20,9 +20,9 @@ mock_time_unwound = [0, 1]
 
 def generate_mock_hub():
     return {
-        'a': SimpleNamespace(get_dfields=lambda: mock_a_value),
-        'delta': SimpleNamespace(get_dfields=lambda: mock_delta_value),
-        'x': SimpleNamespace(get_dfields=lambda: mock_x_value)
+        'a': SimpleNamespace(get_dfields=lambda returnas=dict: mock_a_value),
+        'delta': SimpleNamespace(get_dfields=lambda returnas=dict: mock_delta_value),
+        'x': SimpleNamespace(get_dfields=lambda returnas=dict: mock_x_value)
     }
 
 
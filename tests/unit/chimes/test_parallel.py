@@ -0,0 +1,67 @@
+import numpy as np
+
+import chimes as chm
+
+
+class TestParallel():
+    '''Hubs run on a pool of processes with `chm.run_many`'''
+
+    def test_run_many(self):
+        '''Hubs run in worker processes give the same results as in the main process'''
+        hub = chm.Hub('GK', verb=False)
+        hub.set_fields('alpha', 0.025, verb=False)
+        specs = [hub, {'model': 'GK', 'preset': 'default', 'fields': {'n': 0.03}}]
+        out = chm.run_many(specs, workers=2, NtimeOutput=50)
+        ref = chm.run_many(specs, workers=1, NtimeOutput=50)
+        for h, h2 in zip(out, ref):
+            assert h.dflags['run'] == h2.dflags['run']
+            assert np.allclose(h.get_dfields(returnas='view')['omega']['value'],
+                               h2.get_dfields(returnas='view')['omega']['value'])
+        assert out[0].get_dfields(returnas='view')['alpha']['value'][0, 0, 0, 0] == 0.025
+
+    def test_run_many_record_stats(self):
+        '''The records and the statistics of the runs in worker processes are sent back with their time series'''
+        spec = {'model': 'Goodwin_example', 'fields': {'Tsim': 10, 'nx': 5, 'k0': np.linspace(-0.007, -0.006, 5)}}
+        for kwargs in [{'record': ['omega'], 'record_every': 10}, {'stats': True}]:
+            out = chm.run_many([spec, spec], workers=2, **kwargs)
+            ref = chm.run_many([spec], workers=1, **kwargs)[0]
+            R, Rref = out[0].get_dfields(returnas='view'), ref.get_dfields(returnas='view')
+            assert np.array_equal(out[0].dmisc['record']['steps'], ref.dmisc['record']['steps'])
+            assert np.array_equal(R['omega']['value'], Rref['omega']['value'], equal_nan=True)
+            assert R['employment']['value'].shape == Rref['employment']['value'].shape
+        assert out[0].dflags['sensitivity']
+        assert np.array_equal(out[0].dmisc['ensemble'].get('omega')['mean'], ref.dmisc['ensemble'].get('omega')['mean'])
+        assert np.allclose(R['omega']['sensitivity'][0]['']['mean'], Rref['omega']['sensitivity'][0]['']['mean'])
+
+    def test_run_many_run_options(self):
+        '''Stopped members, profiles and solver statistics of the runs in worker processes are sent back'''
+        spec = {'model': 'GK', 'fields': {'Tsim': 100, 'nx': 3, 'alpha': np.linspace(0.015, 0.03, 3)}}
+        for kwargs, key in [({'terminate': {'bounds': {'omega': [None, 0.8]}}}, 'terminated'),
+                            ({'converge': {'rtol': 1e-5, 'window': 2, 'fields': ['omega']}}, 'converged'),
+                            ({'profile': True}, 'profile'),
+                            ({'solver': 'dopri5'}, 'solver_stats')]:
+            out = chm.run_many([spec, spec], workers=2, **kwargs)
+            ref = chm.run_many([spec], workers=1, **kwargs)[0]
+            assert out[0].dmisc[key] is not None, key
+            assert out[0].dflags['run'][0] == ref.dflags['run'][0], key
+            assert np.array_equal(out[0].get_dfields(returnas='view')['omega']['value'],
+                                  ref.get_dfields(returnas='view')['omega']['value'], equal_nan=True), key
+            if key in ['terminated', 'converged']:
+                assert np.array_equal(out[0].dmisc[key], ref.dmisc[key], equal_nan=True)
+        assert set(out[0].dmisc['solver_stats']) == set(ref.dmisc['solver_stats'])
+
+    def test_run_many_templates(self):
+        '''Hubs of the same model and preset are copies of one template, with their own fields and model module'''
+        specs = [{'model': 'GK', 'fields': {'Tsim': 20, 'alpha': alpha}} for alpha in [0.02, 0.03]]
+        out = chm.run_many(specs, workers=1)
+        for spec, hub in zip(specs, out):
+            ref = chm.Hub('GK', verb=False)
+            ref.set_fields(**spec['fields'], verb=False)
+            ref.run(verb=False)
+            assert np.array_equal(hub.get_dfields(returnas='view')['omega']['value'],
+                                  ref.get_dfields(returnas='view')['omega']['value'])
+
+        out = chm.run_many([{'model': '_EXTERNALCOUPLING', 'fields': {'nx': nx}} for nx in [1, 3]], workers=1)
+        external = [hub._dfields['Flow']['func'].__globals__['_EXTERNAL'] for hub in out]
+        assert external[0] is not external[1]
+        assert external[0]._zero.shape[0] == 1 and external[1]._zero.shape[0] == 3